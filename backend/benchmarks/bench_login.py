@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8
+# bench_login
+# ***********
+#
+# Receipt logins mixed with submissions executed with the receipts hashed
+# inside the transactions, holding the transact_lock, and with the receipts
+# hashed on the KDF pool before the transactions.
+#
+# The benchmark reports the average latency of the logins, of the submissions
+# and of writes not involving any hash, that in the first case wait behind
+# every pending hash.
+from __future__ import print_function
+
+import argparse
+import copy
+import time
+
+from common import measure, report, run, setup_environment, start_thread_pools
+
+from twisted.internet import defer
+
+from globaleaks import security
+from globaleaks.handlers import authentication, submission
+from globaleaks.orm import transact
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+
+
+@transact
+def login_whistleblower_in_transaction(store, receipt, client_using_tor):
+    hashed_receipt = security.hash_password(receipt, GLSettings.memory_copy.private.receipt_salt)
+
+    return authentication.login_wbtip.method(store, hashed_receipt, client_using_tor)
+
+
+@transact
+def create_submission_in_transaction(store, request, uploaded_files, client_using_tor, language):
+    receipt = unicode(security.generateRandomReceipt())
+    receipt_hash = unicode(security.hash_password(receipt, GLSettings.memory_copy.private.receipt_salt))
+
+    return submission.db_create_submission(store, request, uploaded_files, client_using_tor, language,
+                                           receipt, receipt_hash)
+
+
+def timed(latencies, d):
+    start = time.time()
+
+    def cb(result):
+        latencies.append(time.time() - start)
+        return result
+
+    return d.addCallback(cb)
+
+
+def mixed_workload(login, submit, receipt, request, operations, submit_every, write_every, latencies):
+    dl = []
+    for i in range(operations):
+        if i % submit_every == 0:
+            d = submit(copy.deepcopy(request), [], True, 'en')
+            dl.append(timed(latencies['submission'], d))
+        elif i % write_every == 0:
+            d = helpers.update_node_setting(u'allow_unencrypted', bool(i % 2))
+            dl.append(timed(latencies['write'], d))
+        else:
+            d = login(receipt, True)
+            dl.append(timed(latencies['login'], d))
+
+    return defer.DeferredList(dl, fireOnOneErrback=True)
+
+
+@defer.inlineCallbacks
+def main():
+    op = argparse.ArgumentParser()
+    op.add_argument('-n', '--operations', type=int, default=100)
+    op.add_argument('-s', '--submit-every', type=int, default=5,
+                    help='perform a submission every N operations')
+    op.add_argument('-w', '--write-every', type=int, default=3,
+                    help='perform a write without hashes every N operations')
+    args = op.parse_args()
+
+    env = yield setup_environment()
+
+    request = {
+        'context_id': env.dummyContext['id'],
+        'receivers': env.dummyContext['receivers'],
+        'identity_provided': False,
+        'answers': (yield env.fill_random_answers(env.dummyContext['id'])),
+        'total_score': 0
+    }
+
+    receipt = (yield submission.create_submission(copy.deepcopy(request), [], True, 'en'))['receipt']
+
+    start_thread_pools()
+
+    for label, login, submit in [('hash inside the transactions', login_whistleblower_in_transaction,
+                                  create_submission_in_transaction),
+                                 ('hash on the KDF pool', authentication.login_whistleblower,
+                                  submission.create_submission)]:
+        latencies = {'login': [], 'submission': [], 'write': []}
+        elapsed = yield measure(mixed_workload, login, submit, receipt, request,
+                                args.operations, args.submit_every, args.write_every, latencies)
+        report(label, args.operations, elapsed)
+
+        for key in ['login', 'submission', 'write']:
+            print("%-48s %.3f s" % ('  average %s latency' % key, sum(latencies[key]) / len(latencies[key])))
+
+
+if __name__ == '__main__':
+    run(main)
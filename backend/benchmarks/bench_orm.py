@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8
+# bench_orm
+# *********
+#
+# Mixed read/write workload executed with the reads performed as regular
+# transactions, serialized with the writes by the transact_lock, and with the
+# reads performed as read-only transactions on their dedicated thread pool.
+#
+# Beside the overall throughput the benchmark reports the average latency of
+# the writes, that represents the time a submission waits behind the readers.
+from __future__ import print_function
+
+import argparse
+import time
+
+from common import measure, report, run, setup_environment, start_thread_pools
+
+from twisted.internet import defer
+
+from globaleaks.handlers import public
+from globaleaks.orm import transact, transact_ro
+from globaleaks.tests import helpers
+
+
+def timed(latencies, d):
+    start = time.time()
+
+    def cb(result):
+        latencies.append(time.time() - start)
+        return result
+
+    return d.addCallback(cb)
+
+
+def mixed_workload(read, operations, write_every, write_latencies):
+    dl = []
+    for i in range(operations):
+        if i % write_every == 0:
+            d = helpers.update_node_setting(u'allow_unencrypted', bool(i % 2))
+            dl.append(timed(write_latencies, d))
+        else:
+            dl.append(read(u'en'))
+
+    return defer.DeferredList(dl, fireOnOneErrback=True)
+
+
+@defer.inlineCallbacks
+def main():
+    op = argparse.ArgumentParser()
+    op.add_argument('-n', '--operations', type=int, default=200)
+    op.add_argument('-w', '--write-every', type=int, default=10,
+                    help='perform a write every N operations')
+    args = op.parse_args()
+
+    yield setup_environment()
+    start_thread_pools()
+
+    read = public.get_public_resources.method
+
+    for label, decorator in [('reads as transact', transact),
+                             ('reads as transact_ro', transact_ro)]:
+        write_latencies = []
+        elapsed = yield measure(mixed_workload, decorator(read), args.operations,
+                                args.write_every, write_latencies)
+        report(label, args.operations, elapsed)
+        print("%-48s %.3f s" % ('  average write latency', sum(write_latencies) / len(write_latencies)))
+
+
+if __name__ == '__main__':
+    run(main)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8
+# bench_pgp
+# *********
+#
+# Throughput of the PGP encryption of the notification mails for a node
+# with many PGP enabled receivers, creating a new GnuPG environment for
+# every mail compared to the reuse of the environments of GLPGPKeyring.
+from __future__ import print_function
+
+import argparse
+
+from common import report, setup_settings, timeit
+
+
+def generate_keys(n):
+    """
+    Generate n PGP keys returning the list of (armored key, fingerprint)
+    """
+    from globaleaks.security import GLBPGP
+
+    gpob = GLBPGP()
+
+    try:
+        keys = []
+        for i in range(n):
+            key_input = gpob.gnupg.gen_key_input(key_type='RSA', key_length=1024,
+                                                 name_email='receiver%d@example.net' % i,
+                                                 no_protection=True)
+            fingerprint = gpob.gnupg.gen_key(key_input).fingerprint
+            keys.append((gpob.gnupg.export_keys(fingerprint), fingerprint))
+
+        return keys
+    finally:
+        gpob.destroy_environment()
+
+
+def encrypt_with_new_environment(keys, mails, body):
+    from globaleaks.security import GLBPGP
+
+    for i in range(mails):
+        key, fingerprint = keys[i % len(keys)]
+
+        gpob = GLBPGP()
+        try:
+            gpob.load_key(key)
+            gpob.encrypt_message(fingerprint, body)
+        finally:
+            gpob.destroy_environment()
+
+
+def encrypt_with_keyring(keys, mails, body):
+    from globaleaks.security import GLPGPKeyring
+
+    for i in range(mails):
+        key, fingerprint = keys[i % len(keys)]
+
+        with GLPGPKeyring.use(key) as gpob:
+            gpob.encrypt_message(fingerprint, body)
+
+
+def main():
+    op = argparse.ArgumentParser()
+    op.add_argument('-r', '--receivers', type=int, default=50)
+    op.add_argument('-m', '--mails', type=int, default=200)
+    args = op.parse_args()
+
+    setup_settings()
+
+    keys = generate_keys(args.receivers)
+
+    body = 'Notification of a new submission\n' * 50
+
+    elapsed = timeit(encrypt_with_new_environment, 1, keys, args.mails, body)
+    report('new GnuPG environment per mail', args.mails, elapsed)
+
+    elapsed = timeit(encrypt_with_keyring, 1, keys, args.mails, body)
+    report('GLPGPKeyring (cold)', args.mails, elapsed)
+
+    elapsed = timeit(encrypt_with_keyring, 1, keys, args.mails, body)
+    report('GLPGPKeyring (warm)', args.mails, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8
+# bench_router
+# ************
+#
+# Lookup speed of the segment tree router compared to the linear scan of the
+# regular expressions of the api_spec.
+from __future__ import print_function
+
+import argparse
+
+from common import report, setup_settings, timeit
+
+
+UUID = '12345678-1234-1234-1234-123456789012'
+TOKEN = 'a' * 42
+
+PATHS = [
+    ('static assets', ['/', '/index.html', '/js/scripts.min.js', '/css/styles.min.css',
+                       '/fonts/glyphicons-halflings-regular.woff2', '/img/logo.png']),
+    ('api endpoints', ['/public', '/token/' + TOKEN, '/submission/' + TOKEN + '/file',
+                       '/rtip/' + UUID, '/rtip/' + UUID + '/comments', '/receiver/tips',
+                       '/admin/contexts/' + UUID, '/l10n/en'])
+]
+
+
+def linear_scan(registry, paths):
+    for path in paths:
+        for regexp, handler, args in registry:
+            if regexp.match(path):
+                break
+
+
+def router_lookup(router, paths):
+    for path in paths:
+        router.match(path)
+
+
+def main():
+    op = argparse.ArgumentParser()
+    op.add_argument('-n', '--iterations', type=int, default=10000)
+    args = op.parse_args()
+
+    setup_settings()
+
+    from globaleaks.rest.api import APIResourceWrapper
+
+    api = APIResourceWrapper()
+
+    for label, paths in PATHS:
+        operations = args.iterations * len(paths)
+
+        elapsed = timeit(linear_scan, args.iterations, api._registry, paths)
+        report('%s: linear scan' % label, operations, elapsed)
+
+        elapsed = timeit(router_lookup, args.iterations, api._router, paths)
+        report('%s: router' % label, operations, elapsed)
+
+
+if __name__ == '__main__':
+    main()
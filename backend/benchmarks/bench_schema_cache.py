@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8
+# bench_schema_cache
+# ******************
+#
+# Throughput of the serialization of the tips (serialize_rtip) and of the
+# receiver tips list (get_receivertip_list) with the localized questionnaire
+# schemas loaded and localized at every serialization compared to the
+# schemas served by the GLSchemaCache.
+from __future__ import print_function
+
+import argparse
+
+from common import measure, report, run, setup_environment
+
+from twisted.internet import defer
+
+from globaleaks import models
+from globaleaks.handlers import receiver
+from globaleaks.handlers.rtip import serialize_rtip
+from globaleaks.handlers.submission import GLSchemaCache
+from globaleaks.orm import transact_ro
+
+
+@transact_ro
+def serialize_rtips(store, iterations):
+    rtips = list(store.find(models.ReceiverTip))
+    for i in range(iterations):
+        serialize_rtip(store, rtips[i % len(rtips)], u'en')
+
+
+@transact_ro
+def get_receiver_ids(store):
+    return [r.id for r in store.find(models.Receiver)]
+
+
+@defer.inlineCallbacks
+def get_receivertip_lists(receiver_ids, iterations):
+    for i in range(iterations):
+        yield receiver.get_receivertip_list(receiver_ids[i % len(receiver_ids)], u'en')
+
+
+@defer.inlineCallbacks
+def main():
+    op = argparse.ArgumentParser()
+    op.add_argument('-s', '--submissions', type=int, default=20)
+    op.add_argument('-n', '--iterations', type=int, default=200)
+    args = op.parse_args()
+
+    env = yield setup_environment(args.submissions)
+    yield env.perform_full_submission_actions()
+
+    receiver_ids = yield get_receiver_ids()
+
+    for label, size in [('no cache', 0), ('GLSchemaCache', GLSchemaCache.size)]:
+        GLSchemaCache.clear()
+        GLSchemaCache.size = size
+
+        elapsed = yield measure(serialize_rtips, args.iterations)
+        report('serialize_rtip %s' % label, args.iterations, elapsed)
+
+        elapsed = yield measure(get_receivertip_lists, receiver_ids, args.iterations)
+        report('get_receivertip_list %s' % label, args.iterations, elapsed)
+
+    stats = GLSchemaCache.get_stats()
+    print("%-48s %8d entries %8d bytes %.2f hit ratio" % ('GLSchemaCache', stats['entries'], stats['memory'], stats['hit_ratio']))
+
+
+if __name__ == '__main__':
+    run(main)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8
+# bench_secure_delete
+# *******************
+#
+# Throughput in MB/s of the secure deletion of large and small files,
+# deleting the files one at a time compared to the concurrent deletion,
+# for different policies of overwrite passes.
+from __future__ import print_function
+
+import argparse
+import os
+
+from common import setup_settings, timeit
+
+
+def create_files(path, files, size):
+    chunk = os.urandom(min(size, 1024 * 1024))
+
+    paths = []
+    for i in range(files):
+        paths.append(os.path.join(path, 'file-%d' % i))
+        with open(paths[-1], 'wb') as f:
+            for _ in range(size // len(chunk)):
+                f.write(chunk)
+
+            f.write(chunk[:size % len(chunk)])
+
+    return paths
+
+
+def delete_sequentially(paths):
+    from globaleaks.security import overwrite_and_remove
+
+    for path in paths:
+        overwrite_and_remove(path)
+
+
+def delete_concurrently(paths):
+    from globaleaks.security import overwrite_and_remove_files
+
+    overwrite_and_remove_files(paths)
+
+
+def report_throughput(label, files, size, elapsed):
+    mb = files * size / (1024.0 * 1024.0)
+    print("%-48s %8d files %9.3f s %10.1f MB/s" % (label, files, elapsed, mb / elapsed))
+
+
+def main():
+    op = argparse.ArgumentParser()
+    op.add_argument('-l', '--large-files', type=int, default=4)
+    op.add_argument('-L', '--large-file-size', type=int, default=64, help='MB')
+    op.add_argument('-s', '--small-files', type=int, default=1000)
+    op.add_argument('-S', '--small-file-size', type=int, default=16, help='KB')
+    op.add_argument('-c', '--concurrency', type=int, default=4)
+    args = op.parse_args()
+
+    setup_settings()
+
+    from globaleaks.settings import GLSettings
+
+    GLSettings.secure_delete_concurrency = args.concurrency
+
+    path = GLSettings.tmp_upload_path
+
+    workloads = [
+        ('large', args.large_files, args.large_file_size * 1024 * 1024),
+        ('small', args.small_files, args.small_file_size * 1024)
+    ]
+
+    for passes in [['random'], ['zeros', 'ones', 'random']]:
+        GLSettings.secure_delete_passes = passes
+
+        for kind, files, size in workloads:
+            for mode, f in [('sequential', delete_sequentially), ('concurrent', delete_concurrently)]:
+                paths = create_files(path, files, size)
+                elapsed = timeit(f, 1, paths)
+                report_throughput('%s files %s %d passes' % (kind, mode, len(passes)), files, size, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8
+# bench_tempdict
+# **************
+#
+# Speed of the insertions and of the accesses of the TempDict based on the
+# timing wheel compared to the previous implementation scheduling a
+# DelayedCall for every item, with the number of DelayedCall(s) left in
+# the reactor.
+from __future__ import print_function
+
+import argparse
+from collections import OrderedDict
+
+from common import report, run, setup_settings, timeit
+
+from twisted.internet import reactor
+
+
+class CallLaterTempDict(OrderedDict):
+    """
+    The previous implementation of the TempDict
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        OrderedDict.__init__(self)
+
+    def set(self, key, item):
+        item.expireCall = reactor.callLater(self.timeout, self._expire, key)
+        self[key] = item
+
+    def get(self, key):
+        if key in self:
+            self[key].expireCall.reset(self.timeout)
+            return self[key]
+
+    def _expire(self, key):
+        self.pop(key, None)
+
+
+class Item(object):
+    expireCall = None
+
+
+def fill(d, entries):
+    for key in xrange(entries):
+        d.set(key, Item())
+
+
+def touch(d, entries):
+    for key in xrange(entries):
+        d.get(key)
+
+
+def main():
+    op = argparse.ArgumentParser()
+    op.add_argument('-e', '--entries', type=int, nargs='+', default=[10000, 50000, 100000])
+    op.add_argument('-t', '--timeout', type=int, default=3600)
+    args = op.parse_args()
+
+    setup_settings()
+
+    from globaleaks.utils.tempdict import TempDict
+
+    for entries in args.entries:
+        for label, d in [('callLater', CallLaterTempDict(args.timeout)),
+                         ('timing wheel', TempDict(args.timeout))]:
+            elapsed = timeit(fill, 1, d, entries)
+            report('set %d entries: %s' % (entries, label), entries, elapsed)
+
+            elapsed = timeit(touch, 1, d, entries)
+            report('get %d entries: %s' % (entries, label), entries, elapsed)
+
+            print("%-48s %8d delayed calls" % ('', len(reactor.getDelayedCalls())))
+
+            for call in reactor.getDelayedCalls():
+                call.cancel()
+
+            d.clear()
+
+
+if __name__ == '__main__':
+    run(main)
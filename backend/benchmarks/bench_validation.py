@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8
+# bench_validation
+# ****************
+#
+# Validation speed of the compiled validators compared to the interpretation
+# of the message templates on every request, measured on the real request
+# descriptors of globaleaks.rest.requests.
+from __future__ import print_function
+
+import argparse
+import collections
+import copy
+import json
+import re
+import uuid
+
+from common import report, setup_settings, timeit
+
+
+def legacy_validate_type(value, type):
+    from globaleaks.rest import requests
+
+    if value is None:
+        return False
+
+    if callable(type):
+        if type == requests.SkipSpecificValidation:
+            return True
+
+        if type == int:
+            try:
+                int(value)
+                return True
+            except Exception:
+                return False
+
+        if type == bool and (value == u'true' or value == u'false'):
+            return True
+
+        return isinstance(value, type)
+    elif isinstance(type, collections.Mapping):
+        return legacy_validate_jmessage(value, type)
+    elif isinstance(type, str):
+        return bool(re.match(type, unicode(value)))
+    elif isinstance(type, collections.Iterable):
+        return len(value) == 0 or all(legacy_validate_type(x, type[0]) for x in value)
+
+
+def legacy_validate_jmessage(jmessage, message_template):
+    from globaleaks.rest import errors
+
+    if isinstance(message_template, dict):
+        for key in [key for key in jmessage.keys() if key not in message_template]:
+            del jmessage[key]
+
+        for key, value in jmessage.iteritems():
+            if not legacy_validate_type(value, message_template[key]):
+                raise errors.InvalidInputFormat(key)
+
+        for key, value in message_template.iteritems():
+            if key not in jmessage.keys() or not legacy_validate_type(jmessage[key], value):
+                raise errors.InvalidInputFormat(key)
+
+            if isinstance(value, (dict, list)) and value:
+                legacy_validate_jmessage(jmessage[key], value)
+
+        return True
+
+    if not all(legacy_validate_type(x, message_template[0]) for x in jmessage):
+        raise errors.InvalidInputFormat(message_template[0])
+
+    return True
+
+
+def get_messages():
+    from globaleaks.rest import requests
+    from globaleaks.tests import helpers
+
+    dummy = helpers.MockDict()
+
+    submission = {
+        'context_id': unicode(uuid.uuid4()),
+        'receivers': [unicode(uuid.uuid4()) for _ in range(10)],
+        'identity_provided': False,
+        'answers': {unicode(uuid.uuid4()): [{'value': u'answer'}] for _ in range(50)},
+        'total_score': 0
+    }
+
+    field = helpers.get_dummy_field()
+    for _ in range(5):
+        child = helpers.get_dummy_field()
+        child['children'] = [helpers.get_dummy_field() for _ in range(5)]
+        field['children'].append(child)
+
+    context = dict(dummy.dummyContext, questionnaire_id=unicode(uuid.uuid4()))
+
+    # the messages are serialized and parsed as the ones received by the handlers
+    return [(label, template, json.loads(json.dumps(message))) for label, template, message in [
+        ('SubmissionDesc', requests.SubmissionDesc, submission),
+        ('AdminNodeDesc', requests.AdminNodeDesc, dummy.dummyNode),
+        ('AdminContextDesc', requests.AdminContextDesc, context),
+        ('AdminFieldDesc (nested)', requests.AdminFieldDesc, field)
+    ]]
+
+
+def validate(f, template, messages):
+    for message in messages:
+        f(message, template)
+
+
+def main():
+    op = argparse.ArgumentParser()
+    op.add_argument('-n', '--iterations', type=int, default=200)
+    args = op.parse_args()
+
+    setup_settings()
+
+    from globaleaks.rest import validator
+
+    for label, template, message in get_messages():
+        # the validation strips the keys not present in the template
+        validator.validate_jmessage(message, template)
+
+        messages = [copy.deepcopy(message) for _ in range(args.iterations)]
+
+        elapsed = timeit(validate, 1, legacy_validate_jmessage, template, messages)
+        report('%s: interpreted' % label, args.iterations, elapsed)
+
+        elapsed = timeit(validate, 1, validator.validate_jmessage, template, messages)
+        report('%s: compiled' % label, args.iterations, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: UTF-8
+# common: utilities shared by the benchmarks
+# ******
+#
+# The benchmarks reuse the fixtures of the unit tests in order to initialize
+# a temporary working directory and a database populated with dummy data.
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from twisted.internet import defer, reactor, task
+from twisted.python.threadpool import ThreadPool
+
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+
+
+class Environment(helpers.TestGLWithPopulatedDB):
+    def runTest(self):
+        pass
+
+
+def setup_settings():
+    """
+    Initialize the settings on a temporary working directory
+    """
+    os.chdir(tempfile.mkdtemp(prefix='glbench-'))
+
+    helpers.init_glsettings_for_unit_tests()
+
+
+def setup_environment(population_of_submissions=2):
+    """
+    Initialize a working directory and a populated database.
+
+    The transactions of the initialization are executed synchronously by
+    means of the FakeThreadPool configured by the test helpers.
+    """
+    os.chdir(tempfile.mkdtemp(prefix='glbench-'))
+
+    env = Environment()
+    env.population_of_submissions = population_of_submissions
+
+    return env.setUp().addCallback(lambda _: env)
+
+
+def start_thread_pools():
+    """
+    Replace the FakeThreadPool(s) used during the initialization with
+    the real thread pools used by the application.
+    """
+    GLSettings.orm_tp = ThreadPool(1, 1)
+    GLSettings.orm_ro_tp = ThreadPool(1, GLSettings.orm_ro_tp_size)
+    GLSettings.kdf_tp = ThreadPool(1, GLSettings.kdf_tp_size)
+
+    for tp in [GLSettings.orm_tp, GLSettings.orm_ro_tp, GLSettings.kdf_tp]:
+        tp.start()
+        reactor.addSystemEventTrigger('after', 'shutdown', tp.stop)
+
+
+@defer.inlineCallbacks
+def measure(f, *args, **kwargs):
+    """
+    Return the number of seconds needed to fire the Deferred returned by f
+    """
+    start = time.time()
+    yield f(*args, **kwargs)
+    defer.returnValue(time.time() - start)
+
+
+def timeit(f, iterations, *args, **kwargs):
+    """
+    Return the number of seconds needed to execute f for the given iterations
+    """
+    start = time.time()
+    for _ in xrange(iterations):
+        f(*args, **kwargs)
+
+    return time.time() - start
+
+
+def report(label, operations, elapsed):
+    print("%-48s %8d ops %9.3f s %10.1f ops/s" % (label, operations, elapsed, operations / elapsed))
+
+
+def run(main):
+    task.react(lambda _: defer.maybeDeferred(main))
@@ -149,18 +149,13 @@ class AlarmClass(object):
         """
         self.number_of_anomalies = 0
 
-        current_event_matrix = {}
+        current_event_matrix = EventTrackQueue.get_counters()
 
-        requests_timing = []
-
-        for _, event_obj in EventTrackQueue.iteritems():
-            current_event_matrix.setdefault(event_obj.event_type, 0)
-            current_event_matrix[event_obj.event_type] += 1
-            requests_timing.append(event_obj.request_time)
+        requests_timing = sum(EventTrackQueue.get_latencies().values(), [])
 
         if len(requests_timing) > 2:
             log.info("In latest %d seconds: worst RTT %f, best %f" %
-                     (10,
+                     (EventTrackQueue.window,
                       round(max(requests_timing), 2),
                       round(min(requests_timing), 2)))
 
@@ -326,7 +321,7 @@ class AlarmClass(object):
                      (old_accept_submissions, accept_submissions))
 
             # Must invalidate the cache here becuase accept_subs served in /public has changed
-            GLApiCache.invalidate()
+            GLApiCache.invalidate('node')
 
 # Alarm is a singleton class exported once
 Alarm = AlarmClass()
@@ -14,9 +14,12 @@ from twisted.web.server import Site
 
 from globaleaks.db import init_db, update_db, \
     sync_refresh_memory_variables, sync_clean_untracked_files
+from globaleaks.handlers.base import GLSessions
+from globaleaks.orm import close_store_pools
 from globaleaks.rest.api import APIResourceWrapper
 from globaleaks.settings import GLSettings
 from globaleaks.utils.onion_services import configure_tor_hs
+from globaleaks.utils.sessionstore import SQLiteSessionStore
 from globaleaks.utils.utility import log, GLLogObserver
 from globaleaks.utils.sock import listen_tcp_on_sock, reserve_port_for_ip
 from globaleaks.workers.supervisor import ProcessSupervisor
@@ -106,9 +109,18 @@ class GLService(service.Service):
         sync_clean_untracked_files()
         sync_refresh_memory_variables()
 
+        if GLSettings.sessions_store == 'sqlite':
+            GLSessions.set_store(SQLiteSessionStore(os.path.join(GLSettings.ramdisk_path, 'sessions.db')))
+
         GLSettings.orm_tp.start()
+        GLSettings.orm_ro_tp.start()
+        GLSettings.kdf_tp.start()
 
         reactor.addSystemEventTrigger('after', 'shutdown', GLSettings.orm_tp.stop)
+        reactor.addSystemEventTrigger('after', 'shutdown', GLSettings.orm_ro_tp.stop)
+        reactor.addSystemEventTrigger('after', 'shutdown', GLSettings.kdf_tp.stop)
+        reactor.addSystemEventTrigger('after', 'shutdown', close_store_pools)
+        reactor.addSystemEventTrigger('after', 'shutdown', GLSessions.store.close)
 
         arw = APIResourceWrapper()
 
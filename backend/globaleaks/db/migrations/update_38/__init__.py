@@ -0,0 +1,30 @@
+# -*- coding: UTF-8
+from storm.locals import Int, DateTime, Unicode
+
+from globaleaks.db.migrations.update import MigrationBase
+from globaleaks.models import ModelWithID
+from globaleaks.utils.utility import datetime_now
+
+
+class Mail_v_37(ModelWithID):
+    __storm_table__ = 'mail'
+    creation_date = DateTime(default_factory=datetime_now)
+    address = Unicode()
+    subject = Unicode()
+    body = Unicode()
+    processing_attempts = Int(default=0)
+
+
+class MigrationScript(MigrationBase):
+    def migrate_Mail(self):
+        old_objs = self.store_old.find(self.model_from['Mail'])
+        for old_obj in old_objs:
+            new_obj = self.model_to['Mail']()
+            for _, v in new_obj._storm_columns.iteritems():
+                if v.name == 'next_attempt_date':
+                    new_obj.next_attempt_date = datetime_now()
+                    continue
+
+                setattr(new_obj, v.name, getattr(old_obj, v.name))
+
+            self.store_new.add(new_obj)
@@ -0,0 +1,59 @@
+# -*- coding: UTF-8
+from datetime import timedelta
+
+from storm.locals import Int, DateTime, JSON
+
+from globaleaks.db.migrations.update import MigrationBase
+from globaleaks.models import ModelWithID
+
+
+class Stats_v_38(ModelWithID):
+    __storm_table__ = 'stats'
+    start = DateTime()
+    summary = JSON()
+    free_disk_space = Int()
+
+
+class MigrationScript(MigrationBase):
+    def migrate_Stats(self):
+        """
+        The existing statistics are hourly; the daily and the weekly ones
+        are computed summing them up.
+        """
+        rollups = {}
+
+        old_objs = self.store_old.find(self.model_from['Stats']).order_by(self.model_from['Stats'].start)
+        for old_obj in old_objs:
+            new_obj = self.model_to['Stats']()
+            for _, v in new_obj._storm_columns.iteritems():
+                if v.name == 'granularity':
+                    new_obj.granularity = u'hour'
+                    continue
+
+                if v.name == 'latency':
+                    new_obj.latency = {}
+                    continue
+
+                setattr(new_obj, v.name, getattr(old_obj, v.name))
+
+            self.store_new.add(new_obj)
+
+            day = old_obj.start.replace(hour=0, minute=0, second=0, microsecond=0)
+            week = day - timedelta(days=day.weekday())
+
+            for key in [(u'day', day), (u'week', week)]:
+                rollup = rollups.setdefault(key, {'summary': {}, 'free_disk_space': 0})
+                for event, count in old_obj.summary.iteritems():
+                    rollup['summary'][event] = rollup['summary'].get(event, 0) + count
+
+                rollup['free_disk_space'] = old_obj.free_disk_space
+
+        for (granularity, start), rollup in rollups.iteritems():
+            new_obj = self.model_to['Stats']()
+            new_obj.granularity = granularity
+            new_obj.start = start
+            new_obj.summary = rollup['summary']
+            new_obj.latency = {}
+            new_obj.free_disk_space = rollup['free_disk_space']
+            self.store_new.add(new_obj)
+            self.entries_count['Stats'] += 1
@@ -195,6 +195,7 @@ CREATE TABLE mail (
     subject TEXT NOT NULL,
     body TEXT NOT NULL,
     processing_attempts INTEGER NOT NULL,
+    next_attempt_date TEXT NOT NULL,
     PRIMARY KEY (id)
 );
 
@@ -257,9 +258,11 @@ CREATE TABLE anomalies (
 
 CREATE TABLE stats (
     id TEXT NOT NULL,
+    granularity TEXT NOT NULL CHECK (granularity IN ('hour', 'day', 'week')),
     start TEXT NOT NULL,
     free_disk_space INTEGER NOT NULL,
     summary BLOB NOT NULL,
+    latency BLOB NOT NULL,
     PRIMARY KEY (id)
 );
 
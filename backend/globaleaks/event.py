@@ -1,5 +1,8 @@
+from collections import deque
+
+from twisted.internet import reactor
+
 from globaleaks.settings import GLSettings
-from globaleaks.utils.tempdict import TempDict
 from globaleaks.utils.utility import log, datetime_now, datetime_to_ISO8601
 
 
@@ -108,14 +111,65 @@ def track_handler(handler):
             break
 
 
-class EventTrack(object):
+def get_latency_bucket(seconds):
+    """
+    Return the key of the bucket of the latency histograms counting a
+    request lasted the given seconds: the upper bound of the bucket or
+    'inf' for the requests slower than all the bounds.
+
+    The histograms are dictionaries mapping the keys to the number of
+    requests; they could be summed in order to aggregate longer periods.
+    """
+    for bound in GLSettings.stats_latency_buckets:
+        if seconds <= bound:
+            return str(bound)
+
+    return 'inf'
+
+
+def merge_latency_histograms(x, y):
+    ret = dict(x)
+
+    for bucket, count in y.iteritems():
+        ret[bucket] = ret.get(bucket, 0) + count
+
+    return ret
+
+
+def get_latency_percentile(histogram, percentile):
+    """
+    Return the estimate of the percentile of the latencies counted by the
+    histogram, interpolated linearly inside the bucket where it falls; the
+    requests slower than all the bounds are estimated with the last bound.
     """
-    Every event that is kept in memory, is a temporary object.
-    Once a while, they disappear. The statistics just take
-    account of the expiration of the events collected, once a while.
+    total = sum(histogram.itervalues())
+    if not total:
+        return 0
+
+    target = total * percentile / 100.0
+    count = 0
+
+    for bucket in sorted(histogram, key=float):
+        upper = float(bucket)
+        lower = max([b for b in GLSettings.stats_latency_buckets if b < upper] or [0])
+
+        if histogram[bucket] and count + histogram[bucket] >= target:
+            if upper == float('inf'):
+                return lower
 
-    - Anomaly check is based on those elements.
-    - Real-time analysis is based on these, too.
+            return round(lower + (upper - lower) * (target - count) / histogram[bucket], 3)
+
+        count += histogram[bucket]
+
+    return 0
+
+
+class EventTrack(object):
+    """
+    Every event is recorded by the EventTrackQueue when created:
+    - Anomaly check is based on the counters of the latest minute.
+    - Real-time analysis is based on the latest events.
+    - The statistics take account of the counters of the hour.
     """
 
     def serialize_event(self):
@@ -124,7 +178,7 @@ class EventTrack(object):
             'creation_date': datetime_to_ISO8601(self.creation_date)[:-8],
             'event': self.event_type,
             'id': self.event_id,
-            'duration': self.request_time
+            'duration': round(self.request_time, 1)
         }
 
     def __init__(self, event_obj, request_time, debug=False):
@@ -132,12 +186,12 @@ class EventTrack(object):
         self.creation_date = datetime_now()
         self.event_id = EventTrackQueue.event_number()
         self.event_type = event_obj['name']
-        self.request_time = round(request_time.total_seconds(), 1)
+        self.request_time = request_time.total_seconds()
 
         if self.debug:
             log.debug("Creation of Event %s" % self.serialize_event())
 
-        EventTrackQueue.set(self.event_id, self)
+        EventTrackQueue.record(self)
 
     def __repr__(self):
         return "%s" % self.serialize_event()
@@ -147,30 +201,100 @@ class EventTrack(object):
             'id': self.event_id,
             'creation_date': datetime_to_ISO8601(self.creation_date)[:-8],
             'event': self.event_type,
-            'duration': self.request_time
+            'duration': round(self.request_time, 1)
         }
 
 
-class EventTrackQueueClass(TempDict):
+class EventTrackQueueClass(object):
     """
-    This class has only a class variable, used to stock the queue of the
-    event happened on the latest minutes.
+    Sliding window of the events happened in the latest seconds.
+
+    The events are counted per type in a ring of buckets of one second
+    each, reused as the window slides, so that recording an event costs
+    O(1) and counting the events of the window costs O(window).
+
+    Besides the counters the queue keeps a bounded number of the latest
+    events and, for each type, of the latest latencies; every event is
+    also added to the counters and to the latency histograms of the
+    current hour read by the statistics.
     """
+    reactor = None
     event_absolute_counter = 0
 
-    def expireCallback(self, event):
+    def __init__(self, window=60, events_limit=1000, latencies_limit=100):
+        self.window = window
+        self.events_limit = events_limit
+        self.latencies_limit = latencies_limit
+        self.clear()
+
+    def clear(self):
+        self.seconds = [None] * self.window
+        self.counters = [{} for _ in range(self.window)]
+        self.events = deque(maxlen=self.events_limit)
+        self.latencies = {}
+
+    def get_time(self):
+        return (self.reactor if self.reactor is not None else reactor).seconds()
+
+    def record(self, event):
+        now = self.get_time()
+        second = int(now)
+        i = second % self.window
+
+        if self.seconds[i] != second:
+            self.seconds[i] = second
+            self.counters[i] = {}
+
+        self.counters[i][event.event_type] = self.counters[i].get(event.event_type, 0) + 1
+
+        if event.event_type not in self.latencies:
+            self.latencies[event.event_type] = deque(maxlen=self.latencies_limit)
+
+        self.latencies[event.event_type].append((now, event.request_time))
+
+        self.events.append(event)
+
+        GLSettings.RecentEvents[event.event_type] = GLSettings.RecentEvents.get(event.event_type, 0) + 1
+
+        histogram = GLSettings.RecentLatencies.setdefault(event.event_type, {})
+        bucket = get_latency_bucket(event.request_time)
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    def get_counters(self):
         """
-        On expiration of an event perform the synthesis and
-        append them to the RecentEventQueue.
+        Return the number of the events of each type happened in the window
         """
-        GLSettings.RecentEventQ.append(event.synthesis())
+        second = int(self.get_time())
+
+        ret = {}
+        for s in range(second - self.window + 1, second + 1):
+            i = s % self.window
+            if self.seconds[i] == s:
+                for event_type, count in self.counters[i].iteritems():
+                    ret[event_type] = ret.get(event_type, 0) + count
+
+        return ret
+
+    def get_latencies(self):
+        """
+        Return the latest latencies, for each type of event, of the events
+        happened in the window
+        """
+        lower_bound = self.get_time() - self.window
+
+        return dict((event_type, [latency for when, latency in latencies if when > lower_bound])
+                    for event_type, latencies in self.latencies.iteritems())
 
     def event_number(self):
         self.event_absolute_counter += 1
         return self.event_absolute_counter
 
-    def take_current_snapshot(self):
-        return [event_obj.serialize_event() for _, event_obj in EventTrackQueue.iteritems()]
+    def take_current_snapshot(self, since=None):
+        """
+        Return the latest events, if specified the ones happened since the date
+        """
+        return [event_obj.serialize_event() for event_obj in self.events
+                if since is None or event_obj.creation_date >= since]
 
 
-EventTrackQueue = EventTrackQueueClass(timeout=60)
+EventTrackQueue = EventTrackQueueClass(window=60)
@@ -232,7 +232,7 @@ def delete_context(store, context_id):
 
 class ContextsCollection(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'contexts', 'receivers'}
 
     def get(self):
         """
@@ -261,7 +261,7 @@ class ContextsCollection(BaseHandler):
 
 class ContextInstance(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'contexts', 'receivers'}
 
     def get(self, context_id):
         """
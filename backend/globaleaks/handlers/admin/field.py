@@ -337,7 +337,7 @@ class FieldTemplatesCollection(BaseHandler):
 
 class FieldTemplateInstance(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'questionnaires'}
 
     def get(self, field_id):
         """
@@ -384,7 +384,7 @@ class FieldCollection(BaseHandler):
     /admin/fields
     """
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'questionnaires'}
 
     def post(self):
         """
@@ -408,7 +408,7 @@ class FieldInstance(BaseHandler):
     /admin/fields
     """
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'questionnaires'}
 
     def get(self, field_id):
         """
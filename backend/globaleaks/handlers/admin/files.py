@@ -53,7 +53,7 @@ def del_file(store, key):
 
 class FileInstance(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'files'}
 
     key = None
 
@@ -40,7 +40,7 @@ def delete_custom_texts(store, lang):
 
 class AdminL10NHandler(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'l10n'}
 
     def get(self, lang):
         return get_custom_texts(lang)
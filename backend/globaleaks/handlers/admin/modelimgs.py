@@ -45,7 +45,7 @@ def del_model_img(store, model, obj_id):
 
 class ModelImgInstance(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'contexts', 'receivers'}
 
     def post(self, obj_key, obj_id):
         uploaded_file = self.get_file_upload()
@@ -113,7 +113,7 @@ def update_node(*args):
 
 class NodeInstance(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'node'}
 
     def get(self):
         """
@@ -3,92 +3,465 @@
 # overview
 #   ********
 # Implementation of the code executed when an HTTP client reach /overview/* URI
+import json
+
+from storm.expr import And, Desc, In, Or
+from twisted.internet import defer
+from twisted.internet.defer import inlineCallbacks
+
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact
+from globaleaks.handlers.receiver import encode_cursor, decode_cursor
+from globaleaks.orm import transact_ro
+from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import Rosetta
-from globaleaks.utils.utility import datetime_to_ISO8601
+from globaleaks.utils.utility import log, datetime_to_ISO8601, ISO8601_to_datetime
 
 
-@transact
-def collect_tip_overview(store, language):
-    tip_description_list = []
+def parse_overview_query(request, overview_cls):
+    """
+    Parse the arguments of a request of an overview
 
-    all_itips = store.find(models.InternalTip)
-    for itip in all_itips:
-        tip_description = {
-            'id': itip.id,
-            'creation_date': datetime_to_ISO8601(itip.creation_date),
-            'expiration_date': datetime_to_ISO8601(itip.expiration_date),
-            'context_id': itip.context_id
-        }
+    Parameters: sort, order, limit, cursor, context_id, start_date, end_date,
+                min_size, max_size
+    """
+    args = dict((k, v[0]) for k, v in request.args.items())
 
-        mo = Rosetta(itip.context.localized_keys)
-        mo.acquire_storm_object(itip.context)
-        tip_description['context_name'] = mo.dump_localized_key('name', language)
+    query = {
+        'sort': args.get('sort', 'creation_date'),
+        'order': args.get('order', 'desc'),
+        'cursor': args.get('cursor'),
+        'context_id': unicode(args['context_id']) if 'context_id' in args else None
+    }
 
-        tip_description_list.append(tip_description)
+    if query['sort'] not in overview_cls.sort_keys or query['order'] not in ('asc', 'desc'):
+        raise errors.InvalidInputFormat("Invalid sort")
 
-    return tip_description_list
+    try:
+        query['limit'] = int(args['limit']) if 'limit' in args else None
 
+        for key in ['min_size', 'max_size']:
+            query[key] = int(args[key]) if key in args else None
 
-@transact
-def collect_files_overview(store):
-    file_description_list = []
+        for key in ['start_date', 'end_date']:
+            query[key] = ISO8601_to_datetime(args[key]) if key in args else None
+    except ValueError:
+        raise errors.InvalidInputFormat("Invalid filter")
 
-    for ifile in store.find(models.InternalFile):
-        file_desc = {
-            'id': ifile.id,
-            'itip': ifile.internaltip_id,
-            'path': ifile.file_path,
-            'size': ifile.size
-        }
+    if query['limit'] is None or not 0 < query['limit'] <= GLSettings.admin_overview_page_size:
+        query['limit'] = GLSettings.admin_overview_page_size
 
-        file_description_list.append(file_desc)
+    return query
 
-    for rfile in store.find(models.ReceiverFile):
-        file_desc = {
-            'id': rfile.internalfile_id,
-            'itip': rfile.internalfile.internaltip_id,
-            'path': rfile.file_path,
-            'size': rfile.size
 
-        }
+def db_get_context_names(store, contexts_ids, language):
+    context_names = {}
 
-        file_description_list.append(file_desc)
+    if contexts_ids:
+        for context in store.find(models.Context, In(models.Context.id, list(contexts_ids))):
+            mo = Rosetta(context.localized_keys)
+            mo.acquire_storm_object(context)
+            context_names[context.id] = mo.dump_localized_key('name', language)
 
-    return file_description_list
+    return context_names
 
 
-class Tips(BaseHandler):
+class Overview(object):
     """
-    /admin/overview/tips
-    Dump the list of the active tips with various information
+    Sorted and filtered listing of the rows of one or more tables, listed one
+    after the other, read in pages delimited by cursors.
+
+    The cursors are the ones of the receiver tips list where the id of the
+    row is paired with the index of its table; only the columns needed by
+    the serialization are read.
     """
-    check_roles = 'admin'
+    # the id column of each of the tables
+    tables = ()
 
-    def get(self):
+    # columns by which the rows could be sorted, one for each of the tables
+    sort_keys = {}
+
+    def __init__(self, query):
+        self.query = query
+
+    def db_find(self, store, table):
+        """
+        Return the result of the rows of the table matching the filters
         """
-        Parameters: None
-        Response: TipsOverviewDescList
-        Errors: None
+        raise NotImplementedError
+
+    def get_columns(self, table):
+        """
+        Return the columns read for the serialization of the rows of the table
         """
-        return collect_tip_overview(self.request.language)
+        raise NotImplementedError
+
+    def db_serialize(self, store, table, rows, language):
+        raise NotImplementedError
+
+    def decode_cursor(self, cursor):
+        """
+        Return the value of the sort column, the table and the id of the row
+        of the cursor
+
+        @raise InvalidInputFormat: if the cursor is invalid
+        """
+        if cursor is None:
+            return None, 0, None
+
+        value, last_id = decode_cursor(cursor)
+        try:
+            first_table, last_id = last_id
+            assert 0 <= first_table < len(self.tables)
+        except Exception:
+            raise errors.InvalidInputFormat("Invalid cursor")
+
+        return value, first_table, last_id
+
+    def get_results(self, store, cursor, end_cursor=None):
+        """
+        Return the sorted results of the tables starting from the cursor and
+        ending, if given, with the row of the end cursor
+        """
+        value, first_table, last_id = self.decode_cursor(cursor)
+
+        last_table = len(self.tables) - 1
+        if end_cursor is not None:
+            end_value, last_table, end_id = self.decode_cursor(end_cursor)
+
+        results = []
+        for table in range(first_table, last_table + 1):
+            column = self.sort_keys[self.query['sort']][table]
+            id_column = self.tables[table]
+
+            result = self.db_find(store, table)
+
+            if table == first_table and last_id is not None:
+                if self.query['order'] == 'asc':
+                    result = result.find(Or(column > value, And(column == value, id_column > last_id)))
+                else:
+                    result = result.find(Or(column < value, And(column == value, id_column < last_id)))
+
+            if table == last_table and end_cursor is not None:
+                if self.query['order'] == 'asc':
+                    result = result.find(Or(column < end_value, And(column == end_value, id_column <= end_id)))
+                else:
+                    result = result.find(Or(column > end_value, And(column == end_value, id_column >= end_id)))
+
+            if self.query['order'] == 'asc':
+                result = result.order_by(column, id_column)
+            else:
+                result = result.order_by(Desc(column), Desc(id_column))
+
+            results.append((table, result))
 
+        return results
 
-class Files(BaseHandler):
+    def encode_cursor(self, table, value, row_id):
+        return encode_cursor(value, [table, row_id])
+
+    def db_get_next_cursor(self, store, cursor, limit):
+        """
+        Return the cursor of the last row of the page of limit rows following
+        the cursor, None if there are no other rows after the page
+
+        A row more than the page is looked up in order to know if there are
+        other rows; only the sort and the id columns are read.
+        """
+        last_cursor = None
+
+        for table, result in self.get_results(store, cursor):
+            if not limit:
+                if not result.is_empty():
+                    return last_cursor
+
+                continue
+
+            rows = list(result[:limit + 1].values(self.sort_keys[self.query['sort']][table], self.tables[table]))
+            if len(rows) > limit:
+                return self.encode_cursor(table, *rows[limit - 1])
+
+            if rows:
+                last_cursor = self.encode_cursor(table, *rows[-1])
+                limit -= len(rows)
+
+        return None
+
+    def db_get_rows(self, store, cursor, end_cursor, limit, language):
+        """
+        Return the serialization of up to limit rows following the cursor and
+        not following the end cursor, and the cursor of the last one
+        """
+        ret = []
+        last_cursor = cursor
+
+        for table, result in self.get_results(store, cursor, end_cursor):
+            needed = limit - len(ret)
+            if not needed:
+                break
+
+            columns = [self.sort_keys[self.query['sort']][table], self.tables[table]]
+
+            rows = list(result[:needed].values(*(columns + self.get_columns(table))))
+            if rows:
+                ret.extend(self.db_serialize(store, table, [row[2:] for row in rows], language))
+                last_cursor = self.encode_cursor(table, rows[-1][0], rows[-1][1])
+
+        return ret, last_cursor
+
+
+class TipOverview(Overview):
+    tables = (models.InternalTip.id,)
+
+    sort_keys = {
+        'creation_date': (models.InternalTip.creation_date,),
+        'expiration_date': (models.InternalTip.expiration_date,)
+    }
+
+    def db_find(self, store, table):
+        conditions = []
+
+        if self.query['context_id'] is not None:
+            conditions.append(models.InternalTip.context_id == self.query['context_id'])
+
+        if self.query['start_date'] is not None:
+            conditions.append(models.InternalTip.creation_date >= self.query['start_date'])
+
+        if self.query['end_date'] is not None:
+            conditions.append(models.InternalTip.creation_date <= self.query['end_date'])
+
+        return store.find(models.InternalTip, *conditions)
+
+    def get_columns(self, table):
+        return [models.InternalTip.id,
+                models.InternalTip.creation_date,
+                models.InternalTip.expiration_date,
+                models.InternalTip.context_id]
+
+    def db_serialize(self, store, table, rows, language):
+        context_names = db_get_context_names(store, set(row[3] for row in rows), language)
+
+        return [{
+            'id': itip_id,
+            'creation_date': datetime_to_ISO8601(creation_date),
+            'expiration_date': datetime_to_ISO8601(expiration_date),
+            'context_id': context_id,
+            'context_name': context_names.get(context_id, u'')
+        } for itip_id, creation_date, expiration_date, context_id in rows]
+
+
+class FileOverview(Overview):
     """
-    /admin/overview/files
+    The internal files are listed before the receiver files; the date of a
+    receiver file is the one of its internal file
+    """
+    tables = (models.InternalFile.id, models.ReceiverFile.id)
+
+    sort_keys = {
+        'creation_date': (models.InternalFile.creation_date, models.InternalFile.creation_date),
+        'size': (models.InternalFile.size, models.ReceiverFile.size)
+    }
+
+    def db_find(self, store, table):
+        if table == 0:
+            cls, size = models.InternalFile, models.InternalFile.size
+            conditions = []
+        else:
+            cls, size = models.ReceiverFile, models.ReceiverFile.size
+            conditions = [models.InternalFile.id == models.ReceiverFile.internalfile_id]
+
+        if self.query['context_id'] is not None:
+            conditions.extend([models.InternalTip.id == models.InternalFile.internaltip_id,
+                               models.InternalTip.context_id == self.query['context_id']])
+
+        if self.query['start_date'] is not None:
+            conditions.append(models.InternalFile.creation_date >= self.query['start_date'])
+
+        if self.query['end_date'] is not None:
+            conditions.append(models.InternalFile.creation_date <= self.query['end_date'])
+
+        if self.query['min_size'] is not None:
+            conditions.append(size >= self.query['min_size'])
+
+        if self.query['max_size'] is not None:
+            conditions.append(size <= self.query['max_size'])
+
+        return store.find(cls, *conditions)
+
+    def get_columns(self, table):
+        if table == 0:
+            return [models.InternalFile.id,
+                    models.InternalFile.internaltip_id,
+                    models.InternalFile.file_path,
+                    models.InternalFile.size]
+
+        return [models.ReceiverFile.internalfile_id,
+                models.InternalFile.internaltip_id,
+                models.ReceiverFile.file_path,
+                models.ReceiverFile.size]
+
+    def db_serialize(self, store, table, rows, language):
+        return [{
+            'id': file_id,
+            'itip': itip_id,
+            'path': path,
+            'size': size
+        } for file_id, itip_id, path, size in rows]
+
+
+@transact_ro
+def get_overview_next_cursor(store, overview):
+    return overview.db_get_next_cursor(store, overview.query['cursor'], overview.query['limit'])
+
+
+@transact_ro
+def get_overview_rows(store, overview, cursor, end_cursor, limit, language):
+    return overview.db_get_rows(store, cursor, end_cursor, limit, language)
 
-    Return the list of the files in InternalFile, ReceiverFile
-    and the files in
+
+class OverviewProducer(object):
+    """
+    Streaming producer of a page of an overview written as a JSON list
+
+    The rows are read in batches of GLSettings.admin_overview_batch_size,
+    each in its own transaction, and every batch is written as soon as it
+    is read so that the memory used does not depend on the size of the page;
+    the reading is suspended while the transport is paused.
+
+    Every batch starts from the cursor of the last row written and the page
+    ends with the row of the cursor of the next page, looked up before the
+    streaming, so that the rows inserted or deleted meanwhile are neither
+    skipped nor repeated.
+    """
+    def __init__(self, handler, overview, next_cursor):
+        self.finish = defer.Deferred()
+        self.handler = handler
+        self.overview = overview
+        self.cursor = overview.query['cursor']
+        self.next_cursor = next_cursor
+        self.count = 0
+        self.paused = False
+        self.reading = False
+
+    def start(self):
+        self.handler.request.setHeader(b'content-type', b'application/json')
+        self.handler.request.write(b'[')
+        self.handler.request.registerProducer(self, True)
+        self.read_rows()
+        return self.finish
+
+    def read_rows(self):
+        if self.handler is None or self.paused or self.reading:
+            return
+
+        self.reading = True
+
+        d = get_overview_rows(self.overview,
+                              self.cursor,
+                              self.next_cursor,
+                              GLSettings.admin_overview_batch_size,
+                              self.handler.request.language)
+
+        d.addCallback(self.write_rows)
+        d.addErrback(self.fail)
+
+    def write_rows(self, result):
+        self.reading = False
+
+        if self.handler is None:
+            return
+
+        rows, self.cursor = result
+
+        chunk = b','.join(json.dumps(row) for row in rows)
+        if rows and self.count:
+            chunk = b',' + chunk
+
+        self.count += len(rows)
+
+        if len(rows) < GLSettings.admin_overview_batch_size:
+            self.handler.request.write(chunk + b']')
+            self.stopProducing()
+        else:
+            self.handler.request.write(chunk)
+            self.read_rows()
+
+    def fail(self, failure):
+        self.reading = False
+
+        log.err("Unable to stream the overview: %s" % failure.getErrorMessage())
+
+        if self.handler is not None:
+            request = self.handler.request
+            self.handler = None
+
+            # the connection is closed without finishing the response so that
+            # the client does not take the rows written so far as a page;
+            # the handler completes when the connection is lost
+            request.unregisterProducer()
+            request.notifyFinish().addBoth(lambda _: self.finish.callback(None))
+            request.transport.loseConnection()
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.read_rows()
+
+    def stopProducing(self):
+        if self.handler is not None:
+            self.handler.request.unregisterProducer()
+            self.handler.request.finish()
+            self.handler = None
+            self.finish.callback(None)
+
+
+class OverviewHandler(BaseHandler):
+    """
+    The cursor of the next page, if any, is returned in the X-Next-Cursor header
+
+    The subclasses define the Overview subclass of the listing in overview_cls.
     """
     check_roles = 'admin'
+    handler_exec_time_threshold = 3600
+    overview_cls = None
 
+    @inlineCallbacks
     def get(self):
-        """
-        Parameters: None
-        Response: FilesOverviewDescList
-        Errors: None
-        """
-        return collect_files_overview()
+        # pylint: disable=not-callable
+        overview = self.overview_cls(parse_overview_query(self.request, self.overview_cls))
+
+        next_cursor = yield get_overview_next_cursor(overview)
+        if next_cursor is not None:
+            self.request.setHeader(b'X-Next-Cursor', next_cursor)
+
+        yield OverviewProducer(self, overview, next_cursor).start()
+
+
+class Tips(OverviewHandler):
+    """
+    /admin/overview/tips
+    Dump the list of the active tips with various information
+
+    Parameters: sort (creation_date, expiration_date), order, limit, cursor,
+                context_id, start_date, end_date
+    Response: TipsOverviewDescList
+    Errors: InvalidInputFormat
+    """
+    overview_cls = TipOverview
+
+
+class Files(OverviewHandler):
+    """
+    /admin/overview/files
+
+    Return the list of the files in InternalFile and ReceiverFile
+
+    Parameters: sort (creation_date, size), order, limit, cursor, context_id,
+                start_date, end_date, min_size, max_size
+    Response: FilesOverviewDescList
+    Errors: InvalidInputFormat
+    """
+    overview_cls = FileOverview
@@ -165,7 +165,7 @@ def delete_questionnaire(store, questionnaire_id):
 
 class QuestionnairesCollection(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'questionnaires', 'contexts'}
 
     def get(self):
         """
@@ -194,7 +194,7 @@ class QuestionnairesCollection(BaseHandler):
 
 class QuestionnaireInstance(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'questionnaires', 'contexts'}
 
     def get(self, questionnaire_id):
         """
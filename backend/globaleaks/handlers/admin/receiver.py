@@ -121,7 +121,7 @@ class ReceiversCollection(BaseHandler):
 
 class ReceiverInstance(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'receivers', 'contexts'}
 
     def get(self, receiver_id):
         """
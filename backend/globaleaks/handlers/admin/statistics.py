@@ -5,17 +5,22 @@
 #
 # Implementation of classes handling the HTTP request to /node, public
 # exposed API.
-import operator
 from datetime import timedelta
 from storm.expr import Desc, And
 
-from globaleaks.orm import transact
-from globaleaks.event import EventTrackQueue, events_monitored
-from globaleaks.handlers.base import BaseHandler
+from globaleaks.orm import transact_ro, get_store_pools_stats
+from globaleaks.event import EventTrackQueue, events_monitored, get_latency_percentile
+from globaleaks.handlers.base import BaseHandler, GLSessions, GLUploads
+from globaleaks.handlers.submission import GLSchemaCache
 from globaleaks.models import Stats, Anomalies
+from globaleaks.rest import errors
+from globaleaks.rest.admission import AdmissionControl
+from globaleaks.rest.apicache import GLApiCache
+from globaleaks.security import GLKDFPool, GLPGPKeyring
 from globaleaks.settings import GLSettings
+from globaleaks.utils.mailutils import SMTPPool
 from globaleaks.utils.utility import datetime_to_ISO8601, datetime_now, \
-    iso_to_gregorian, log
+    iso_to_gregorian, log, ISO8601_to_datetime
 
 
 def weekmap_to_heatmap(week_map):
@@ -29,7 +34,7 @@ def weekmap_to_heatmap(week_map):
 
     return retlist
 
-@transact
+@transact_ro
 def get_stats(store, week_delta):
     """
     :param week_delta: commonly is 0, mean that you're taking this
@@ -54,7 +59,9 @@ def get_stats(store, week_delta):
     lower_bound = iso_to_gregorian(looked_year, looked_week, 1)
     upper_bound = iso_to_gregorian(looked_year, looked_week + 1, 1)
 
-    hourlyentries = store.find(Stats, And(Stats.start >= lower_bound, Stats.start <= upper_bound))
+    hourlyentries = store.find(Stats, And(Stats.granularity == u'hour',
+                                          Stats.start >= lower_bound,
+                                          Stats.start <= upper_bound))
 
     week_entries = 0
     week_map = [[dict() for i in xrange(24)] for j in xrange(7)]
@@ -113,7 +120,35 @@ def get_stats(store, week_delta):
     }
 
 
-@transact
+def serialize_latency(histogram):
+    return {
+        'count': sum(histogram.itervalues()),
+        'p50': get_latency_percentile(histogram, 50),
+        'p90': get_latency_percentile(histogram, 90),
+        'p99': get_latency_percentile(histogram, 99),
+        'histogram': histogram
+    }
+
+
+@transact_ro
+def get_stats_rollups(store, granularity, start, end):
+    """
+    Return the statistics of the hours, of the days or of the weeks
+    starting in the range [start, end) sorted by date.
+    """
+    rollups = store.find(Stats, Stats.granularity == granularity,
+                         Stats.start >= start,
+                         Stats.start < end).order_by(Stats.start)
+
+    return [{
+        'start': datetime_to_ISO8601(rollup.start),
+        'summary': rollup.summary,
+        'latency': dict((event, serialize_latency(histogram)) for event, histogram in rollup.latency.iteritems()),
+        'free_disk_space': rollup.free_disk_space
+    } for rollup in rollups]
+
+
+@transact_ro
 def get_anomaly_history(store, limit):
     anomalies = store.find(Anomalies).order_by(Desc(Anomalies.date))[:limit]
 
@@ -160,6 +195,34 @@ class StatsCollection(BaseHandler):
         return get_stats(week_delta)
 
 
+class StatsRollupsCollection(BaseHandler):
+    """
+    This Handler returns the statistics aggregated by hour, by day or by week
+    in an arbitrary range of dates together with the percentiles of the
+    latencies of the requests of each of the events
+    /admin/stats/rollups
+
+    Parameters: granularity (hour, day, week), start, end (default: the last week)
+    Errors: InvalidInputFormat
+    """
+    check_roles = 'admin'
+
+    def get(self):
+        args = dict((k, v[0]) for k, v in self.request.args.items())
+
+        granularity = unicode(args.get('granularity', 'day'))
+        if granularity not in GLSettings.stats_retention:
+            raise errors.InvalidInputFormat("Invalid granularity")
+
+        try:
+            end = ISO8601_to_datetime(args['end']) if 'end' in args else datetime_now()
+            start = ISO8601_to_datetime(args['start']) if 'start' in args else end - timedelta(7)
+        except ValueError:
+            raise errors.InvalidInputFormat("Invalid range")
+
+        return get_stats_rollups(granularity, start, end)
+
+
 class RecentEventsCollection(BaseHandler):
     """
     This handler is refreshed constantly by an admin page
@@ -167,30 +230,23 @@ class RecentEventsCollection(BaseHandler):
     """
     check_roles = 'admin'
 
-    def get_summary(self, templist):
+    def get_summary(self):
         eventmap = dict()
         for event in events_monitored:
             eventmap.setdefault(event['name'], 0)
 
-        for e in templist:
-            eventmap[e['event']] += 1
+        # the counters of the current hour, until Stats dump them
+        eventmap.update(GLSettings.RecentEvents)
 
         return eventmap
 
     def get(self, kind):
-        templist = []
-
-        # the current 30 seconds
-        templist += EventTrackQueue.take_current_snapshot()
-        # the already stocked by side, until Stats dump them in 1hour
-        templist += GLSettings.RecentEventQ
-
-        templist.sort(key=operator.itemgetter('id'))
-
         if kind == 'details':
-            return templist
+            # the latest events of the current hour, until Stats dump them;
+            # the summary counts also the events exceeding the ones kept
+            return EventTrackQueue.take_current_snapshot(GLSettings.stats_collection_start_time)
         else:  # kind == 'summary':
-            return self.get_summary(templist)
+            return self.get_summary()
 
 
 class JobsTiming(BaseHandler):
@@ -205,7 +261,29 @@ class JobsTiming(BaseHandler):
         for job in GLSettings.jobs:
             response.append({
               'name': job.name,
-              'timings': job.last_executions
+              'timings': job.last_executions,
+              'stats': job.get_stats()
             })
 
         return response
+
+
+class ResourcesStatistics(BaseHandler):
+    """
+    This handler returns the usage statistics of the internal resources
+    /admin/stats/resources
+    """
+    check_roles = 'admin'
+
+    def get(self):
+        return {
+            'orm': get_store_pools_stats(),
+            'cache': GLApiCache.get_stats(),
+            'pgp_keyring': GLPGPKeyring.get_stats(),
+            'kdf': GLKDFPool.get_stats(),
+            'admission': AdmissionControl.get_stats(),
+            'smtp': SMTPPool.get_stats(),
+            'uploads': GLUploads.get_stats(),
+            'sessions': GLSessions.get_stats(),
+            'schemas': GLSchemaCache.get_stats()
+        }
@@ -116,7 +116,7 @@ class StepCollection(BaseHandler):
     /admin/steps
     """
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'questionnaires'}
 
     def post(self):
         """
@@ -139,7 +139,7 @@ class StepInstance(BaseHandler):
     /admin/step
     """
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'questionnaires'}
 
     def get(self, step_id):
         """
@@ -201,7 +201,7 @@ def get_user_list(store, language):
 
 class UsersCollection(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'receivers', 'contexts'}
 
     def get(self):
         """
@@ -236,7 +236,7 @@ class UsersCollection(BaseHandler):
 
 class UserInstance(BaseHandler):
     check_roles = 'admin'
-    invalidate_cache = True
+    invalidate_cache = {'receivers', 'contexts'}
 
     def get(self, user_id):
         """
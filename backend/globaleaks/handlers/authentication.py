@@ -8,12 +8,12 @@
 from storm.expr import And
 from twisted.internet.defer import inlineCallbacks, returnValue
 
-from globaleaks import security
 from globaleaks.handlers.base import BaseHandler, GLSessions, GLSession
 from globaleaks.models import User
 from globaleaks.models import WhistleblowerTip
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import errors, requests
+from globaleaks.security import GLKDFPool
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import datetime_now, deferred_sleep, log, randint
 
@@ -47,12 +47,22 @@ def random_login_delay():
     return 0
 
 
-@transact
-def login_whistleblower(store, receipt, client_using_tor):
+@inlineCallbacks
+def login_whistleblower(receipt, client_using_tor):
     """
     login_whistleblower returns the WhistleblowerTip.id
+
+    The receipt is hashed on the KDF pool before the transaction.
     """
-    hashed_receipt = security.hash_password(receipt, GLSettings.memory_copy.private.receipt_salt)
+    hashed_receipt = yield GLKDFPool.hash_password(receipt, GLSettings.memory_copy.private.receipt_salt)
+
+    wbtip_id = yield login_wbtip(hashed_receipt, client_using_tor)
+
+    returnValue(wbtip_id)
+
+
+@transact
+def login_wbtip(store, hashed_receipt, client_using_tor):
     wbtip = store.find(WhistleblowerTip,
                        WhistleblowerTip.receipt_hash == unicode(hashed_receipt)).one()
 
@@ -70,19 +80,51 @@ def login_whistleblower(store, receipt, client_using_tor):
     return wbtip.id
 
 
-@transact
-def login(store, username, password, client_using_tor):
-    """
-    login returns a tuple (user_id, state, pcn)
-    """
+@transact_ro
+def get_user_credentials(store, username):
     user = store.find(User, And(User.username == username,
                                 User.state != u'disabled')).one()
 
-    if not user or not security.check_password(password, user.salt, user.password):
+    if user:
+        return user.id, user.salt, user.password
+
+
+@inlineCallbacks
+def login(username, password, client_using_tor):
+    """
+    login returns a tuple (user_id, state, role, pcn)
+
+    The password is checked on the KDF pool between the read of the
+    credentials and the transaction updating the user.
+    """
+    credentials = yield get_user_credentials(username)
+
+    valid = False
+    if credentials:
+        user_id, salt, password_hash = credentials
+        valid = yield GLKDFPool.check_password(password, salt, password_hash)
+
+    if not valid:
         log.debug("Login: Invalid credentials")
         GLSettings.failed_login_attempts += 1
         raise errors.InvalidAuthentication
 
+    ret = yield login_user(user_id, password_hash, client_using_tor)
+
+    returnValue(ret)
+
+
+@transact
+def login_user(store, user_id, password_hash, client_using_tor):
+    user = store.find(User, And(User.id == user_id,
+                                User.state != u'disabled')).one()
+
+    # the user could have been disabled or could have changed the password
+    # after the check of the credentials
+    if not user or user.password != password_hash:
+        log.debug("Login: Invalid credentials")
+        raise errors.InvalidAuthentication
+
     if not client_using_tor and not GLSettings.memory_copy.accept_tor2web_access[user.role]:
         log.err("Denied login request over Web for role '%s'" % user.role)
         raise errors.TorNetworkRequired
@@ -98,6 +140,7 @@ class AuthenticationHandler(BaseHandler):
     """
     check_roles = 'unauthenticated'
     uniform_answer_time = True
+    admission_class = 'login'
 
     @inlineCallbacks
     def post(self):
@@ -129,6 +172,7 @@ class AuthenticationHandler(BaseHandler):
 class ReceiptAuthHandler(BaseHandler):
     check_roles = 'unauthenticated'
     uniform_answer_time = True
+    admission_class = 'login'
 
     @inlineCallbacks
     def post(self):
@@ -1,11 +1,9 @@
 # -*- encoding: utf-8 -*-
 import base64
-import collections
 import functools
 import json
 import mimetypes
 import os
-import re
 import shutil
 import sys
 import time
@@ -21,25 +19,235 @@ from twisted.web.resource import Resource
 from twisted.web.static import File
 
 from globaleaks.event import track_handler
-from globaleaks.rest import errors, requests
+from globaleaks.rest import errors, validator
 from globaleaks.security import GLSecureTemporaryFile, directory_traversal_check, generateRandomKey
 from globaleaks.settings import GLSettings
 from globaleaks.utils.mailutils import mail_exception_handler, send_exception_email
+from globaleaks.utils.multipart import MultipartStream
+from globaleaks.utils.sessionstore import MemorySessionStore
 from globaleaks.utils.tempdict import TempDict
 from globaleaks.utils.utility import log, deferred_sleep
 
 HANDLER_EXEC_TIME_THRESHOLD = 30
 
-GLUploads = {}
+
+class GLUpload(object):
+    """
+    A file uploaded in chunks that could be received out of order, in
+    parallel or more than once (e.g. the retries of flow.js); every chunk
+    is written at its offset and tracked in a bitmap.
+    """
+    def __init__(self, total_size, total_chunks, chunk_size):
+        self.total_size = total_size
+        self.total_chunks = total_chunks
+        self.chunk_size = chunk_size
+        self.bitmap = bytearray((total_chunks + 7) // 8)
+        self.received = 0
+        self.file = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+
+    def has_chunk(self, n):
+        return bool(self.bitmap[(n - 1) // 8] & (1 << ((n - 1) % 8)))
+
+    def chunk_range(self, n):
+        """
+        Return the offset and the size of a chunk; as in flow.js the last
+        chunk includes the remainder of the division of the file in chunks
+        """
+        offset = (n - 1) * self.chunk_size
+        if n == self.total_chunks:
+            return offset, self.total_size - offset
+
+        return offset, self.chunk_size
+
+    def add_chunk(self, n, chunk):
+        offset, size = self.chunk_range(n)
+        if chunk.size != size:
+            chunk.close()
+            raise errors.InvalidInputFormat("Invalid chunk size")
+
+        if self.has_chunk(n):
+            chunk.close()
+            return 0
+
+        self.file.write_file_at(offset, chunk)
+        self.bitmap[(n - 1) // 8] |= 1 << ((n - 1) % 8)
+        self.received += 1
+
+        return size
+
+    def get_chunks(self):
+        return [n for n in range(1, self.total_chunks + 1) if self.has_chunk(n)]
+
+    def completed(self):
+        return self.received == self.total_chunks
+
+
+class GLUploadsFactory(TempDict):
+    """
+    Extends TempDict to track the files being uploaded in chunks; the
+    uploads not completed within the timeout are removed with their files.
+    """
+    def __init__(self, timeout=None, size_limit=None):
+        TempDict.__init__(self, timeout, size_limit)
+        self.stats = {
+            'completed': 0,
+            'expired': 0,
+            'bytes_in_flight': 0
+        }
+
+    def add_chunk(self, key, chunk, chunk_number, total_chunks, chunk_size, total_size):
+        """
+        Add a chunk to the upload identified by key
+
+        @return: the uploaded GLSecureTemporaryFile if it is completed or None
+        """
+        try:
+            if total_chunks == 1:
+                # the files uploaded in a single chunk are used as they are
+                if chunk_number != 1 or chunk.size != total_size:
+                    raise errors.InvalidInputFormat("Invalid chunk")
+
+                self.stats['completed'] += 1
+                return chunk
+
+            upload = self.get(key)
+            if upload is None:
+                if total_chunks > GLSettings.upload_max_chunks or \
+                   total_chunks != max(1, total_size // chunk_size):
+                    raise errors.InvalidInputFormat("Invalid number of chunks")
+
+                upload = GLUpload(total_size, total_chunks, chunk_size)
+                self.set(key, upload)
+
+            elif (upload.total_size, upload.total_chunks, upload.chunk_size) != (total_size, total_chunks, chunk_size):
+                raise errors.InvalidInputFormat("Invalid chunk")
+
+            if not 1 <= chunk_number <= total_chunks:
+                raise errors.InvalidInputFormat("Invalid chunk number")
+
+        except:
+            chunk.close()
+            raise
+
+        self.stats['bytes_in_flight'] += upload.add_chunk(chunk_number, chunk)
+
+        if not upload.completed():
+            return None
+
+        # the completed upload is removed without being counted as expired
+        self.delete(key)
+        self.stats['bytes_in_flight'] -= upload.total_size
+        self.stats['completed'] += 1
+
+        return upload.file
+
+    def get_chunks(self, key):
+        """
+        Return the numbers of the chunks received of the upload identified by key
+        """
+        upload = self.get(key)
+
+        return upload.get_chunks() if upload is not None else []
+
+    def expireCallback(self, upload):
+        self.stats['expired'] += 1
+        self.stats['bytes_in_flight'] -= sum(upload.chunk_range(n)[1] for n in upload.get_chunks())
+        upload.file.close()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['active'] = len(self)
+
+        return stats
+
+GLUploads = GLUploadsFactory(timeout=GLSettings.upload_timeout)
+
 
 class GLSessionsFactory(TempDict):
-  """Extends TempDict to provide session management functions ontop of temp session keys"""
+    """
+    Extends TempDict to provide session management functions ontop of temp
+    session keys.
+
+    The sessions are indexed by user and counted by role; they are also
+    written to the session store in order to be restored after a restart.
+    The expiration of a session is written again when it has been moved by
+    more than store_interval seconds.
+    """
+    store_interval = 60
+
+    def __init__(self, timeout=None, size_limit=None):
+        self.users = {}
+        self.roles = {}
+        self.store = MemorySessionStore()
+        TempDict.__init__(self, timeout, size_limit)
+
+    def __setitem__(self, key, session, *args):
+        if key in self:
+            del self[key]
+
+        TempDict.__setitem__(self, key, session, *args)
+
+        # the user and the role are kept as indexed in order to update the
+        # indexes even if the attributes of the session are modified
+        session.indexed = (session.user_id, session.user_role)
+
+        self.users.setdefault(session.user_id, set()).add(key)
+        self.roles[session.user_role] = self.roles.get(session.user_role, 0) + 1
+
+        session.stored_time = self.get_time(key)
+        self.store.save(session)
+
+    def __delitem__(self, key, *args):
+        user_id, user_role = self[key].indexed
+
+        TempDict.__delitem__(self, key, *args)
+
+        self.users[user_id].discard(key)
+        if not self.users[user_id]:
+            del self.users[user_id]
+
+        self.roles[user_role] -= 1
+
+        self.store.remove(key)
+
+    def get(self, key):
+        session = TempDict.get(self, key)
+
+        if session is not None and self.get_time(key) - session.stored_time > self.store_interval:
+            session.stored_time = self.get_time(key)
+            self.store.save(session)
 
-  def revoke_all_sessions(self, user_id):
-      for other_session in GLSessions.values():
-          if other_session.user_id == user_id:
-              log.debug("Revoking old session for %s" % user_id)
-              GLSessions.delete(other_session.id)
+        return session
+
+    def clear(self):
+        TempDict.clear(self)
+        self.users.clear()
+        self.roles.clear()
+        self.store.clear()
+
+    def set_store(self, store):
+        """
+        Use the store restoring the sessions not expired found in it
+        """
+        self.store = store
+
+        now = self.get_clock().seconds()
+        for session_id, user_id, user_role, user_status, expiration in store.load():
+            if expiration > now:
+                GLSession(user_id, user_role, user_status, session_id, expiration - now)
+            else:
+                store.remove(session_id)
+
+    def revoke_all_sessions(self, user_id):
+        for session_id in list(self.users.get(user_id, ())):
+            log.debug("Revoking old session for %s" % user_id)
+            self.delete(session_id)
+
+    def get_stats(self):
+        return {
+            'active': len(self),
+            'roles': dict((role, count) for role, count in self.roles.iteritems() if count)
+        }
 
 GLSessions = GLSessionsFactory(timeout=GLSettings.authentication_lifetime)
 
@@ -142,42 +350,81 @@ class StaticFileProducer(object):
 
 
 class GLSession(object):
-    expireCall = None # attached to object by tempDict
-
-    def __init__(self, user_id, user_role, user_status):
-        self.id = generateRandomKey(42)
+    def __init__(self, user_id, user_role, user_status, session_id=None, timeout=None):
+        self.id = session_id if session_id is not None else generateRandomKey(42)
         self.user_id = user_id
         self.user_role = user_role
         self.user_status = user_status
 
-        GLSessions.set(self.id, self)
+        GLSessions.set(self.id, self, timeout)
 
     def getTime(self):
-        return self.expireCall.getTime()
+        return GLSessions.get_time(self.id)
 
     def __repr__(self):
-        return "%s %s expire in %s" % (self.user_role, self.user_id, self.expireCall)
+        return "%s %s expire at %s" % (self.user_role, self.user_id, self.getTime())
 
 
 class BaseHandler(object):
     serialize_lists = True
     handler_exec_time_threshold = HANDLER_EXEC_TIME_THRESHOLD
     uniform_answer_time = False
+
+    # True or the set of the tags of the data (e.g. {'contexts'}) that the
+    # handler respectively reads and modifies; see globaleaks.rest.apicache
     cache_resource = False
     invalidate_cache = False
 
+    # the entry of the GLApiCache of the resource served by the handler
+    cached_response = None
+
+    # the class of endpoints (e.g. 'login') whose admission is limited;
+    # see globaleaks.rest.admission
+    admission_class = None
+
     def __init__(self, request):
         self.name = type(self).__name__
         self.request = request
         self.request.start_time = datetime.now()
 
     def write(self, chunk):
+        if self.cached_response is not None and self.cached_response.data is chunk:
+            return self.write_cached_response(self.cached_response)
+
         if isinstance(chunk, types.DictType) or isinstance(chunk, types.ListType):
             chunk = json.dumps(chunk)
             self.request.setHeader(b'content-type', b'application/json')
 
         self.request.write(bytes(chunk))
 
+    def write_cached_response(self, entry):
+        """
+        Write a response of the GLApiCache answering to the conditional
+        requests and to the clients accepting gzip without any encoding
+        """
+        # the cached resources are public and so they could be stored by
+        # the clients in order to be revalidated by means of their ETag
+        self.request.setHeader(b'cache-control', b'no-cache, must-revalidate')
+        self.request.setHeader(b'vary', b'accept-encoding')
+
+        accept_encoding = self.request.getHeader(b'accept-encoding')
+        gzip = accept_encoding is not None and b'gzip' in accept_encoding
+
+        self.request.setHeader(b'etag', entry.gzip_etag if gzip else entry.etag)
+
+        if entry.match(self.request.getHeader(b'if-none-match')):
+            self.request.setResponseCode(304)
+            return
+
+        if entry.content_type is not None:
+            self.request.setHeader(b'content-type', entry.content_type)
+
+        if gzip:
+            self.request.setHeader(b'content-encoding', b'gzip')
+            self.request.write(entry.gzip_body)
+        else:
+            self.request.write(entry.body)
+
     @staticmethod
     def authentication(f, roles):
         """
@@ -257,73 +504,18 @@ class BaseHandler(object):
         """
         Return True if the python class instantiates the specified python_type.
         """
-        if value is None:
-            return True
-
-        if python_type == requests.SkipSpecificValidation:
-            return True
-
-        if python_type == int:
-            try:
-                int(value)
-                return True
-            except Exception:
-                return False
-
-        if python_type == bool:
-            if value == u'true' or value == u'false':
-                return True
-
-        return isinstance(value, python_type)
+        return validator.validate_python_type(value, python_type)
 
     @staticmethod
     def validate_regexp(value, type):
         """
         Return True if the python class matches the given regexp.
         """
-        try:
-            value = unicode(value)
-        except Exception:
-            return False
-
-        return bool(re.match(type, value))
+        return validator.validate_regexp(value, type)
 
     @staticmethod
     def validate_type(value, type):
-        if value is None:
-            log.err("-- Invalid python_type, in [%s] expected %s" % (value, type))
-            return False
-
-        # if it's callable, than assumes is a primitive class
-        if callable(type):
-            retval = BaseHandler.validate_python_type(value, type)
-            if not retval:
-                log.err("-- Invalid python_type, in [%s] expected %s" % (value, type))
-            return retval
-        # value as "{foo:bar}"
-        elif isinstance(type, collections.Mapping):
-            retval = BaseHandler.validate_jmessage(value, type)
-            if not retval:
-                log.err("-- Invalid JSON/dict [%s] expected %s" % (value, type))
-            return retval
-        # regexp
-        elif isinstance(type, str):
-            retval = BaseHandler.validate_regexp(value, type)
-            if not retval:
-                log.err("-- Failed Match in regexp [%s] against %s" % (value, type))
-            return retval
-        # value as "[ type ]"
-        elif isinstance(type, collections.Iterable):
-            # empty list is ok
-            if len(value) == 0:
-                return True
-            else:
-                retval = all(BaseHandler.validate_type(x, type[0]) for x in value)
-                if not retval:
-                    log.err("-- List validation failed [%s] of %s" % (value, type))
-                return retval
-        else:
-            raise AssertionError
+        return validator.get_type_validator(type)(value)
 
     @staticmethod
     def validate_jmessage(jmessage, message_template):
@@ -331,70 +523,14 @@ class BaseHandler(object):
         Takes a string that represents a JSON messages and checks to see if it
         conforms to the message type it is supposed to be.
 
-        This message must be either a dict or a list. This function may be called
-        recursively to validate sub-parameters that are also go GLType.
+        This message must be either a dict or a list. The message template is
+        compiled only once and the compiled validator is reused on every call.
 
         message: the message string that should be validated
 
         message_type: the GLType class it should match.
         """
-        if isinstance(message_template, dict):
-            success_check = 0
-            keys_to_strip = []
-            for key, value in jmessage.iteritems():
-                if key not in message_template:
-                    # strip whatever is not validated
-                    #
-                    # reminder: it's not possible to raise an exception for the
-                    # in case more values are present because it's normal that the
-                    # client will send automatically more data.
-                    #
-                    # e.g. the client will always send 'creation_date' attributes of
-                    #      objects and attributes like this are present generally only
-                    #      from the second request on.
-                    #
-                    keys_to_strip.append(key)
-                    continue
-
-                if not BaseHandler.validate_type(value, message_template[key]):
-                    log.err("Received key %s: type validation fail " % key)
-                    raise errors.InvalidInputFormat("Key (%s) type validation failure" % key)
-                success_check += 1
-
-            for key in keys_to_strip:
-                del jmessage[key]
-
-            for key, value in message_template.iteritems():
-                if key not in jmessage.keys():
-                    log.debug("Key %s expected but missing!" % key)
-                    log.debug("Received schema %s - Expected %s" %
-                              (jmessage.keys(), message_template.keys()))
-                    raise errors.InvalidInputFormat("Missing key %s" % key)
-
-                if not BaseHandler.validate_type(jmessage[key], value):
-                    log.err("Expected key: %s type validation failure" % key)
-                    raise errors.InvalidInputFormat("Key (%s) double validation failure" % key)
-                success_check += 1
-
-                if isinstance(message_template[key], dict) or isinstance(message_template[key], list):
-                    if (message_template[key]):
-                        BaseHandler.validate_jmessage(jmessage[key], message_template[key])
-
-            if success_check == len(message_template.keys()) * 2:
-                return True
-            else:
-                log.err("Success counter double check failure: %d" % success_check)
-                raise errors.InvalidInputFormat("Success counter double check failure")
-
-        elif isinstance(message_template, list):
-            ret = all(BaseHandler.validate_type(x, message_template[0]) for x in jmessage)
-            if not ret:
-                raise errors.InvalidInputFormat("Not every element in %s is %s" %
-                                                (jmessage, message_template[0]))
-            return True
-
-        else:
-            raise errors.InvalidInputFormat("invalid json massage: expected dict or list")
+        return validator.validate_jmessage(jmessage, message_template)
 
     @staticmethod
     def validate_message(message, message_template):
@@ -443,38 +579,79 @@ class BaseHandler(object):
 
         return GLSessions.get(session_id)
 
+    def get_upload_key(self):
+        """
+        Return the key of the file being uploaded, scoped to the resource
+        and to the session in order to not mix the uploads of different users
+        """
+        session_id = self.current_user.id if self.current_user else None
+
+        return self.request.path, session_id, self.request.args['flowIdentifier'][0]
+
+    def get_file_upload_status(self):
+        """
+        Return the chunks already received of the file being uploaded.
+
+        The requests for a specific chunk (the testChunks of flow.js) are
+        answered with 204 if the chunk has not been received yet.
+        """
+        chunks = GLUploads.get_chunks(self.get_upload_key())
+
+        if 'flowChunkNumber' in self.request.args and \
+           int(self.request.args['flowChunkNumber'][0]) not in chunks:
+            self.request.setResponseCode(204)
+            return None
+
+        return {'chunks': chunks}
+
     def get_file_upload(self):
         try:
-            chunk_size = len(self.request.args['file'][0])
-            total_file_size = int(self.request.args['flowTotalSize'][0]) if 'flowTotalSize' in self.request.args else chunk_size
-            flow_identifier = self.request.args['flowIdentifier'][0] if 'flowIdentifier' in self.request.args else generateRandomKey(10)
+            content = self.request.content
+            if not isinstance(content, MultipartStream):
+                log.err("File upload request rejected: not a multipart/form-data request")
+                return None
 
-            if ((chunk_size / (1024 * 1024)) > GLSettings.memory_copy.maximum_filesize or
-                (total_file_size / (1024 * 1024)) > GLSettings.memory_copy.maximum_filesize):
+            if content.too_big:
                 log.err("File upload request rejected: file too big")
                 raise errors.FileTooBig(GLSettings.memory_copy.maximum_filesize)
 
-            if flow_identifier not in GLUploads:
-                f = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
-                GLUploads[flow_identifier] = f
-            else:
-                f = GLUploads[flow_identifier]
+            chunk = content.pop_file('file')
+            if chunk is None:
+                log.err("File upload request rejected: missing or invalid file (%s)" % content.error)
+                return None
 
-            f.write(self.request.args['file'][0])
+            args = self.request.args
 
-            if 'flowChunkNumber' in self.request.args and 'flowTotalChunks' in self.request.args:
-                if self.request.args['flowChunkNumber'][0] != self.request.args['flowTotalChunks'][0]:
+            chunk_size = chunk.size
+            total_file_size = int(args['flowTotalSize'][0]) if 'flowTotalSize' in args else chunk_size
+
+            if ((chunk_size / (1024 * 1024)) > GLSettings.memory_copy.maximum_filesize or
+                (total_file_size / (1024 * 1024)) > GLSettings.memory_copy.maximum_filesize):
+                log.err("File upload request rejected: file too big")
+                chunk.close()
+                raise errors.FileTooBig(GLSettings.memory_copy.maximum_filesize)
+
+            if 'flowIdentifier' in args and 'flowChunkNumber' in args and 'flowTotalChunks' in args:
+                f = GLUploads.add_chunk(self.get_upload_key(),
+                                        chunk,
+                                        int(args['flowChunkNumber'][0]),
+                                        int(args['flowTotalChunks'][0]),
+                                        int(args['flowChunkSize'][0]) if 'flowChunkSize' in args else chunk_size,
+                                        total_file_size)
+                if f is None:
                     return None
+            else:
+                f = chunk
 
-            mime_type, encoding = mimetypes.guess_type(self.request.args['flowFilename'][0])
+            mime_type, encoding = mimetypes.guess_type(args['flowFilename'][0])
 
             uploaded_file = {
-                'name': self.request.args['flowFilename'][0],
+                'name': args['flowFilename'][0],
                 'type': mime_type,
                 'size': total_file_size,
                 'path': f.filepath,
                 'body': f,
-                'description': self.request.args.get('description', [''])[0]
+                'description': args.get('description', [''])[0]
             }
 
             return uploaded_file
@@ -11,7 +11,17 @@ from globaleaks.utils.structures import Rosetta
 from globaleaks.utils.utility import datetime_to_ISO8601, datetime_now
 
 
-def serialize_identityaccessrequest(identityaccessrequest, language):
+def serialize_identityaccessrequest(identityaccessrequest, language, reply_users=None):
+    """
+    @param reply_users: the dictionary of the users that replied to the
+                        requests by id, loaded by the callers serializing
+                        many requests; if None the user is loaded from the store
+    """
+    if reply_users is not None:
+        reply_user = reply_users.get(identityaccessrequest.reply_user_id)
+    else:
+        reply_user = identityaccessrequest.reply_user
+
     iar = {
         'id': identityaccessrequest.id,
         'receivertip_id': identityaccessrequest.receivertip_id,
@@ -19,8 +29,7 @@ def serialize_identityaccessrequest(identityaccessrequest, language):
         'request_user_name': identityaccessrequest.receivertip.receiver.user.name,
         'request_motivation': identityaccessrequest.request_motivation,
         'reply_date': datetime_to_ISO8601(identityaccessrequest.reply_date),
-        'reply_user_name': identityaccessrequest.reply_user.name \
-                if identityaccessrequest.reply_user is not None else '',
+        'reply_user_name': reply_user.name if reply_user is not None else '',
         'reply': identityaccessrequest.reply,
         'reply_motivation': identityaccessrequest.reply_motivation,
         'submission_date': datetime_to_ISO8601(identityaccessrequest.receivertip.internaltip.creation_date)
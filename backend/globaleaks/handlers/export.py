@@ -123,6 +123,7 @@ class ZipStreamProducer(object):
 class ExportHandler(BaseHandler):
     check_roles = 'receiver'
     handler_exec_time_threshold = 3600
+    admission_class = 'export'
 
     @inlineCallbacks
     def get(self, rtip_id):
@@ -62,6 +62,13 @@ class FileAdd(BaseHandler):
     """
     check_roles = 'whistleblower'
     handler_exec_time_threshold = 3600
+    admission_class = 'upload'
+
+    def get(self):
+        """
+        Response: the chunks received of the file being uploaded
+        """
+        return self.get_file_upload_status()
 
     @inlineCallbacks
     def post(self):
@@ -108,6 +115,17 @@ class FileInstance(BaseHandler):
     """
     handler_exec_time_threshold = 3600
     check_roles = 'unauthenticated'
+    admission_class = 'upload'
+
+    def get(self, token_id):
+        """
+        Parameter: internaltip_id
+        Response: the chunks received of the file being uploaded
+        Errors: TokenFailure
+        """
+        TokenList.get(token_id)
+
+        return self.get_file_upload_status()
 
     @inlineCallbacks
     def post(self, token_id):
@@ -39,7 +39,7 @@ class L10NHandler(BaseHandler):
     if the file are not present, default translations are returned
     """
     check_roles = '*'
-    cache_resource = True
+    cache_resource = {'l10n'}
 
     def get(self, lang):
         return get_l10n(lang)
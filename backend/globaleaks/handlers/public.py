@@ -12,7 +12,7 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.models import l10n
 from globaleaks.models.config import NodeFactory
 from globaleaks.models.l10n import NodeL10NFactory
-from globaleaks.orm import transact
+from globaleaks.orm import transact_ro
 from globaleaks.settings import GLSettings
 from globaleaks.utils.sets import disjoint_union
 from globaleaks.utils.structures import get_localized_values
@@ -145,7 +145,7 @@ def db_serialize_node(store, language):
     return ret
 
 
-@transact
+@transact_ro
 def serialize_node(store, language):
     return db_serialize_node(store, language)
 
@@ -393,7 +393,7 @@ def db_get_public_receiver_list(store, language):
     return [serialize_receiver(store, receiver, language, data) for receiver in receivers]
 
 
-@transact
+@transact_ro
 def get_public_resources(store, language):
     return {
         'node': db_serialize_node(store, language),
@@ -405,7 +405,7 @@ def get_public_resources(store, language):
 
 class PublicResource(BaseHandler):
     check_roles = '*'
-    cache_resource = True
+    cache_resource = {'node', 'contexts', 'receivers', 'questionnaires', 'files'}
 
     def get(self):
         """
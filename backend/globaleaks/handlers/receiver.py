@@ -5,20 +5,27 @@
 # Implement the classes handling the requests performed to /receiver/* URI PATH
 # Used by receivers to update personal preferences and access to personal data
 
-from storm.expr import And, In
+import base64
+import json
+from datetime import datetime
+
+from storm.expr import And, Count, Desc, In, Not, Or
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.rtip import db_postpone_expiration_date, db_delete_rtip
 from globaleaks.handlers.submission import db_get_archived_preview_schema
-from globaleaks.handlers.user import db_user_update_user
+from globaleaks.handlers.user import db_user_update_user, hash_password_change
 from globaleaks.handlers.user import user_serialize_user
-from globaleaks.models import Receiver, ReceiverTip
-from globaleaks.orm import transact
+from globaleaks.models import Comment, Context, InternalFile, InternalTip, Message, Receiver, ReceiverTip
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests, errors
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import Rosetta, get_localized_values
 from globaleaks.utils.utility import log, datetime_to_ISO8601
 
+CURSOR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
 
 def receiver_serialize_receiver(receiver, language):
     ret_dict = user_serialize_user(receiver.user, language)
@@ -34,7 +41,7 @@ def receiver_serialize_receiver(receiver, language):
     return get_localized_values(ret_dict, receiver, receiver.localized_keys, language)
 
 
-@transact
+@transact_ro
 def get_receiver_settings(store, receiver_id, language):
     receiver = store.find(Receiver, Receiver.id == receiver_id).one()
 
@@ -59,36 +66,142 @@ def update_receiver_settings(store, receiver_id, request, language):
     return receiver_serialize_receiver(receiver, language)
 
 
-@transact
-def get_receivertip_list(store, receiver_id, language):
+# (table, attribute) of the columns by which the tips could be sorted
+rtip_sort_keys = {
+    'creation_date': (InternalTip, 'creation_date'),
+    'update_date': (InternalTip, 'update_date'),
+    'expiration_date': (InternalTip, 'expiration_date'),
+    'last_access': (ReceiverTip, 'last_access'),
+    'progressive': (InternalTip, 'progressive'),
+    'total_score': (InternalTip, 'total_score')
+}
+
+
+def encode_cursor(value, rtip_id):
+    """
+    Encode the position of a tip in the sorted list as an opaque string
+    """
+    if isinstance(value, datetime):
+        value = value.strftime(CURSOR_DATE_FORMAT)
+
+    return base64.urlsafe_b64encode(json.dumps([value, rtip_id]))
+
+
+def decode_cursor(cursor):
+    try:
+        value, rtip_id = json.loads(base64.urlsafe_b64decode(str(cursor)))
+
+        if isinstance(value, basestring):
+            value = datetime.strptime(value, CURSOR_DATE_FORMAT)
+
+        return value, rtip_id
+    except Exception:
+        raise errors.InvalidInputFormat("Invalid cursor")
+
+
+def count_by(store, column, ids):
+    """
+    Return the number of the rows of each of the values of column in ids
+    """
+    return dict(store.find((column, Count()), In(column, ids)).group_by(column))
+
+
+@transact_ro
+def get_receivertip_list(store, receiver_id, language, sort='creation_date', order='desc',
+                         limit=None, cursor=None, context_id=None, new=None):
+    """
+    Return a page of the tips of the receiver sorted by sort and the cursor
+    of the next page (None if it is the last page); the counters of the
+    files, comments and messages of the page are computed by a grouped
+    query for each of them.
+
+    @param limit: the size of the page, capped to GLSettings.receiver_tips_page_size
+    @param cursor: the cursor returned with the previous page
+    @param context_id: return only the tips of the context
+    @param new: return only the tips new (True) or already accessed (False)
+    """
+    if sort not in rtip_sort_keys or order not in ('asc', 'desc'):
+        raise errors.InvalidInputFormat("Invalid sort")
+
+    if limit is None or not 0 < limit <= GLSettings.receiver_tips_page_size:
+        limit = GLSettings.receiver_tips_page_size
+
+    table, attribute = rtip_sort_keys[sort]
+    column = getattr(table, attribute)
+
+    conditions = [ReceiverTip.receiver_id == receiver_id,
+                  ReceiverTip.internaltip_id == InternalTip.id]
+
+    if context_id is not None:
+        conditions.append(InternalTip.context_id == context_id)
+
+    if new is not None:
+        is_new = Or(ReceiverTip.access_counter == 0, ReceiverTip.last_access < InternalTip.update_date)
+        conditions.append(is_new if new else Not(is_new))
+
+    if cursor is not None:
+        value, rtip_id = decode_cursor(cursor)
+        if order == 'asc':
+            conditions.append(Or(column > value, And(column == value, ReceiverTip.id > rtip_id)))
+        else:
+            conditions.append(Or(column < value, And(column == value, ReceiverTip.id < rtip_id)))
+
+    result = store.find((ReceiverTip, InternalTip), *conditions)
+
+    if order == 'asc':
+        result = result.order_by(column, ReceiverTip.id)
+    else:
+        result = result.order_by(Desc(column), Desc(ReceiverTip.id))
+
+    # a tip more than the limit is loaded in order to know if there is a next page
+    rows = list(result[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        rtip, itip = rows[-1]
+        next_cursor = encode_cursor(getattr(itip if table is InternalTip else rtip, attribute), rtip.id)
+
+    itips_ids = [itip.id for _, itip in rows]
+    file_counters = count_by(store, InternalFile.internaltip_id, itips_ids)
+    comment_counters = count_by(store, Comment.internaltip_id, itips_ids)
+    message_counters = count_by(store, Message.receivertip_id, [rtip.id for rtip, _ in rows])
+
+    context_names = {}
+    preview_schemas = {}
+
     rtip_summary_list = []
+    for rtip, itip in rows:
+        if itip.context_id not in context_names:
+            mo = Rosetta(Context.localized_keys)
+            mo.acquire_storm_object(store.find(Context, Context.id == itip.context_id).one())
+            context_names[itip.context_id] = mo.dump_localized_key('name', language)
 
-    for rtip in store.find(ReceiverTip, ReceiverTip.receiver_id == receiver_id):
-        mo = Rosetta(rtip.internaltip.context.localized_keys)
-        mo.acquire_storm_object(rtip.internaltip.context)
+        if itip.questionnaire_hash not in preview_schemas:
+            preview_schemas[itip.questionnaire_hash] = db_get_archived_preview_schema(store, itip.questionnaire_hash, language)
 
         rtip_summary_list.append({
             'id': rtip.id,
-            'creation_date': datetime_to_ISO8601(rtip.internaltip.creation_date),
+            'creation_date': datetime_to_ISO8601(itip.creation_date),
             'last_access': datetime_to_ISO8601(rtip.last_access),
-            'update_date': datetime_to_ISO8601(rtip.internaltip.update_date),
-            'expiration_date': datetime_to_ISO8601(rtip.internaltip.expiration_date),
-            'progressive': rtip.internaltip.progressive,
-            'new': rtip.access_counter == 0 or rtip.last_access < rtip.internaltip.update_date,
-            'context_name': mo.dump_localized_key('name', language),
+            'update_date': datetime_to_ISO8601(itip.update_date),
+            'expiration_date': datetime_to_ISO8601(itip.expiration_date),
+            'progressive': itip.progressive,
+            'new': rtip.access_counter == 0 or rtip.last_access < itip.update_date,
+            'context_name': context_names[itip.context_id],
             'access_counter': rtip.access_counter,
-            'file_counter': rtip.internaltip.internalfiles.count(),
-            'comment_counter': rtip.internaltip.comments.count(),
-            'message_counter': rtip.messages.count(),
-            'tor2web': rtip.internaltip.tor2web,
-            'questionnaire_hash': rtip.internaltip.questionnaire_hash,
-            'preview_schema': db_get_archived_preview_schema(store, rtip.internaltip.questionnaire_hash, language),
-            'preview': rtip.internaltip.preview,
-            'total_score': rtip.internaltip.total_score,
+            'file_counter': file_counters.get(itip.id, 0),
+            'comment_counter': comment_counters.get(itip.id, 0),
+            'message_counter': message_counters.get(rtip.id, 0),
+            'tor2web': itip.tor2web,
+            'questionnaire_hash': itip.questionnaire_hash,
+            'preview_schema': preview_schemas[itip.questionnaire_hash],
+            'preview': itip.preview,
+            'total_score': itip.total_score,
             'label': rtip.label
         })
 
-    return rtip_summary_list
+    return rtip_summary_list, next_cursor
 
 
 @transact
@@ -136,6 +249,7 @@ class ReceiverInstance(BaseHandler):
         return get_receiver_settings(self.current_user.user_id,
                                      self.request.language)
 
+    @inlineCallbacks
     def put(self):
         """
         Parameters: None
@@ -145,9 +259,13 @@ class ReceiverInstance(BaseHandler):
         """
         request = self.validate_message(self.request.content.read(), requests.ReceiverReceiverDesc)
 
-        return update_receiver_settings(self.current_user.user_id,
-                                        request,
-                                        self.request.language)
+        yield hash_password_change(self.current_user.user_id, request)
+
+        receiver = yield update_receiver_settings(self.current_user.user_id,
+                                                  request,
+                                                  self.request.language)
+
+        returnValue(receiver)
 
 class TipsCollection(BaseHandler):
     """
@@ -156,13 +274,37 @@ class TipsCollection(BaseHandler):
     """
     check_roles = 'receiver'
 
+    @inlineCallbacks
     def get(self):
         """
+        Parameters: sort, order, limit, cursor, context_id, new
         Response: receiverTipList
-        Errors: InvalidAuthentication
+        Errors: InvalidAuthentication, InvalidInputFormat
+
+        The cursor of the next page, if any, is returned in the X-Next-Cursor header.
         """
-        return get_receivertip_list(self.current_user.user_id,
-                                    self.request.language)
+        args = dict((k, v[0]) for k, v in self.request.args.items())
+
+        try:
+            limit = int(args['limit']) if 'limit' in args else None
+        except ValueError:
+            raise errors.InvalidInputFormat("Invalid limit")
+
+        new = {'true': True, 'false': False}.get(args.get('new'))
+
+        rtips, next_cursor = yield get_receivertip_list(self.current_user.user_id,
+                                                        self.request.language,
+                                                        args.get('sort', 'creation_date'),
+                                                        args.get('order', 'desc'),
+                                                        limit,
+                                                        args.get('cursor'),
+                                                        unicode(args['context_id']) if 'context_id' in args else None,
+                                                        new)
+
+        if next_cursor is not None:
+            self.request.setHeader(b'X-Next-Cursor', next_cursor)
+
+        returnValue(rtips)
 
 
 class TipsOperations(BaseHandler):
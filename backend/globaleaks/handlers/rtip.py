@@ -9,9 +9,9 @@
 import os
 import string
 
-from storm.expr import In
+from storm.expr import In, LeftJoin
 from twisted.internet import threads
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks.handlers.base import BaseHandler, \
     directory_traversal_check, write_upload_plaintext_to_disk
@@ -20,11 +20,11 @@ from globaleaks.handlers.submission import serialize_usertip
 from globaleaks.models import serializers, \
     ArchivedSchema, \
     Comment, Message, \
-    InternalTip, \
-    ReceiverFile, ReceiverTip, \
+    Context, InternalFile, InternalTip, \
+    Receiver, ReceiverFile, ReceiverTip, User, \
     WhistleblowerFile, \
     SecureFileDelete, IdentityAccessRequest
-from globaleaks.orm import transact
+from globaleaks.orm import db_notify_on_commit, transact, transact_ro
 from globaleaks.rest import errors, requests
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import log, get_expiration, datetime_now, \
@@ -106,7 +106,10 @@ def serialize_message(msg):
 
 
 def serialize_rtip(store, rtip, language):
-    user_id = rtip.receiver.id
+    # each list is loaded together with the objects referenced by its
+    # serialization so that the number of queries does not depend on the
+    # number of comments, messages and files of the tip
+    user_id = rtip.receiver_id
 
     ret = serialize_usertip(store, rtip, language)
 
@@ -114,7 +117,7 @@ def serialize_rtip(store, rtip, language):
     ret['receiver_id'] = user_id
     ret['label'] = rtip.label
     ret['comments'] = db_get_itip_comment_list(store, rtip.internaltip)
-    ret['messages'] = db_get_itip_message_list(rtip)
+    ret['messages'] = db_get_itip_message_list(store, rtip)
     ret['rfiles'] = db_receiver_get_rfile_list(store, rtip.id)
     ret['wbfiles'] = db_receiver_get_wbfile_list(store, rtip.internaltip_id)
     ret['iars'] = db_get_identityaccessrequest_list(store, rtip.id, language)
@@ -151,19 +154,19 @@ def db_access_wbfile(store, user_id, wbfile_id):
 
 
 def db_receiver_get_rfile_list(store, rtip_id):
-    receiver_files = store.find(ReceiverFile,
-                                ReceiverFile.receivertip_id == ReceiverTip.id,
-                                ReceiverTip.id == rtip_id)
+    receiver_files = store.find((ReceiverFile, InternalFile),
+                                ReceiverFile.receivertip_id == rtip_id,
+                                InternalFile.id == ReceiverFile.internalfile_id)
 
-    return [receiver_serialize_rfile(receiverfile) for receiverfile in receiver_files]
+    return [receiver_serialize_rfile(receiverfile) for receiverfile, _ in receiver_files]
 
 
 def db_receiver_get_wbfile_list(store, itip_id):
-    rtips = store.find(ReceiverTip, ReceiverTip.internaltip_id == itip_id)
-    rtips_ids = [rt.id for rt in rtips]
-    wbfiles = store.find(WhistleblowerFile, In(WhistleblowerFile.receivertip_id, rtips_ids))
+    wbfiles = store.find((WhistleblowerFile, ReceiverTip),
+                         WhistleblowerFile.receivertip_id == ReceiverTip.id,
+                         ReceiverTip.internaltip_id == itip_id)
 
-    return [receiver_serialize_wbfile(wbfile) for wbfile in wbfiles]
+    return [receiver_serialize_wbfile(wbfile) for wbfile, _ in wbfiles]
 
 
 @transact
@@ -199,7 +202,7 @@ def receiver_get_rfile_list(store, rtip_id):
     return db_receiver_get_rfile_list(store, rtip_id)
 
 
-def db_get_rtip(store, user_id, rtip_id, language):
+def db_register_rtip_access(store, user_id, rtip_id):
     rtip = db_access_rtip(store, user_id, rtip_id)
 
     rtip.access_counter += 1
@@ -208,8 +211,6 @@ def db_get_rtip(store, user_id, rtip_id, language):
     log.debug("Tip %s access granted to user %s (%d)" %
               (rtip.internaltip_id, rtip.receiver.user.name, rtip.access_counter))
 
-    return serialize_rtip(store, rtip, language)
-
 
 def db_mark_file_for_secure_deletion(store, relpath):
     abspath = os.path.join(GLSettings.submission_path, relpath)
@@ -217,6 +218,8 @@ def db_mark_file_for_secure_deletion(store, relpath):
         secure_file_delete = SecureFileDelete()
         secure_file_delete.filepath = abspath
         store.add(secure_file_delete)
+
+        db_notify_on_commit(store, 'secure_delete')
     else:
         log.err("Tried to permanently delete a non existent file: %s" % abspath)
 
@@ -327,12 +330,20 @@ def set_receivertip_variable(store, user_id, rtip_id, key, value):
 
 
 @transact
+def register_rtip_access(store, user_id, rtip_id):
+    return db_register_rtip_access(store, user_id, rtip_id)
+
+
+@transact_ro
 def get_rtip(store, user_id, rtip_id, language):
-    return db_get_rtip(store, user_id, rtip_id, language)
+    return serialize_rtip(store, db_access_rtip(store, user_id, rtip_id), language)
 
 
 def db_get_itip_comment_list(store, internaltip):
-    return [serialize_comment(comment) for comment in internaltip.comments]
+    comments = store.using(Comment, LeftJoin(User, User.id == Comment.author_id)) \
+                    .find((Comment, User), Comment.internaltip_id == internaltip.id)
+
+    return [serialize_comment(comment) for comment, _ in comments]
 
 
 @transact
@@ -363,8 +374,14 @@ def create_comment(store, user_id, rtip_id, request):
     return serialize_comment(comment)
 
 
-def db_get_itip_message_list(rtip):
-    return [serialize_message(message) for message in rtip.messages]
+def db_get_itip_message_list(store, rtip):
+    messages = store.find((Message, ReceiverTip, Receiver, User),
+                          Message.receivertip_id == rtip.id,
+                          ReceiverTip.id == Message.receivertip_id,
+                          Receiver.id == ReceiverTip.receiver_id,
+                          User.id == Receiver.id)
+
+    return [serialize_message(message) for message, _, _, _ in messages]
 
 
 @transact
@@ -396,9 +413,20 @@ def delete_wbfile(store, user_id, file_id):
 
 
 def db_get_identityaccessrequest_list(store, rtip_id, language):
-    iars = store.find(IdentityAccessRequest, IdentityAccessRequest.receivertip_id == rtip_id)
+    iars = list(store.find((IdentityAccessRequest, ReceiverTip, Receiver, User, InternalTip, Context),
+                           IdentityAccessRequest.receivertip_id == rtip_id,
+                           ReceiverTip.id == IdentityAccessRequest.receivertip_id,
+                           Receiver.id == ReceiverTip.receiver_id,
+                           User.id == Receiver.id,
+                           InternalTip.id == ReceiverTip.internaltip_id,
+                           Context.id == InternalTip.context_id))
 
-    return [serialize_identityaccessrequest(iar, language) for iar in iars]
+    # the users that replied to the requests are loaded at once
+    reply_users_ids = set(iar.reply_user_id for iar, _, _, _, _, _ in iars if iar.reply_user_id is not None)
+    reply_users = dict((user.id, user) for user in store.find(User, In(User.id, list(reply_users_ids)))) \
+        if reply_users_ids else {}
+
+    return [serialize_identityaccessrequest(iar, language, reply_users) for iar, _, _, _, _, _ in iars]
 
 
 class RTipInstance(BaseHandler):
@@ -407,6 +435,7 @@ class RTipInstance(BaseHandler):
     """
     check_roles = 'receiver'
 
+    @inlineCallbacks
     def get(self, tip_id):
         """
         Parameters: None
@@ -420,7 +449,11 @@ class RTipInstance(BaseHandler):
         This method is decorated as @BaseHandler.unauthenticated because in the handler
         the various cases are managed differently.
         """
-        return get_rtip(self.current_user.user_id, tip_id, self.request.language)
+        yield register_rtip_access(self.current_user.user_id, tip_id)
+
+        rtip = yield get_rtip(self.current_user.user_id, tip_id, self.request.language)
+
+        returnValue(rtip)
 
     def put(self, tip_id):
         """
@@ -492,6 +525,7 @@ class WhistleblowerFileHandler(BaseHandler):
     Receiver interface to upload a file intended for the whistleblower
     """
     check_roles = 'receiver'
+    admission_class = 'upload'
 
     @transact
     def can_perform_action(self, store, tip_id, filename):
@@ -523,6 +557,8 @@ class WhistleblowerFileHandler(BaseHandler):
         if err is not None:
             raise err
 
+        yield register_rtip_access(self.current_user.user_id, tip_id)
+
         rtip = yield get_rtip(self.current_user.user_id, tip_id, self.request.language)
 
         try:
@@ -553,6 +589,7 @@ class WhistleblowerFileInstanceHandler(BaseHandler):
     This class is used in both RTip and WBTip to define a base for respective handlers
     """
     check_roles = 'receiver'
+    admission_class = 'export'
 
     def user_can_access(self, wbfile):
         raise NotImplementedError("This class defines the user_can_access interface.")
@@ -606,6 +643,7 @@ class ReceiverFileDownload(BaseHandler):
     This handler exposes rfiles for download.
     """
     check_roles = 'receiver'
+    admission_class = 'export'
 
     @transact
     def download_rfile(self, store, user_id, file_id):
@@ -6,20 +6,23 @@
 # Implements a GlobaLeaks submission, then the operations performed
 #   by an HTTP client in /submission URI
 
+import collections
 import copy
 import json
+import threading
 
-from storm.expr import And, In
+from storm.expr import In
 from twisted.internet import defer
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
 from globaleaks.handlers.admin.context import db_get_context_steps
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
-from globaleaks.security import hash_password, sha256, generateRandomReceipt
+from globaleaks.security import GLKDFPool, sha256, generateRandomReceipt
 from globaleaks.settings import GLSettings
-from globaleaks.utils.structures import Rosetta, get_localized_values
+from globaleaks.utils.structures import Rosetta, freeze, get_localized_values
 from globaleaks.utils.token import TokenList
 from globaleaks.utils.utility import log, get_expiration, \
     datetime_now, datetime_never, datetime_to_ISO8601
@@ -69,16 +72,89 @@ def _db_get_archived_field_recursively(field, language):
     return get_localized_values(field, field, models.Field.localized_keys, language)
 
 
+class SchemaCache(object):
+    """
+    LRU cache of the localized archived questionnaire schemas.
+
+    The archived schemas are immutable being indexed by the hash of their
+    content, so their localizations are kept indefinitely in read-only
+    structures shared by all the serializations of the tips.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            self.stats['hits'] += 1
+            self.entries[key] = entry
+
+            return entry[0]
+
+    def set(self, key, schema):
+        # the memory used is estimated by the size of the json of the schema
+        entry = (schema, len(json.dumps(schema)))
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['size'] = self.size
+            stats['entries'] = len(self.entries)
+            stats['memory'] = sum(entry[1] for entry in self.entries.values())
+
+        requests = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = float(stats['hits']) / requests if requests else 0.0
+
+        return stats
+
+
+GLSchemaCache = SchemaCache(GLSettings.schema_cache_size)
+
+
 def _db_get_archived_questionnaire_schema(store, hash, type, language):
+    """
+    Return the archived schema localized in the language as a read-only
+    structure; the localization falls back on the default language
+    that is therefore part of the key of the cache.
+    """
+    key = (hash, type, language, GLSettings.memory_copy.default_language)
+
+    questionnaire = GLSchemaCache.get(key)
+    if questionnaire is not None:
+        return questionnaire
+
     aqs = store.find(models.ArchivedSchema,
                      models.ArchivedSchema.hash == hash,
                      models.ArchivedSchema.type == type).one()
 
     if not aqs:
         log.err("Unable to find questionnaire schema with hash %s" % hash)
-        questionnaire = []
-    else:
-        questionnaire = copy.deepcopy(aqs.schema)
+        return freeze([])
+
+    questionnaire = copy.deepcopy(aqs.schema)
 
     if type == 'questionnaire':
         for step in questionnaire:
@@ -91,6 +167,10 @@ def _db_get_archived_questionnaire_schema(store, hash, type, language):
         for field in questionnaire:
             _db_get_archived_field_recursively(field, language)
 
+    questionnaire = freeze(questionnaire)
+
+    GLSchemaCache.set(key, questionnaire)
+
     return questionnaire
 
 
@@ -102,15 +182,39 @@ def db_get_archived_preview_schema(store, hash, language):
     return _db_get_archived_questionnaire_schema(store, hash, u'preview', language)
 
 
-def db_serialize_questionnaire_answers_recursively(answers):
+def db_get_questionnaire_answers_groups(store, answers):
+    """
+    Load with a single query the groups of the given answers
+
+    :return: a tuple with the groups of each answer sorted by number and the
+             answers contained by each group; the nested answers are expected
+             to be among the given ones
+    """
+    groups = collections.defaultdict(list)
+    children = collections.defaultdict(list)
+
+    for answer in answers:
+        if answer.fieldanswergroup_id is not None:
+            children[answer.fieldanswergroup_id].append(answer)
+
+    answers_ids = [answer.id for answer in answers if not answer.is_leaf]
+    if answers_ids:
+        for group in store.find(models.FieldAnswerGroup,
+                                In(models.FieldAnswerGroup.fieldanswer_id, answers_ids)).order_by(models.FieldAnswerGroup.number):
+            groups[group.fieldanswer_id].append(group)
+
+    return groups, children
+
+
+def db_serialize_questionnaire_answers_recursively(answers, groups, children):
     ret = {}
 
     for answer in answers:
         if answer.is_leaf:
             ret[answer.key] = answer.value
         else:
-            ret[answer.key] = [db_serialize_questionnaire_answers_recursively(group.fieldanswers)
-                               for group in answer.groups.order_by(models.FieldAnswerGroup.number)]
+            ret[answer.key] = [db_serialize_questionnaire_answers_recursively(children[group.id], groups, children)
+                               for group in groups[answer.id]]
     return ret
 
 
@@ -133,10 +237,15 @@ def db_serialize_questionnaire_answers(store, usertip):
             else:
                 answers_ids.append(f['id'])
 
-    answers = store.find(models.FieldAnswer, And(models.FieldAnswer.internaltip_id == internaltip.id,
-                                                 In(models.FieldAnswer.key, answers_ids)))
+    # all the answers of the tip, nested ones included, are loaded at once
+    # and the tree of the answers is rebuilt in memory
+    answers = list(store.find(models.FieldAnswer, models.FieldAnswer.internaltip_id == internaltip.id))
+    groups, children = db_get_questionnaire_answers_groups(store, answers)
+
+    answers_ids = set(answers_ids)
 
-    return db_serialize_questionnaire_answers_recursively(answers)
+    return db_serialize_questionnaire_answers_recursively([answer for answer in answers if answer.key in answers_ids],
+                                                          groups, children)
 
 
 def db_save_questionnaire_answers(store, internaltip_id, entries):
@@ -197,13 +306,17 @@ def db_archive_questionnaire_schema(store, questionnaire, questionnaire_hash):
 
 
 def db_get_itip_receiver_list(store, itip, language):
+    rtips = store.find((models.ReceiverTip, models.User),
+                       models.ReceiverTip.internaltip_id == itip.id,
+                       models.User.id == models.ReceiverTip.receiver_id)
+
     return [{
-        "id": rtip.receiver.id,
-        "name": rtip.receiver.user.public_name,
-        "pgp_key_public": rtip.receiver.user.pgp_key_public,
+        "id": rtip.receiver_id,
+        "name": user.public_name,
+        "pgp_key_public": user.pgp_key_public,
         "last_access": datetime_to_ISO8601(rtip.last_access),
         "access_counter": rtip.access_counter,
-    } for rtip in itip.receivertips]
+    } for rtip, user in rtips]
 
 
 def serialize_itip(store, internaltip, language):
@@ -265,16 +378,26 @@ def db_create_receivertip(store, receiver, internaltip):
 
     return receivertip.id
 
-def db_create_whistleblowertip(store, internaltip):
+@inlineCallbacks
+def generate_receipt():
     """
-    The plaintext receipt is returned only now, and then is
-    stored hashed in the WBtip table
+    Generate a receipt and its hash computed on the KDF pool
     """
     receipt = unicode(generateRandomReceipt())
 
+    receipt_hash = yield GLKDFPool.hash_password(receipt, GLSettings.memory_copy.private.receipt_salt, 'submission')
+
+    returnValue((receipt, unicode(receipt_hash)))
+
+
+def db_create_whistleblowertip(store, internaltip, receipt, receipt_hash):
+    """
+    The plaintext receipt is returned only now, and then is
+    stored hashed in the WBtip table
+    """
     wbtip = models.WhistleblowerTip()
     wbtip.id = internaltip.id
-    wbtip.receipt_hash = hash_password(receipt, GLSettings.memory_copy.private.receipt_salt)
+    wbtip.receipt_hash = receipt_hash
     store.add(wbtip)
 
     return receipt, wbtip
@@ -285,7 +408,7 @@ def create_whistleblowertip(*args):
     return db_create_whistleblowertip(*args)[0] # here is exported only the receipt
 
 
-def db_create_submission(store, request, uploaded_files, client_using_tor, language):
+def db_create_submission(store, request, uploaded_files, client_using_tor, language, receipt, receipt_hash):
     answers = request['answers']
 
     context = store.find(models.Context, models.Context.id == request['context_id']).one()
@@ -354,7 +477,7 @@ def db_create_submission(store, request, uploaded_files, client_using_tor, langu
         log.err("Submission create: unable to create db entry for files: %s" % excep)
         raise excep
 
-    receipt, wbtip = db_create_whistleblowertip(store, submission)
+    receipt, wbtip = db_create_whistleblowertip(store, submission, receipt, receipt_hash)
 
     if submission.context.maximum_selectable_receivers > 0 and \
                     len(request['receivers']) > submission.context.maximum_selectable_receivers:
@@ -383,8 +506,20 @@ def db_create_submission(store, request, uploaded_files, client_using_tor, langu
 
 
 @transact
-def create_submission(store, request, uploaded_files, client_using_tor, language):
-    return db_create_submission(store, request, uploaded_files, client_using_tor, language)
+def save_submission(store, request, uploaded_files, client_using_tor, language, receipt, receipt_hash):
+    return db_create_submission(store, request, uploaded_files, client_using_tor, language, receipt, receipt_hash)
+
+
+@inlineCallbacks
+def create_submission(request, uploaded_files, client_using_tor, language):
+    """
+    The receipt is hashed before the transaction storing the submission
+    """
+    receipt, receipt_hash = yield generate_receipt()
+
+    submission = yield save_submission(request, uploaded_files, client_using_tor, language, receipt, receipt_hash)
+
+    returnValue(submission)
 
 
 class SubmissionInstance(BaseHandler):
@@ -17,6 +17,7 @@ class TokenCreate(BaseHandler):
     This class implement the handler for requesting a token.
     """
     check_roles = 'unauthenticated'
+    admission_class = 'token'
 
     def post(self):
         """
@@ -45,6 +46,7 @@ class TokenInstance(BaseHandler):
     This class impleement the handler for updating a token (e.g.: solving a captcha)
     """
     check_roles = 'unauthenticated'
+    admission_class = 'token'
 
     def put(self, token_id):
         """
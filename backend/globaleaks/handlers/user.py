@@ -4,11 +4,13 @@
 #
 # Implement the classes handling the requests performed to /user/* URI PATH
 
+from twisted.internet.defer import inlineCallbacks, returnValue
+
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests, errors
-from globaleaks.security import change_password, parse_pgp_key
+from globaleaks.security import parse_pgp_key, GLKDFPool, GLPGPKeyring
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import get_localized_values
 from globaleaks.utils.utility import datetime_to_ISO8601, datetime_now, datetime_null
@@ -29,6 +31,9 @@ def parse_pgp_options(user, request):
     if not remove_key and pgp_key_public != '':
         k = parse_pgp_key(pgp_key_public)
 
+    if user.pgp_key_fingerprint and (k is None or k['public'] != user.pgp_key_public):
+        GLPGPKeyring.invalidate(user.pgp_key_fingerprint)
+
     if k is not None:
         user.pgp_key_public = k['public']
         user.pgp_key_fingerprint = k['fingerprint']
@@ -84,13 +89,41 @@ def get_user_settings(store, user_id, language):
     return user_serialize_user(user, language)
 
 
+@transact_ro
+def get_user_password(store, user_id):
+    user = models.User.get(store, user_id)
+
+    if not user:
+        raise errors.UserIdNotFound
+
+    return user.salt, user.password
+
+
+@inlineCallbacks
+def hash_password_change(user_id, request):
+    """
+    Verifies the old password and hashes the new one on the KDF pool,
+    before the transaction updating the user, adding to the request the
+    keys 'old_password_hash' and 'password_hash'
+    """
+    if len(request['password']) and len(request['old_password']):
+        salt, password_hash = yield get_user_password(user_id)
+
+        request['password_hash'] = yield GLKDFPool.change_password(password_hash,
+                                                                   request['old_password'],
+                                                                   request['password'],
+                                                                   salt)
+
+        request['old_password_hash'] = password_hash
+
+
 def db_user_update_user(store, user_id, request, language):
     """
     Updates the specified user.
     This version of the function is specific for users that with comparison with
     admins can change only few things:
       - preferred language
-      - the password (with old password check)
+      - the password (with old password check performed by hash_password_change)
       - pgp key
     raises: globaleaks.errors.ReceiverIdNotFound` if the receiver does not exist.
     """
@@ -105,10 +138,11 @@ def db_user_update_user(store, user_id, request, language):
     old_password = request['old_password']
 
     if len(new_password) and len(old_password):
-        user.password = change_password(user.password,
-                                        old_password,
-                                        new_password,
-                                        user.salt)
+        # the password could have been changed after the check of the old one
+        if user.password != request['old_password_hash']:
+            raise errors.InvalidOldPassword
+
+        user.password = request['password_hash']
 
         if user.password_change_needed:
             user.password_change_needed = False
@@ -137,7 +171,7 @@ class UserInstance(BaseHandler):
         - pgp key
     """
     check_roles = {'admin', 'receiver', 'custodian'}
-    invalidate_cache = True
+    invalidate_cache = {'receivers'}
 
     def get(self):
         """
@@ -148,6 +182,7 @@ class UserInstance(BaseHandler):
         return get_user_settings(self.current_user.user_id,
                                  self.request.language)
 
+    @inlineCallbacks
     def put(self):
         """
         Parameters: None
@@ -157,5 +192,9 @@ class UserInstance(BaseHandler):
         """
         request = self.validate_message(self.request.content.read(), requests.UserUserDesc)
 
-        return update_user_settings(self.current_user.user_id,
-                                    request, self.request.language)
+        yield hash_password_change(self.current_user.user_id, request)
+
+        user = yield update_user_settings(self.current_user.user_id,
+                                          request, self.request.language)
+
+        returnValue(user)
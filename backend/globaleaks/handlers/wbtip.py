@@ -55,10 +55,11 @@ def db_get_rfile_list(store, itip_id):
 
 
 def db_get_wbfile_list(store, itip_id):
-    wbfiles = store.find(WhistleblowerFile, WhistleblowerFile.receivertip_id == ReceiverTip.id,
-                                           ReceiverTip.internaltip_id == itip_id)
+    wbfiles = store.find((WhistleblowerFile, ReceiverTip),
+                         WhistleblowerFile.receivertip_id == ReceiverTip.id,
+                         ReceiverTip.internaltip_id == itip_id)
 
-    return [wb_serialize_wbfile(wbfile) for wbfile in wbfiles]
+    return [wb_serialize_wbfile(wbfile) for wbfile, _ in wbfiles]
 
 
 def db_get_wbtip(store, wbtip_id, language):
@@ -4,6 +4,7 @@ from globaleaks.jobs import exit_nodes_refresh_sched, \
                             notification_sched, \
                             delivery_sched, \
                             cleaning_sched, \
+                            secure_delete_sched, \
                             pgp_check_sched, \
                             x509_cert_check_sched
 
@@ -14,6 +15,7 @@ jobs_list = [
     notification_sched.NotificationSchedule,
     session_management_sched.SessionManagementSchedule,
     cleaning_sched.CleaningSchedule,
+    secure_delete_sched.SecureDeleteSchedule,
     pgp_check_sched.PGPCheckSchedule,
     statistics_sched.StatisticsSchedule,
     x509_cert_check_sched.X509CertCheckSchedule,
@@ -26,6 +28,7 @@ __all__ = [
     'notification_sched',
     'statistics_sched',
     'cleaning_sched',
+    'secure_delete_sched',
     'session_management_sched',
     'pgp_check_sched',
     'x509_cert_check_sched',
@@ -48,6 +48,12 @@ class GLJob(task.LoopingCall):
     def get_start_time(self):
         return 0
 
+    def get_stats(self):
+        """
+        Return the statistics specific to the job shown in the admin jobs view
+        """
+        return {}
+
     def schedule(self):
         delay = self.get_start_time()
 
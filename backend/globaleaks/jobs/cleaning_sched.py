@@ -1,28 +1,34 @@
 # -*- coding: UTF-8
 # Implementation of the cleaning operations.
 
-import time
-
 from datetime import timedelta
+from storm.expr import Count, In, Min
+from storm.variables import DateTimeVariable
 
 from globaleaks import models
 from globaleaks.handlers.admin.context import admin_serialize_context
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
-from globaleaks.handlers.admin.receiver import admin_serialize_receiver
 from globaleaks.handlers.rtip import db_delete_itips, serialize_rtip
+from globaleaks.handlers.submission import get_submission_sequence_number
 from globaleaks.jobs.base import GLJob
 from globaleaks.orm import transact_sync
-from globaleaks.security import overwrite_and_remove
 from globaleaks.settings import GLSettings
 from globaleaks.utils.templating import Templating
-from globaleaks.utils.utility import log, datetime_now, datetime_never, \
-    datetime_to_ISO8601
+from globaleaks.utils.utility import log, datetime_now, datetime_to_ISO8601
 
 
 __all__ = ['CleaningSchedule']
 
 
+class MinDateTime(Min):
+    """
+    MIN of a DateTime column loaded as a datetime
+    """
+    __slots__ = ()
+    variable_factory = DateTimeVariable
+
+
 def db_clean_expired_wbtips(store):
     threshold = datetime_now() - timedelta(days=GLSettings.memory_copy.wbtip_timetolive)
 
@@ -34,6 +40,26 @@ def db_clean_expired_wbtips(store):
         store.remove(wbtip)
 
 
+def serialize_expiring_rtip(store, rtip, notification_desc, language):
+    """
+    Serialize the fields of the tip used by the expiration reminders;
+    the whole tip is serialized only if the template includes the answers
+    """
+    if any('%QuestionnaireAnswers%' in notification_desc[k] for k in ['tip_expiration_mail_title',
+                                                                      'tip_expiration_mail_template']):
+        return serialize_rtip(store, rtip, language)
+
+    itip = rtip.internaltip
+
+    return {
+        'id': rtip.id,
+        'label': rtip.label,
+        'sequence_number': get_submission_sequence_number(itip),
+        'creation_date': datetime_to_ISO8601(itip.creation_date),
+        'expiration_date': datetime_to_ISO8601(itip.expiration_date)
+    }
+
+
 class CleaningSchedule(GLJob):
     name = "Cleaning"
     interval = 24 * 3600
@@ -63,27 +89,57 @@ class CleaningSchedule(GLJob):
     @transact_sync
     def check_for_expiring_submissions(self, store):
         threshold = datetime_now() + timedelta(hours=GLSettings.memory_copy.notif.tip_expiration_threshold)
-        receivers = store.find(models.Receiver)
-        for receiver in receivers:
-            rtips = store.find(models.ReceiverTip, models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                   models.InternalTip.expiration_date < threshold,
-                                                   models.ReceiverTip.receiver_id == models.Receiver.id,
-                                                   models.Receiver.id == receiver.id)
 
-            if rtips.count() == 0:
-              continue
+        # number of expiring tips and earliest expiration date of each receiver
+        result = store.find((models.ReceiverTip.receiver_id,
+                             Count(),
+                             MinDateTime(models.InternalTip.expiration_date)),
+                            models.ReceiverTip.internaltip_id == models.InternalTip.id,
+                            models.InternalTip.expiration_date < threshold).group_by(models.ReceiverTip.receiver_id)
+
+        expiring = {}
+        for receiver_id, count, earliest_expiration_date in result:
+            expiring[receiver_id] = (count, earliest_expiration_date)
+
+        if not expiring:
+            return
+
+        # the receivers with a single expiring tip are notified of the tip
+        rtips = dict((rtip.receiver_id, rtip) for rtip, _ in
+                     store.find((models.ReceiverTip, models.InternalTip),
+                                models.ReceiverTip.internaltip_id == models.InternalTip.id,
+                                models.InternalTip.expiration_date < threshold,
+                                In(models.ReceiverTip.receiver_id, [k for k, v in expiring.iteritems() if v[0] == 1])))
+
+        receivers = store.find((models.Receiver, models.User),
+                               models.Receiver.id == models.User.id,
+                               In(models.Receiver.id, expiring.keys()))
+
+        # the descriptors are serialized once for each language and context
+        descs = {}
+
+        def get_desc(key, serialize):
+            if key not in descs:
+                descs[key] = serialize()
 
-            user = receiver.user
+            return descs[key]
+
+        for receiver, user in receivers:
             language = user.language
-            node_desc = db_admin_serialize_node(store, language)
-            notification_desc = db_get_notification(store, language)
+            node_desc = get_desc(('node', language), lambda: db_admin_serialize_node(store, language))
+            notification_desc = get_desc(('notification', language), lambda: db_get_notification(store, language))
+
+            receiver_desc = {
+                'name': user.name,
+                'mail_address': user.mail_address
+            }
 
-            receiver_desc = admin_serialize_receiver(store, receiver, language)
+            count, earliest_expiration_date = expiring[receiver.id]
 
-            if rtips.count() == 1:
-                rtip = rtips[0]
-                tip_desc = serialize_rtip(store, rtip, user.language)
-                context_desc = admin_serialize_context(store, rtip.internaltip.context, language)
+            if count == 1:
+                rtip = rtips[receiver.id]
+                context_desc = get_desc(('context', rtip.internaltip.context_id, language),
+                                        lambda: admin_serialize_context(store, rtip.internaltip.context, language))
 
                 data = {
                    'type': u'tip_expiration',
@@ -91,25 +147,16 @@ class CleaningSchedule(GLJob):
                    'context': context_desc,
                    'receiver': receiver_desc,
                    'notification': notification_desc,
-                   'tip': tip_desc
+                   'tip': serialize_expiring_rtip(store, rtip, notification_desc, language)
                 }
 
             else:
-                tips_desc = []
-                earliest_expiration_date = datetime_never()
-
-                for rtip in rtips:
-                    if rtip.internaltip.expiration_date < earliest_expiration_date:
-                        earliest_expiration_date = rtip.internaltip.expiration_date
-
-                    tips_desc.append(serialize_rtip(store, rtip, user.language))
-
                 data = {
                    'type': u'tip_expiration_summary',
                    'node': node_desc,
                    'notification': notification_desc,
                    'receiver': receiver_desc,
-                   'expiring_submission_count': rtips.count(),
+                   'expiring_submission_count': count,
                    'earliest_expiration_date': datetime_to_ISO8601(earliest_expiration_date)
                 }
 
@@ -125,31 +172,14 @@ class CleaningSchedule(GLJob):
 
     @transact_sync
     def clean_db(self, store):
-        # delete stats older than 3 months
-        store.find(models.Stats, models.Stats.start < datetime_now() - timedelta(3*(365/12))).remove()
+        # delete stats older than the retention of their granularity
+        for granularity, days in GLSettings.stats_retention.iteritems():
+            store.find(models.Stats, models.Stats.granularity == unicode(granularity),
+                       models.Stats.start < datetime_now() - timedelta(days)).remove()
 
         # delete anomalies older than 1 months
         store.find(models.Anomalies, models.Anomalies.date < datetime_now() - timedelta(365/12)).remove()
 
-    @transact_sync
-    def get_files_to_secure_delete(self, store):
-        return [file_to_delete.filepath for file_to_delete in store.find(models.SecureFileDelete)]
-
-    @transact_sync
-    def commit_file_deletion(self, store, filepath):
-        store.find(models.SecureFileDelete, models.SecureFileDelete.filepath == filepath).remove()
-
-    def perform_secure_deletion_of_files(self):
-        files_to_delete = self.get_files_to_secure_delete()
-
-        for file_to_delete in files_to_delete:
-            self.start_time = time.time()
-            log.debug("Starting secure delete of file %s" % file_to_delete)
-            overwrite_and_remove(file_to_delete)
-            self.commit_file_deletion(file_to_delete)
-            current_run_time = time.time() - self.start_time
-            log.debug("Ending secure delete of file %s (execution time: %.2f)" % (file_to_delete, current_run_time))
-
     def operation(self):
         self.clean_expired_wbtips()
 
@@ -158,5 +188,3 @@ class CleaningSchedule(GLJob):
         self.check_for_expiring_submissions()
 
         self.clean_db()
-
-        self.perform_secure_deletion_of_files()
@@ -7,12 +7,15 @@
 # kind of file has been submitted.
 
 import os
+import Queue
+import threading
 
 from globaleaks.handlers.admin.receiver import admin_serialize_receiver
 from globaleaks.jobs.base import GLJob
 from globaleaks.models import InternalFile, ReceiverFile
 from globaleaks.orm import transact_sync
-from globaleaks.security import GLBPGP, GLSecureFile, generateRandomKey
+from globaleaks.rest import errors
+from globaleaks.security import GLPGPKeyring, GLSecureFile, generateRandomKey
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import log
 
@@ -21,6 +24,8 @@ __all__ = ['DeliverySchedule']
 
 INTERNALFILES_HANDLE_RETRY_MAX = 3
 
+CHUNK_SIZE = 65536
+
 
 @transact_sync
 def receiverfile_planning(store):
@@ -85,135 +90,296 @@ def receiverfile_planning(store):
     return receiverfiles_maps
 
 
-def fsops_pgp_encrypt(fpath, recipient_pgp):
+class ProcessSlots(object):
     """
-    return
-        path of encrypted file,
-        length of the encrypted file
-
-    this function is used to encrypt a file for a specific recipient.
-    commonly 'receiver_desc' is expected as second argument;
-    anyhow a simpler dict can be used.
+    Counter of the gpg processes that could be started without exceeding
+    GLSettings.delivery_concurrency.
 
-    required keys are checked on top
+    The slots needed by a batch of encryptions are acquired all together
+    in order to avoid deadlocks between the batches.
     """
-    gpoj = GLBPGP()
+    def __init__(self, size):
+        self.cond = threading.Condition()
+        self.available = size
 
-    try:
-        gpoj.load_key(recipient_pgp['pgp_key_public'])
+    def acquire(self, n):
+        with self.cond:
+            while self.available < n:
+                self.cond.wait()
+
+            self.available -= n
+
+    def release(self, n):
+        with self.cond:
+            self.available += n
+            self.cond.notify_all()
+
+
+@transact_sync
+def update_receiverfile(store, rfileinfo):
+    rfile = store.find(ReceiverFile, ReceiverFile.id == rfileinfo['id']).one()
+    if rfile is None:
+        return
+
+    rfile.status = rfileinfo['status']
+    rfile.file_path = rfileinfo['path']
+    rfile.size = rfileinfo['size']
+
+
+@transact_sync
+def update_internalfile_and_store_receiverfiles(store, ifile_id, receiverfiles_map):
+    ifile = store.find(InternalFile, InternalFile.id == ifile_id).one()
+    if ifile is None:
+        return
+
+    ifile.new = False
+
+    # update filepath possibly changed in case of plaintext file needed
+    ifile.file_path = receiverfiles_map['ifile_path']
+
+    for rf in receiverfiles_map['rfiles']:
+        rfile = store.find(ReceiverFile, ReceiverFile.id == rf['id']).one()
+        if rfile is None:
+            continue
+
+        rfile.status = rf['status']
+        rfile.file_path = rf['path']
+        rfile.size = rf['size']
 
-        filepath = os.path.join(GLSettings.submission_path, fpath)
 
-        with GLSecureFile(filepath) as f:
-            encrypted_file_path = os.path.join(os.path.abspath(GLSettings.submission_path), "pgp_encrypted-%s" % generateRandomKey(16))
-            _, encrypted_file_size = gpoj.encrypt_file(recipient_pgp['pgp_key_fingerprint'], f, encrypted_file_path)
+def start_pgp_encryption(rfileinfo):
+    """
+    Start the gpg process encrypting the file for a receiver
+    """
+    keyring_entry = GLPGPKeyring.acquire(rfileinfo['receiver']['pgp_key_public'])
 
+    try:
+        encrypted_file_path = os.path.join(os.path.abspath(GLSettings.submission_path), "pgp_encrypted-%s" % generateRandomKey(16))
+
+        process = keyring_entry['gpob'].start_encrypt_file(rfileinfo['receiver']['pgp_key_fingerprint'], encrypted_file_path)
     except:
+        GLPGPKeyring.release(keyring_entry)
         raise
 
+    return {
+        'rfileinfo': rfileinfo,
+        'keyring_entry': keyring_entry,
+        'process': process,
+        'path': encrypted_file_path,
+        'failed': False
+    }
+
+
+def complete_pgp_encryption(encryption, rcounter):
+    """
+    Wait the gpg process encrypting the file for a receiver and commit
+    the status of the receiver file
+    """
+    rfileinfo = encryption['rfileinfo']
+
+    try:
+        try:
+            encryption['process'].stdin.close()
+        except IOError:
+            encryption['failed'] = True
+
+        if encryption['process'].wait() != 0 or encryption['failed']:
+            raise errors.PGPKeyInvalid
+
+        new_size = os.stat(encryption['path']).st_size
+
+        log.debug("%d# Switch on Receiver File for %s path %s => %s size %d => %d" %
+                  (rcounter, rfileinfo['receiver']['name'], rfileinfo['path'],
+                   encryption['path'], rfileinfo['size'], new_size))
+
+        rfileinfo['path'] = encryption['path']
+        rfileinfo['size'] = new_size
+        rfileinfo['status'] = u'encrypted'
+    except Exception as excep:
+        log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable." % (
+                rcounter, rfileinfo['receiver']['name'], rfileinfo['path'], excep)
+        )
+        rfileinfo['status'] = u'unavailable'
+
+        if os.path.exists(encryption['path']):
+            os.remove(encryption['path'])
     finally:
-        # the finally statement is always called also if
-        # except contains a return or a raise
-        gpoj.destroy_environment()
+        GLPGPKeyring.release(encryption['keyring_entry'])
 
-    return encrypted_file_path, encrypted_file_size
+    update_receiverfile(rfileinfo)
 
 
-def process_files(receiverfiles_maps):
+def deliver_batch(receiverfiles_map, batch, plain_path):
     """
-    @param receiverfiles_maps: the mapping of ifile/rfiles to be created on filesystem
-    @return: return None
+    Decrypt the AES encrypted file once and stream it to the gpg processes
+    encrypting it for the receivers of the batch and eventually to its
+    plaintext copy.
+
+    @return: True if the plaintext copy has been created
     """
-    for ifile_id, receiverfiles_map in receiverfiles_maps.iteritems():
-        ifile_path = receiverfiles_map['ifile_path']
-        ifile_name = os.path.basename(ifile_path).split('.')[0]
-        plain_path = os.path.join(GLSettings.submission_path, "%s.plain" % ifile_name)
-
-        receiverfiles_map['plaintext_file_needed'] = False
-        for rcounter, rfileinfo in enumerate(receiverfiles_map['rfiles']):
-            if len(rfileinfo['receiver']['pgp_key_public']):
-                try:
-                    new_path, new_size = fsops_pgp_encrypt(rfileinfo['path'], rfileinfo['receiver'])
-
-                    log.debug("%d# Switch on Receiver File for %s path %s => %s size %d => %d" %
-                              (rcounter,  rfileinfo['receiver']['name'], rfileinfo['path'],
-                               new_path, rfileinfo['size'], new_size))
-
-                    rfileinfo['path'] = new_path
-                    rfileinfo['size'] = new_size
-                    rfileinfo['status'] = u'encrypted'
-                except Exception as excep:
-                    log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable." % (
-                            rcounter, rfileinfo['receiver']['name'], rfileinfo['path'], excep)
-                    )
-                    rfileinfo['status'] = u'unavailable'
-            elif GLSettings.memory_copy.allow_unencrypted:
-                receiverfiles_map['plaintext_file_needed'] = True
-                rfileinfo['status'] = u'reference'
-                rfileinfo['path'] = plain_path
-            else:
-                rfileinfo['status'] = u'nokey'
-
-        if receiverfiles_map['plaintext_file_needed']:
-            log.debug(":( NOT all receivers support PGP and the system allows plaintext version of files: %s saved as plaintext file %s" %
-                      (ifile_path, plain_path))
+    ifile_path = receiverfiles_map['ifile_path']
 
-            try:
-                with open(plain_path, "wb") as plaintext_f, GLSecureFile(ifile_path) as encrypted_file:
-                    chunk_size = 4096
-                    written_size = 0
-                    while True:
-                        chunk = encrypted_file.read(chunk_size)
-                        if len(chunk) == 0:
-                            if written_size != receiverfiles_map['ifile_size']:
-                                log.err("Integrity error on rfile write for ifile %s; ifile_size(%d), rfile_size(%d)" %
-                                        (ifile_id, receiverfiles_map['ifile_size'], written_size))
-                            break
-                        written_size += len(chunk)
-                        plaintext_f.write(chunk)
-
-                receiverfiles_map['ifile_path'] = plain_path
-            except Exception as excep:
-                log.err("Unable to create plaintext file %s: %s" % (plain_path, excep))
-        else:
-            log.debug("All Receivers support PGP or the system denies plaintext version of files: marking internalfile as removed")
+    encryptions = []
+    for rcounter, rfileinfo in batch:
+        try:
+            encryptions.append((rcounter, start_pgp_encryption(rfileinfo)))
+        except Exception as excep:
+            log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable." % (
+                    rcounter, rfileinfo['receiver']['name'], rfileinfo['path'], excep)
+            )
+            rfileinfo['status'] = u'unavailable'
+            update_receiverfile(rfileinfo)
 
-        # the original AES file should always be deleted
-        log.debug("Deleting the submission AES encrypted file: %s" % ifile_path)
+    plaintext_f = None
+    plaintext_created = False
+
+    try:
+        if plain_path is not None:
+            plaintext_f = open(plain_path, "wb")
+
+        with GLSecureFile(ifile_path) as encrypted_file:
+            written_size = 0
+            while True:
+                chunk = encrypted_file.read(CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+
+                written_size += len(chunk)
+
+                if plaintext_f is not None:
+                    plaintext_f.write(chunk)
+
+                for _, encryption in encryptions:
+                    if not encryption['failed']:
+                        try:
+                            encryption['process'].stdin.write(chunk)
+                        except IOError:
+                            # the gpg process has terminated unexpectedly
+                            encryption['failed'] = True
+
+        if written_size != receiverfiles_map['ifile_size']:
+            log.err("Integrity error on rfile write for ifile %s; ifile_size(%d), rfile_size(%d)" %
+                    (receiverfiles_map['ifile_id'], receiverfiles_map['ifile_size'], written_size))
+
+        plaintext_created = plaintext_f is not None
+    except Exception as excep:
+        log.err("Unable to deliver file %s: %s" % (ifile_path, excep))
+
+        for _, encryption in encryptions:
+            encryption['failed'] = True
+    finally:
+        if plaintext_f is not None:
+            plaintext_f.close()
+
+        for rcounter, encryption in encryptions:
+            complete_pgp_encryption(encryption, rcounter)
+
+    return plaintext_created
 
-        # Remove the AES file
-        try:
-            os.remove(ifile_path)
-        except OSError as ose:
-            log.err("Unable to remove %s: %s" % (ifile_path, ose.message))
 
-        # Remove the AES file key
+def process_file(ifile_id, receiverfiles_map, slots):
+    """
+    @param ifile_id: the id of the internalfile to be delivered
+    @param receiverfiles_map: the mapping of the rfiles to be created on filesystem
+    @param slots: the ProcessSlots shared by the files delivered concurrently
+    """
+    ifile_path = receiverfiles_map['ifile_path']
+    ifile_name = os.path.basename(ifile_path).split('.')[0]
+    plain_path = os.path.join(GLSettings.submission_path, "%s.plain" % ifile_name)
+
+    receiverfiles_map['plaintext_file_needed'] = False
+
+    pgp_rfiles = []
+    for rcounter, rfileinfo in enumerate(receiverfiles_map['rfiles']):
+        if len(rfileinfo['receiver']['pgp_key_public']):
+            pgp_rfiles.append((rcounter, rfileinfo))
+        elif GLSettings.memory_copy.allow_unencrypted:
+            receiverfiles_map['plaintext_file_needed'] = True
+            rfileinfo['status'] = u'reference'
+            rfileinfo['path'] = plain_path
+        else:
+            rfileinfo['status'] = u'nokey'
+
+    if receiverfiles_map['plaintext_file_needed']:
+        log.debug(":( NOT all receivers support PGP and the system allows plaintext version of files: %s saved as plaintext file %s" %
+                  (ifile_path, plain_path))
+    else:
+        log.debug("All Receivers support PGP or the system denies plaintext version of files: marking internalfile as removed")
+
+    # the encryptions are performed in batches of at most delivery_concurrency
+    # receivers; the plaintext copy, if needed, is created with the first batch
+    size = GLSettings.delivery_concurrency
+    batches = [pgp_rfiles[i:i + size] for i in range(0, len(pgp_rfiles), size)] or [[]]
+
+    plaintext_created = False
+    for i, batch in enumerate(batches):
+        needs_plaintext = receiverfiles_map['plaintext_file_needed'] and i == 0
+        if not batch and not needs_plaintext:
+            continue
+
+        slots.acquire(len(batch))
         try:
-            os.remove(os.path.join(GLSettings.ramdisk_path, ("%s%s" % (GLSettings.AES_keyfile_prefix, ifile_name))))
-        except OSError as ose:
-            log.err("Unable to remove keyfile associated with %s: %s" % (ifile_path, ose.message))
+            if deliver_batch(receiverfiles_map, batch, plain_path if needs_plaintext else None):
+                plaintext_created = True
+        finally:
+            slots.release(len(batch))
 
+    if plaintext_created:
+        receiverfiles_map['ifile_path'] = plain_path
 
-@transact_sync
-def update_internalfile_and_store_receiverfiles(store, receiverfiles_maps):
+    # the original AES file should always be deleted
+    log.debug("Deleting the submission AES encrypted file: %s" % ifile_path)
+
+    # Remove the AES file
+    try:
+        os.remove(ifile_path)
+    except OSError as ose:
+        log.err("Unable to remove %s: %s" % (ifile_path, ose.message))
+
+    # Remove the AES file key
+    try:
+        os.remove(os.path.join(GLSettings.ramdisk_path, ("%s%s" % (GLSettings.AES_keyfile_prefix, ifile_name))))
+    except OSError as ose:
+        log.err("Unable to remove keyfile associated with %s: %s" % (ifile_path, ose.message))
+
+    update_internalfile_and_store_receiverfiles(ifile_id, receiverfiles_map)
+
+
+def process_files(receiverfiles_maps):
+    """
+    Deliver the files concurrently on a bounded number of threads; each file
+    is decrypted once for each batch of receivers and the gpg processes
+    encrypting it are limited by GLSettings.delivery_concurrency.
+
+    @param receiverfiles_maps: the mapping of ifile/rfiles to be created on filesystem
+    @return: return None
+    """
+    slots = ProcessSlots(GLSettings.delivery_concurrency)
+
+    queue = Queue.Queue()
     for ifile_id, receiverfiles_map in receiverfiles_maps.iteritems():
-        ifile = store.find(InternalFile, InternalFile.id == ifile_id).one()
-        if ifile is None:
-            continue
+        queue.put((ifile_id, receiverfiles_map))
 
-        ifile.new = False
+    def worker():
+        while True:
+            try:
+                ifile_id, receiverfiles_map = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                process_file(ifile_id, receiverfiles_map, slots)
+            except Exception as excep:
+                log.err("Unable to handle receiverfiles creation for ifile %s: %s" % (ifile_id, excep))
 
-        # update filepath possibly changed in case of plaintext file needed
-        ifile.file_path = receiverfiles_map['ifile_path']
+    threads = [threading.Thread(target=worker)
+               for _ in range(min(GLSettings.delivery_concurrency, len(receiverfiles_maps)))]
 
-        for rf in receiverfiles_map['rfiles']:
-            rfile = store.find(ReceiverFile, ReceiverFile.id == rf['id']).one()
-            if rfile is None:
-                continue
+    for thread in threads:
+        thread.start()
 
-            rfile.status = rf['status']
-            rfile.file_path = rf['path']
-            rfile.size = rf['size']
+    for thread in threads:
+        thread.join()
 
 
 class DeliverySchedule(GLJob):
@@ -229,4 +395,3 @@ class DeliverySchedule(GLJob):
 
         if len(receiverfiles_maps):
             process_files(receiverfiles_maps)
-            update_internalfile_and_store_receiverfiles(receiverfiles_maps)
@@ -2,8 +2,11 @@
 # Implement the notification of new submissions
 
 import copy
+from datetime import timedelta
 
-from twisted.internet import reactor, threads
+from storm.expr import In
+from twisted.internet import defer, reactor, threads
+from twisted.mail.smtp import SMTPDeliveryError
 
 from globaleaks import models
 from globaleaks.handlers.admin.context import admin_serialize_context
@@ -13,11 +16,11 @@ from globaleaks.handlers.admin.receiver import admin_serialize_receiver
 from globaleaks.handlers.rtip import serialize_rtip, serialize_message, serialize_comment
 from globaleaks.jobs.base import GLJob
 from globaleaks.orm import transact, transact_sync
-from globaleaks.security import GLBPGP
+from globaleaks.security import GLPGPKeyring
 from globaleaks.settings import GLSettings
-from globaleaks.utils.mailutils import sendmail
+from globaleaks.utils.mailutils import SMTPPool
 from globaleaks.utils.templating import Templating
-from globaleaks.utils.utility import log
+from globaleaks.utils.utility import log, datetime_now
 
 
 trigger_template_map = {
@@ -168,20 +171,14 @@ class MailGenerator(object):
 
         # If the receiver has encryption enabled encrypt the mail body
         if len(data['receiver']['pgp_key_public']):
-            gpob = GLBPGP()
-
             try:
-                gpob.load_key(data['receiver']['pgp_key_public'])
-                body = gpob.encrypt_message(data['receiver']['pgp_key_fingerprint'], body)
+                with GLPGPKeyring.use(data['receiver']['pgp_key_public']) as gpob:
+                    body = gpob.encrypt_message(data['receiver']['pgp_key_fingerprint'], body)
             except Exception as excep:
                 log.err("Error in PGP interface object (for %s: %s)! (notification+encryption)" %
                         (data['receiver']['username'], str(excep)))
 
                 return
-            finally:
-                # the finally statement is always called also if
-                # except contains a return or a raise
-                gpob.destroy_environment()
 
         store.add(models.Mail({
             'address': data['receiver']['mail_address'],
@@ -214,22 +211,13 @@ class MailGenerator(object):
                           (count, trigger))
 
 
-@transact
-def delete_sent_mail(store, result, mail_id):
-    store.find(models.Mail, models.Mail.id == mail_id).remove()
-
-
 @transact_sync
 def get_mails_from_the_pool(store):
     ret = []
 
-    for mail in store.find(models.Mail):
-        if mail.processing_attempts > 9:
-            store.remove(mail)
-            continue
-
-        mail.processing_attempts += 1
+    mails = store.find(models.Mail, models.Mail.next_attempt_date <= datetime_now())
 
+    for mail in mails.order_by(models.Mail.next_attempt_date)[:GLSettings.mail_spool_size]:
         ret.append({
             'id': mail.id,
             'address': mail.address,
@@ -240,20 +228,70 @@ def get_mails_from_the_pool(store):
     return ret
 
 
+def is_permanent_failure(failure):
+    """
+    Return True if the failure is a rejection of the mail by the SMTP server
+    """
+    return failure.check(SMTPDeliveryError) is not None and failure.value.code >= 500
+
+
+@transact_sync
+def update_mails(store, results):
+    """
+    Remove the mails delivered and schedule the retry of the failed ones
+
+    @param results: a list of (mail, failure) with failure None for the mails delivered
+    """
+    sent_ids = [mail['id'] for mail, failure in results if failure is None]
+    if sent_ids:
+        store.find(models.Mail, In(models.Mail.id, sent_ids)).remove()
+
+    for mail, failure in results:
+        if failure is None:
+            continue
+
+        m = store.find(models.Mail, models.Mail.id == mail['id']).one()
+        if m is None:
+            continue
+
+        m.processing_attempts += 1
+
+        if is_permanent_failure(failure) or m.processing_attempts >= GLSettings.mail_retry_limit:
+            log.err("Discarding mail to %s after %d attempts (%s)" %
+                    (m.address, m.processing_attempts, failure.value))
+            store.remove(m)
+            continue
+
+        delay = min(GLSettings.mail_retry_delay * 2 ** (m.processing_attempts - 1),
+                    GLSettings.mail_retry_max_delay)
+
+        m.next_attempt_date = datetime_now() + timedelta(seconds=delay)
+
+
 class NotificationSchedule(GLJob):
     name = "Notification"
     interval = 5
     monitor_interval = 3 * 60
 
-    def sendmail(self, mail):
-        d = sendmail(mail['address'], mail['subject'], mail['body'])
-        d.addCallback(delete_sent_mail, mail['id'])
+    def send_mails(self, mails):
+        """
+        Deliver the mails through the SMTP sessions pool
+
+        @return: a Deferred firing with the list of (mail, failure)
+        """
+        d = defer.DeferredList(SMTPPool.send(mails), consumeErrors=True)
+        d.addCallback(lambda results: [(mail, None if success else result)
+                                       for mail, (success, result) in zip(mails, results)])
         return d
 
     def spool_emails(self):
         mails = get_mails_from_the_pool()
-        for mail in mails:
-            threads.blockingCallFromThread(reactor, self.sendmail, mail)
+        if not mails:
+            return
+
+        results = threads.blockingCallFromThread(reactor, self.send_mails, mails)
+
+        update_mails(results)
 
     def operation(self):
         MailGenerator().generate()
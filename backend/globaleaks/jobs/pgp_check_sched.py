@@ -10,6 +10,7 @@ from globaleaks.handlers.admin.user import db_get_admin_users
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.jobs.base import GLJob
 from globaleaks.orm import transact_sync
+from globaleaks.security import GLPGPKeyring
 from globaleaks.settings import GLSettings
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import datetime_now, datetime_null
@@ -80,6 +81,7 @@ class PGPCheckSchedule(GLJob):
             expired_or_expiring.append(user_serialize_user(user, GLSettings.memory_copy.default_language))
 
             if user.pgp_key_expiration < datetime_now():
+                GLPGPKeyring.invalidate(user.pgp_key_fingerprint)
                 user.pgp_key_public = ''
                 user.pgp_key_fingerprint = ''
                 user.pgp_key_expiration = datetime_null()
@@ -0,0 +1,118 @@
+# -*- encoding: utf-8 -*-
+# Implements the secure deletion of the files marked for deletion:
+# the job is woken up as soon as new files are marked and processes
+# them in batches, yielding the disk between batches.
+import os
+import time
+
+from storm.expr import In
+from twisted.internet import defer
+
+from globaleaks import models
+from globaleaks.jobs.base import GLJob
+from globaleaks.orm import register_commit_listener, transact_sync
+from globaleaks.security import overwrite_and_remove_files
+from globaleaks.settings import GLSettings
+from globaleaks.utils.utility import log
+
+
+__all__ = ['SecureDeleteSchedule', 'wakeup']
+
+
+def get_file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def wakeup():
+    """
+    Wake up the secure deletion job; called after the commit of the
+    transactions marking files for secure deletion.
+    """
+    for job in GLSettings.jobs:
+        if isinstance(job, SecureDeleteSchedule):
+            job.wakeup()
+
+
+class SecureDeleteSchedule(GLJob):
+    name = "Secure deletion"
+    interval = 3600
+    monitor_interval = 3 * 3600
+
+    def __init__(self):
+        GLJob.__init__(self)
+        self.pending = False
+        self.wakeup_call = None
+        self.stats = {
+            'queued': 0,
+            'deleted': 0,
+            'bytes': 0,
+            'throughput': 0
+        }
+
+    def wakeup(self):
+        """
+        Schedule an execution of the job after GLSettings.secure_delete_wakeup_delay
+        coalescing the wakeups received in the meantime
+        """
+        if self.wakeup_call is None or not self.wakeup_call.active():
+            self.wakeup_call = self.clock.callLater(GLSettings.secure_delete_wakeup_delay, self.run)
+
+    @defer.inlineCallbacks
+    def run(self):
+        # the files marked while the job is running are processed
+        # by a new execution scheduled at its end
+        if self.active:
+            self.pending = True
+            return
+
+        self.pending = False
+
+        yield GLJob.run(self)
+
+        if self.pending:
+            self.wakeup()
+
+    @transact_sync
+    def get_files_to_secure_delete(self, store):
+        self.stats['queued'] = store.find(models.SecureFileDelete).count()
+
+        return [x.filepath for x in store.find(models.SecureFileDelete)[:GLSettings.secure_delete_batch_size]]
+
+    @transact_sync
+    def commit_files_deletion(self, store, filepaths):
+        store.find(models.SecureFileDelete, In(models.SecureFileDelete.filepath, filepaths)).remove()
+
+    def operation(self):
+        while True:
+            files_to_delete = self.get_files_to_secure_delete()
+            if not files_to_delete:
+                return
+
+            start_time = time.time()
+            size = sum(get_file_size(path) for path in files_to_delete)
+
+            deleted = []
+            overwrite_and_remove_files(files_to_delete, deleted.append)
+            self.commit_files_deletion(deleted)
+
+            elapsed = time.time() - start_time
+
+            self.stats['queued'] -= len(deleted)
+            self.stats['deleted'] += len(deleted)
+            self.stats['bytes'] += size
+            self.stats['throughput'] = int(size / max(elapsed, 0.001))
+
+            log.debug("Securely deleted %d files (execution time: %.2f)" % (len(deleted), elapsed))
+
+            # backpressure: the slower the disk the longer the disk is left
+            # to the other activities before processing the next batch
+            time.sleep(elapsed * GLSettings.secure_delete_backoff)
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+register_commit_listener('secure_delete', wakeup)
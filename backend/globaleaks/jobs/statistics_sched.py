@@ -2,8 +2,10 @@
 # Implement collection of statistics
 
 import os
+from datetime import timedelta
 
 from globaleaks.anomaly import Alarm
+from globaleaks.event import merge_latency_histograms
 from globaleaks.jobs.base import GLJob
 from globaleaks.models import Stats, Anomalies
 from globaleaks.orm import transact_sync
@@ -48,25 +50,66 @@ def get_anomalies():
     return anomalies
 
 def get_statistics():
-    statsummary = {}
+    return dict(GLSettings.RecentEvents)
 
-    for descblob in GLSettings.RecentEventQ:
-        if 'event' not in descblob:
-            continue
+def get_rollup_start(granularity, date):
+    """
+    Return the start of the day or of the week (starting on monday)
+    including the date
+    """
+    start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if granularity == u'week':
+        start -= timedelta(days=start.weekday())
 
-        statsummary.setdefault(descblob['event'], 0)
-        statsummary[descblob['event']] += 1
+    return start
+
+
+def db_update_rollup(store, granularity, start, summary, latency, free_disk_space):
+    """
+    Add the statistics of an hour to the ones of the day or of the week
+    including it, creating them if missing.
+    """
+    rollup = store.find(Stats, Stats.granularity == granularity, Stats.start == start).one()
+    if rollup is None:
+        rollup = Stats()
+        rollup.granularity = granularity
+        rollup.start = start
+        rollup.summary = {}
+        rollup.latency = {}
+        store.add(rollup)
+
+    new_summary = dict(rollup.summary)
+    for event, count in summary.iteritems():
+        new_summary[event] = new_summary.get(event, 0) + count
+
+    new_latency = dict(rollup.latency)
+    for event, histogram in latency.iteritems():
+        new_latency[event] = merge_latency_histograms(new_latency.get(event, {}), histogram)
+
+    rollup.summary = new_summary
+    rollup.latency = new_latency
+    rollup.free_disk_space = free_disk_space
 
-    return statsummary
 
 @transact_sync
-def save_statistics(store, start, end, activity_collection):
+def save_statistics(store, start, end, activity_collection, latency_collection):
     newstat = Stats()
+    newstat.granularity = u'hour'
     newstat.start = start
     newstat.summary = dict(activity_collection)
+    newstat.latency = dict((event, dict(histogram)) for event, histogram in latency_collection.iteritems())
     newstat.free_disk_space = get_workingdir_space()[0]
     store.add(newstat)
 
+    for granularity in [u'day', u'week']:
+        db_update_rollup(store,
+                         granularity,
+                         get_rollup_start(granularity, start),
+                         newstat.summary,
+                         newstat.latency,
+                         newstat.free_disk_space)
+
     if activity_collection:
         log.debug("save_statistics: Saved statistics %s collected from %s to %s" %
                   (activity_collection, start, end))
@@ -113,7 +156,8 @@ class StatisticsSchedule(GLJob):
         # ------- BEGIN Stats section -----------
         current_time = datetime_now()
         statistic_summary = get_statistics()
-        save_statistics(GLSettings.stats_collection_start_time, current_time, statistic_summary)
+        save_statistics(GLSettings.stats_collection_start_time, current_time,
+                        statistic_summary, GLSettings.RecentLatencies)
         # ------- END Stats section -------------
 
         # Hourly Resets
@@ -1,4 +1,5 @@
 # -*- coding: UTF-8
+import cgi
 import json
 import types
 from io import BytesIO as StringIO
@@ -8,18 +9,51 @@ from twisted.protocols import policies
 from twisted.web import http
 from twisted.web.client import HTTPPageGetter
 from twisted.web.http import HTTPChannel, HTTPFactory, Request
+from twisted.web.server import Request as ServerRequest
 
+from globaleaks.security import GLSecureTemporaryFile
 from globaleaks.settings import GLSettings
+from globaleaks.utils.multipart import MultipartStream
 
 
 HTTPFactory__init__orig = HTTPFactory.__init__
 Request__write__orig = Request.write
+ServerRequest__process__orig = ServerRequest.process
+
+
+def open_upload_file():
+    return GLSecureTemporaryFile(GLSettings.tmp_upload_path)
 
 
 def mock_Request_gotLength(self, length):
+    """
+    The multipart/form-data bodies (i.e. the file uploads) are parsed while
+    being received and the files are encrypted and written to disk
+    without being buffered in memory.
+    """
+    ctype = self.requestHeaders.getRawHeaders(b'content-type')
+    if ctype is not None:
+        key, pdict = cgi.parse_header(ctype[0])
+        if key == b'multipart/form-data' and 'boundary' in pdict:
+            self.content = MultipartStream(pdict['boundary'], open_upload_file,
+                                           GLSettings.memory_copy.maximum_filesize * 1024 * 1024)
+            return
+
     self.content = StringIO()
 
 
+def mock_ServerRequest_process(self):
+    """
+    The arguments of the multipart/form-data bodies parsed while being
+    received are added to the ones of the request.
+    """
+    if isinstance(self.content, MultipartStream):
+        self.content.finish()
+        self.args.update(self.content.args)
+
+    ServerRequest__process__orig(self)
+
+
 def mock_HTTPFactory__init__(self, logPath=None, timeout=60, logFormatter=None):
     """
     The mock is required to fix tx bug #3746 with the patch introduced in Twisted 17.1.0
@@ -48,6 +82,7 @@ def mock_HTTChannel__timeoutConnection(self):
 
 
 Request.gotLength = mock_Request_gotLength
+ServerRequest.process = mock_ServerRequest_process
 HTTPPageGetter.timeout = mock_HTTPPageGetter_timeout
 HTTPFactory.__init__ = mock_HTTPFactory__init__
 HTTPChannel.timeoutConnection = mock_HTTChannel__timeoutConnection
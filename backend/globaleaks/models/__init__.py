@@ -440,6 +440,7 @@ class Mail(ModelWithID):
     body = Unicode()
 
     processing_attempts = Int(default=0)
+    next_attempt_date = DateTime(default_factory=datetime_now)
 
     unicode_keys = ['address', 'subject', 'body']
 
@@ -619,8 +620,16 @@ class ArchivedSchema(Model):
 
 
 class Stats(ModelWithID):
+    """
+    Statistics of the events of an hour, of a day or of a week
+
+    The hourly statistics are recorded by the statistics job that adds them
+    to the ones of the day and of the week including the hour.
+    """
+    granularity = Unicode(default=u'hour')
     start = DateTime()
     summary = JSON()
+    latency = JSON()
     free_disk_space = Int()
 
 
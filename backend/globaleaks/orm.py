@@ -24,17 +24,28 @@ class SQLite(storm.databases.sqlite.Database):
         self._filename = uri.database or ":memory:"
         self._timeout = float(uri.options.get("timeout", 30))
         self._synchronous = uri.options.get("synchronous")
+        self._auto_vacuum = uri.options.get("auto_vacuum")
         self._journal_mode = uri.options.get("journal_mode")
         self._foreign_keys = uri.options.get("foreign_keys")
+        self._query_only = uri.options.get("query_only")
 
     def raw_connect(self):
+        # connections are reused by different threads of the thread pools
+        # but the StorePool guarantees that each is used by one thread at time
         raw_connection = sqlite.connect(self._filename, timeout=self._timeout,
-                                        isolation_level=None)
+                                        isolation_level=None,
+                                        check_same_thread=False)
 
         if self._synchronous is not None:
             raw_connection.execute("PRAGMA synchronous = %s" %
                                    (self._synchronous,))
 
+        # auto_vacuum needs to be configured before switching the journal
+        # mode as WAL would otherwise initialize the header of a new database
+        if self._auto_vacuum is not None:
+            raw_connection.execute("PRAGMA auto_vacuum = %s" %
+                                   (self._auto_vacuum,))
+
         if self._journal_mode is not None:
             raw_connection.execute("PRAGMA journal_mode = %s" %
                                    (self._journal_mode,))
@@ -45,6 +56,10 @@ class SQLite(storm.databases.sqlite.Database):
 
         raw_connection.execute("PRAGMA secure_delete = ON")
 
+        if self._query_only is not None:
+            raw_connection.execute("PRAGMA query_only = %s" %
+                                   (self._query_only,))
+
         return raw_connection
 
 storm.databases.sqlite.SQLite = SQLite
@@ -55,14 +70,175 @@ def get_store():
     return Store(create_database(GLSettings.db_uri))
 
 
+class StorePool(object):
+    """
+    Pool of persistent stores reused across transactions.
+
+    Stores are opened on demand up to the configured size; when the pool is
+    exhausted the requesting thread waits for a store to be released.
+    Each store is checked before being handed out and is reset when it is
+    given back so that no state is leaked between transactions.
+    """
+    def __init__(self, uri_attr, size_attr):
+        self.uri_attr = uri_attr
+        self.size_attr = size_attr
+        self.db_uri = None
+        self.generation = 0
+        self.cond = threading.Condition()
+        self.idle = []
+        self.opened = 0
+        self.stats = {
+            'hits': 0,
+            'waits': 0,
+            'opens': 0,
+            'discards': 0
+        }
+
+    @property
+    def size(self):
+        return getattr(GLSettings, self.size_attr)
+
+    def get(self):
+        db_uri = getattr(GLSettings, self.uri_attr)
+
+        with self.cond:
+            if db_uri != self.db_uri:
+                self._close_idle()
+                self.db_uri = db_uri
+                self.generation += 1
+
+            while True:
+                while self.idle:
+                    store = self.idle.pop()
+                    if self._check(store):
+                        self.stats['hits'] += 1
+                        return store
+
+                    self._discard(store)
+
+                if self.opened < self.size:
+                    self.opened += 1
+                    self.stats['opens'] += 1
+                    break
+
+                self.stats['waits'] += 1
+                self.cond.wait()
+
+        try:
+            store = Store(create_database(db_uri))
+            store._pool_generation = self.generation
+            return store
+        except:
+            with self.cond:
+                self.opened -= 1
+                self.cond.notify()
+            raise
+
+    def put(self, store):
+        try:
+            store.rollback()
+            store.reset()
+        except Exception:
+            with self.cond:
+                self._discard(store)
+                self.cond.notify()
+            return
+
+        with self.cond:
+            if store._pool_generation != self.generation:
+                self._discard(store)
+            else:
+                self.idle.append(store)
+
+            self.cond.notify()
+
+    def close(self):
+        """
+        Close all the idle stores; the stores in use are closed when released
+        """
+        with self.cond:
+            self._close_idle()
+            self.generation += 1
+
+    def get_stats(self):
+        with self.cond:
+            return dict(self.stats,
+                        size=self.size,
+                        opened=self.opened,
+                        idle=len(self.idle))
+
+    @staticmethod
+    def _check(store):
+        try:
+            store.execute("SELECT 1").get_one()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, store):
+        self.opened -= 1
+        self.stats['discards'] += 1
+
+        try:
+            store.close()
+        except Exception:
+            pass
+
+    def _close_idle(self):
+        while self.idle:
+            self._discard(self.idle.pop())
+
+
+store_pools = {
+    'rw': StorePool('db_uri', 'orm_pool_size'),
+    'ro': StorePool('db_ro_uri', 'orm_ro_tp_size')
+}
+
+
+def close_store_pools():
+    for pool in store_pools.values():
+        pool.close()
+
+
+def get_store_pools_stats():
+    return dict((key, pool.get_stats()) for key, pool in store_pools.items())
+
+
 transact_lock = threading.Lock()
 
+# callbacks executed in the reactor after the commit of the transactions
+# that notified the event they are registered for
+commit_listeners = {}
+
+
+def register_commit_listener(event, callback):
+    commit_listeners.setdefault(event, []).append(callback)
+
+
+def db_notify_on_commit(store, event):
+    """
+    Notify the listeners of the event after the commit of the transaction
+    of the store; nothing is notified if the transaction is rolled back.
+    """
+    # the stores not managed by transact do not notify any event
+    events = getattr(store, '_commit_events', None)
+    if events is not None:
+        events.add(event)
+
+
+def notify_commit_listeners(events):
+    for event in events:
+        for callback in commit_listeners.get(event, []):
+            reactor.callFromThread(callback)
+
 
 class transact(object):
     """
     Class decorator for managing transactions.
     Because Storm sucks.
     """
+    readonly = False
+
     def __init__(self, method):
         self.method = method
         self.instance = None
@@ -80,7 +256,7 @@ class transact(object):
 
     def run(self, function, *args, **kwargs):
         return deferToThreadPool(reactor,
-                                 GLSettings.orm_tp,
+                                 GLSettings.orm_ro_tp if self.readonly else GLSettings.orm_tp,
                                  function,
                                  *args,
                                  **kwargs)
@@ -90,24 +266,47 @@ class transact(object):
         Wrap provided function calling it inside a thread and
         passing the store to it.
         """
+        if self.readonly:
+            return self._execute(store_pools['ro'], function, *args, **kwargs)
+
         with transact_lock:
-            store = Store(create_database(GLSettings.db_uri))
+            return self._execute(store_pools['rw'], function, *args, **kwargs)
 
-            try:
-                if self.instance:
-                    result = function(self.instance, store, *args, **kwargs)
-                else:
-                    result = function(store, *args, **kwargs)
+    def _execute(self, pool, function, *args, **kwargs):
+        store = pool.get()
+        store._commit_events = events = set()
 
-                store.commit()
-            except:
+        try:
+            if self.instance:
+                result = function(self.instance, store, *args, **kwargs)
+            else:
+                result = function(store, *args, **kwargs)
+
+            if self.readonly:
                 store.rollback()
-                raise
             else:
-                return result
-            finally:
-                store.reset()
-                store.close()
+                store.commit()
+        except:
+            store.rollback()
+            raise
+        else:
+            notify_commit_listeners(events)
+            return result
+        finally:
+            store._commit_events = None
+            pool.put(store)
+
+
+class transact_ro(transact):
+    """
+    Class decorator for managing read-only transactions.
+
+    Read-only transactions do not acquire the transact_lock and are executed
+    on a dedicated thread pool; the WAL journal lets them read a consistent
+    snapshot of the database while the single writer keeps committing.
+    Any attempt to write from inside a read-only transaction fails.
+    """
+    readonly = True
 
 
 class transact_sync(transact):
@@ -0,0 +1,125 @@
+# -*- coding: UTF-8
+#   admission
+#   *********
+#
+#   Admission control of the requests performed to the endpoints that are
+#   expensive for the node or exposed to anonymous floods.
+import collections
+
+from twisted.internet import defer
+
+from globaleaks.anomaly import Alarm
+from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
+
+
+class AdmissionQueue(object):
+    """
+    Limits the number of concurrent requests of a class of endpoints.
+
+    The requests exceeding the limit are queued in order of arrival up to the
+    queue budget and the others are rejected; both the limit and the budget
+    are halved at every level of the activity stress computed by the Alarm.
+    """
+    def __init__(self, concurrency, queue):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.running = 0
+        self.waiting = collections.deque()
+        self.stats = {
+            'admitted': 0,
+            'queued': 0,
+            'rejected': 0
+        }
+
+    def get_limits(self):
+        stress_level = Alarm.stress_levels['activity']
+
+        return max(1, self.concurrency >> stress_level), self.queue >> stress_level
+
+    def acquire(self):
+        """
+        @return: a Deferred fired when the request is admitted
+        @raise ServiceOverloaded: if the queue budget is exhausted
+        """
+        concurrency, queue = self.get_limits()
+
+        d = defer.Deferred()
+
+        if self.running < concurrency:
+            self.running += 1
+            self.stats['admitted'] += 1
+            d.callback(None)
+        elif len(self.waiting) < queue:
+            self.stats['queued'] += 1
+            self.waiting.append(d)
+        else:
+            self.stats['rejected'] += 1
+            raise errors.ServiceOverloaded
+
+        return d
+
+    def release(self, d):
+        """
+        Release the admission of a request or remove it from the queue
+
+        @param d: the Deferred returned by acquire
+        """
+        if not d.called:
+            self.waiting.remove(d)
+            return
+
+        self.running -= 1
+
+        concurrency, _ = self.get_limits()
+        while self.waiting and self.running < concurrency:
+            self.running += 1
+            self.stats['admitted'] += 1
+            self.waiting.popleft().callback(None)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['concurrency'], stats['queue'] = self.get_limits()
+        stats['running'] = self.running
+        stats['waiting'] = len(self.waiting)
+
+        return stats
+
+
+class AdmissionControlClass(object):
+    """
+    The admission queues of the classes of endpoints configured in
+    GLSettings.admission_limits; the class of a handler is defined by
+    its attribute admission_class.
+    """
+    def __init__(self):
+        self.queues = {}
+
+    def get_queue(self, admission_class):
+        if admission_class not in self.queues:
+            limits = GLSettings.admission_limits[admission_class]
+            self.queues[admission_class] = AdmissionQueue(limits['concurrency'], limits['queue'])
+
+        return self.queues[admission_class]
+
+    def acquire(self, admission_class):
+        return self.get_queue(admission_class).acquire()
+
+    def release(self, admission_class, d):
+        self.get_queue(admission_class).release(d)
+
+    def get_retry_after(self):
+        """
+        The seconds suggested to the clients of the rejected requests
+        """
+        return GLSettings.admission_retry_after << Alarm.stress_levels['activity']
+
+    def clear(self):
+        self.queues.clear()
+
+    def get_stats(self):
+        return dict((admission_class, self.get_queue(admission_class).get_stats())
+                    for admission_class in GLSettings.admission_limits)
+
+
+AdmissionControl = AdmissionControlClass()
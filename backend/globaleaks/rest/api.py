@@ -44,6 +44,8 @@ from globaleaks.handlers.admin import step as admin_step
 from globaleaks.handlers.admin import user as admin_user
 
 from globaleaks.rest import apicache, requests, errors
+from globaleaks.rest.admission import AdmissionControl
+from globaleaks.rest.router import Router
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import randbits
 from globaleaks.utils.mailutils import extract_exception_traceback_and_send_email
@@ -124,6 +126,8 @@ api_spec = [
     (r'/admin/shorturls', admin_shorturl.ShortURLCollection),
     (r'/admin/shorturls/' + uuid_regexp, admin_shorturl.ShortURLInstance),
     (r'/admin/stats/(\d+)', admin_statistics.StatsCollection),
+    (r'/admin/stats/resources', admin_statistics.ResourcesStatistics),
+    (r'/admin/stats/rollups', admin_statistics.StatsRollupsCollection),
     (r'/admin/activities/(summary|details)', admin_statistics.RecentEventsCollection),
     (r'/admin/anomalies', admin_statistics.AnomalyCollection),
     (r'/admin/jobs', admin_statistics.JobsTiming),
@@ -163,11 +167,11 @@ def decorate_method(h, method):
 
    if method == 'get':
        if h.cache_resource:
-           f = apicache.decorator_cache_get(f)
+           f = apicache.decorator_cache_get(f, h.cache_resource)
 
    else:
        if h.invalidate_cache:
-           f = apicache.decorator_cache_invalidate(f)
+           f = apicache.decorator_cache_invalidate(f, h.invalidate_cache)
 
    f = decorator_authentication(f, value)
 
@@ -176,12 +180,14 @@ def decorate_method(h, method):
 
 class APIResourceWrapper(Resource):
     _registry = None
+    _router = None
     isLeaf = True
     method_map = {'get': 200, 'post': 201, 'put': 202, 'delete': 200}
 
     def __init__(self):
         Resource.__init__(self)
         self._registry = []
+        self._router = Router()
 
         for tup in api_spec:
             args = {}
@@ -203,6 +209,7 @@ class APIResourceWrapper(Resource):
                         decorate_method(handler, m)
 
             self._registry.append((re.compile(pattern), handler, args))
+            self._router.add(pattern, (handler, args))
 
     def should_redirect_tor(self, request):
         if request.client_using_tor and \
@@ -308,16 +315,14 @@ class APIResourceWrapper(Resource):
             self.redirect_https(request)
             return b''
 
-        match = None
-        for regexp, handler, args in self._registry:
-            match = regexp.match(request.path)
-            if match:
-                break
+        match = self._router.match(request.path)
 
         if match is None:
             self.handle_exception(errors.ResourceNotFound(), request)
             return b''
 
+        (handler, args), groups = match
+
         method = request.method.lower()
         if not method in self.method_map.keys() or not hasattr(handler, method):
             self.handle_exception(errors.MethodNotImplemented(), request)
@@ -327,10 +332,24 @@ class APIResourceWrapper(Resource):
 
         f = getattr(handler, method)
 
-        groups = [unicode(g) for g in match.groups()]
+        if handler.admission_class is None:
+            admission = defer.succeed(None)
+        else:
+            try:
+                admission = AdmissionControl.acquire(handler.admission_class)
+            except errors.ServiceOverloaded as e:
+                request.setHeader(b'retry-after', b'%d' % AdmissionControl.get_retry_after())
+                self.handle_exception(e, request)
+                return b''
+
+            # the admission is released when the request is finished or,
+            # if still queued, when the connection is lost
+            request.notifyFinish().addBoth(lambda _: AdmissionControl.release(handler.admission_class, admission))
+
+        groups = [unicode(g) for g in groups]
         h = handler(request, **args)
 
-        d = defer.maybeDeferred(f, h, *groups)
+        d = admission.addCallback(lambda _: f(h, *groups))
 
         @defer.inlineCallbacks
         def concludeHandlerFailure(err):
@@ -1,51 +1,248 @@
 # -*- encoding: utf-8 -*-
+#
+# The cache of the resources served by the handlers with cache_resource.
+#
+# Every resource is cached for each language and is associated to the set
+# of tags (e.g. 'contexts') of the data it depends on; the handlers with
+# invalidate_cache evict only the resources depending on the tags they
+# modify.
+#
+# The concurrent requests of a resource not cached are served by a single
+# rebuild of the resource.
+#
+# The resources are cached already serialized and compressed together with
+# their ETag so that the cache hits do not involve any encoding.
+import json
+import time
+import types
+import zlib
+
 from twisted.internet import defer
 
+from globaleaks.security import sha256
+
+# the tags of the data the cached resources depend on
+ALL_TAGS = frozenset(['node', 'contexts', 'receivers', 'questionnaires', 'files', 'l10n'])
+
+
+def get_tags(tags):
+    """
+    Return the set of tags represented by the value of the attributes
+    cache_resource and invalidate_cache (True stands for all the tags)
+    """
+    if tags is True or tags is None:
+        return ALL_TAGS
+
+    if isinstance(tags, basestring):
+        return frozenset([tags])
+
+    return frozenset(tags)
+
+
+class CachedResponse(object):
+    """
+    A cached resource, with its serialization in JSON (plain and gzipped)
+    """
+    def __init__(self, data):
+        self.data = data
+
+        if isinstance(data, types.DictType) or isinstance(data, types.ListType):
+            self.body = json.dumps(data)
+            self.content_type = b'application/json'
+        else:
+            self.body = bytes(data)
+            self.content_type = None
+
+        encoder = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.gzip_body = encoder.compress(self.body) + encoder.flush()
+
+        self.etag = b'"%s"' % sha256(self.body)
+        self.gzip_etag = b'"%s-gzip"' % sha256(self.body)
+
+    def match(self, if_none_match):
+        """
+        Return True if the value of an If-None-Match header matches the resource
+        """
+        if if_none_match is None:
+            return False
+
+        etags = [etag.strip() for etag in if_none_match.split(b',')]
+
+        return b'*' in etags or self.etag in etags or self.gzip_etag in etags
+
 
 class GLApiCache(object):
     memory_cache_dict = {}
+    tags_index = {}
+    pending = {}
+    stats = {
+        'hits': 0,
+        'misses': 0,
+        'coalesced': 0,
+        'rebuilds': 0,
+        'rebuild_time': 0.0
+    }
 
     @classmethod
     def get(cls, resource, language):
+        entry = cls.get_entry(resource, language)
+        if entry is not None:
+            return entry.data
+
+    @classmethod
+    def get_entry(cls, resource, language):
         if resource in cls.memory_cache_dict \
                 and language in cls.memory_cache_dict[resource]:
             return cls.memory_cache_dict[resource][language]
 
     @classmethod
-    def set(cls, resource, language, value):
+    def set(cls, resource, language, value, tags=None):
         if resource not in GLApiCache.memory_cache_dict:
             cls.memory_cache_dict[resource] = {}
 
-        cls.memory_cache_dict[resource][language] = value
+        cls.memory_cache_dict[resource][language] = CachedResponse(value)
+
+        cls.index(resource, tags)
+
+    @classmethod
+    def index(cls, resource, tags):
+        for tag in get_tags(tags):
+            cls.tags_index.setdefault(tag, set()).add(resource)
 
     @classmethod
-    def invalidate(cls):
-        cls.memory_cache_dict.clear()
+    def get_or_build(cls, resource, language, tags, f, *args, **kwargs):
+        """
+        Return the cached resource or build it with f.
+
+        If the resource is already being built the result of the pending
+        build is returned instead of starting a new one.
+        """
+        value = cls.get(resource, language)
+        if value is not None:
+            cls.stats['hits'] += 1
+            return value
+
+        key = (resource, language)
+        if key in cls.pending:
+            cls.stats['coalesced'] += 1
+            d = defer.Deferred()
+            cls.pending[key].append(d)
+            return d
+
+        cls.stats['misses'] += 1
+
+        start = time.time()
+        value = f(*args, **kwargs)
+        if not isinstance(value, defer.Deferred):
+            cls.record_rebuild(start)
+            cls.set(resource, language, value, tags)
+            return value
+
+        cls.index(resource, tags)
+        waiters = cls.pending[key] = []
 
+        def callback(data):
+            cls.record_rebuild(start)
 
-def decorator_cache_get(f):
+            # the result is cached only if the resource has not been
+            # invalidated while it was being built
+            if cls.pending.get(key) is waiters:
+                del cls.pending[key]
+                cls.set(resource, language, data, tags)
+
+            for d in waiters:
+                d.callback(data)
+
+            return data
+
+        def errback(failure):
+            if cls.pending.get(key) is waiters:
+                del cls.pending[key]
+
+            for d in waiters:
+                d.errback(failure)
+
+            return failure
+
+        value.addCallbacks(callback, errback)
+
+        return value
+
+    @classmethod
+    def record_rebuild(cls, start):
+        cls.stats['rebuilds'] += 1
+        cls.stats['rebuild_time'] += time.time() - start
+
+    @classmethod
+    def invalidate(cls, tags=None):
+        """
+        Evict, in every language, the resources depending on the given tags;
+        all the resources are evicted if no tag is specified.
+        """
+        if tags is None:
+            cls.memory_cache_dict.clear()
+            cls.tags_index.clear()
+            cls.pending.clear()
+            return
+
+        resources = set()
+        for tag in get_tags(tags):
+            resources.update(cls.tags_index.get(tag, ()))
+
+        for resource in resources:
+            cls.memory_cache_dict.pop(resource, None)
+
+        for key in cls.pending.keys():
+            if key[0] in resources:
+                del cls.pending[key]
+
+    @classmethod
+    def get_stats(cls):
+        stats = dict(cls.stats)
+        stats['resources'] = sum(len(x) for x in cls.memory_cache_dict.values())
+        stats['pending'] = len(cls.pending)
+
+        return stats
+
+
+def decorator_cache_get(f, tags=None):
     def decorator_cache_get_wrapper(self, *args, **kwargs):
-        c = GLApiCache.get(self.request.path, self.request.language)
-        if c is None:
-            c = f(self, *args, **kwargs)
-            if isinstance(c, defer.Deferred):
-                def callback(data):
-                    GLApiCache.set(self.request.path, self.request.language, data)
+        resource, language = self.request.path, self.request.language
+
+        def set_cached_response(data):
+            # the serialized response is used only if it is the one of the
+            # returned data (i.e. the resource has not been invalidated)
+            entry = GLApiCache.get_entry(resource, language)
+            if entry is not None and entry.data is data:
+                self.cached_response = entry
 
-                    return data
+            return data
 
-                c.addCallback(callback)
-            else:
-                GLApiCache.set(self.request.path, self.request.language, c)
+        c = GLApiCache.get_or_build(resource, language, tags, f, self, *args, **kwargs)
+        if isinstance(c, defer.Deferred):
+            return c.addCallback(set_cached_response)
 
-        return c
+        return set_cached_response(c)
 
     return decorator_cache_get_wrapper
 
 
-def decorator_cache_invalidate(f):
+def decorator_cache_invalidate(f, tags=None):
     def decorator_cache_invalidate_wrapper(self, *args, **kwargs):
-        GLApiCache.invalidate()
-        return f(self, *args, **kwargs)
+        tags_set = get_tags(tags)
+
+        GLApiCache.invalidate(tags_set)
+        ret = f(self, *args, **kwargs)
+
+        # the resources rebuilt while the handler was modifying the data
+        # are evicted again when the modification is completed
+        if isinstance(ret, defer.Deferred):
+            def callback(result):
+                GLApiCache.invalidate(tags_set)
+                return result
+
+            ret.addBoth(callback)
+
+        return ret
 
     return decorator_cache_invalidate_wrapper
@@ -382,7 +382,13 @@ class SubmissionDisabled(GLException):
     status_code = 503  # Service not available
 
 
-# UNUSED ERROR CODE 53, 54, 55, 56, 57 HERE!
+class ServiceOverloaded(GLException):
+    reason = "The node is overloaded, please retry later"
+    error_code = 54
+    status_code = 503  # Service not available
+
+
+# UNUSED ERROR CODE 55, 56, 57 HERE!
 
 
 class FieldIdNotFound(GLException):
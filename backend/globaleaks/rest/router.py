@@ -0,0 +1,168 @@
+# -*- coding: UTF-8
+#   router
+#   ******
+#
+#   Implementation of the segment tree used to route the requests to the
+#   handlers defined by the api_spec.
+#
+#   The literal segments of the routes are looked up in dictionaries and
+#   regular expressions are evaluated only for the parametric segments
+#   (e.g. uuids and tokens). The parts of a route that may match a '/'
+#   (e.g. the catch all of the static files) are kept as a regular expression
+#   evaluated against the remaining part of the path.
+#
+#   When more routes match the same path, the first one in order of insertion
+#   is returned, exactly as with a linear scan of the routes.
+import re
+
+REGEXP_METACHARS = set('.^$*+?{}[]\\|()')
+QUANTIFIERS = set('*+?{')
+NOT_SEGMENT_SAFE = ['.', '\\/', '[^', '\\W', '\\S', '\\D']
+
+
+def split_pattern(pattern):
+    """
+    Split a regular expression on the '/' not escaped and not included in
+    character classes or groups.
+
+    Returns None if the regular expression contains a top level alternation.
+    """
+    segments = []
+    current = ''
+    escape = False
+    bracket = False
+    depth = 0
+
+    for c in pattern:
+        if escape:
+            escape = False
+        elif c == '\\':
+            escape = True
+        elif bracket:
+            if c == ']':
+                bracket = False
+        elif c == '[':
+            bracket = True
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif depth == 0 and c == '|':
+            return None
+        elif depth == 0 and c == '/':
+            segments.append(current)
+            current = ''
+            continue
+
+        current += c
+
+    segments.append(current)
+
+    return segments
+
+
+def is_literal(segment):
+    return not any(c in REGEXP_METACHARS for c in segment)
+
+
+def is_segment_safe(segment):
+    """
+    Return True if the regular expression can't match a '/'
+    """
+    return '/' not in segment and not any(x in segment for x in NOT_SEGMENT_SAFE)
+
+
+class RouterNode(object):
+    def __init__(self):
+        self.literals = {}
+        self.params = []
+        self.tails = []
+        self.routes = []
+
+
+class Router(object):
+    def __init__(self):
+        self.root = RouterNode()
+        self.values = []
+
+    def add(self, pattern, value):
+        index = len(self.values)
+        self.values.append(value)
+
+        if pattern.startswith('^'):
+            pattern = pattern[1:]
+
+        if pattern.endswith('$') and not pattern.endswith('\\$'):
+            pattern = pattern[:-1]
+
+        segments = split_pattern(pattern)
+
+        if segments is None or any(s[:1] in QUANTIFIERS for s in segments[1:]):
+            # fallback to the evaluation of the full regular expression
+            self.root.tails.append((index, re.compile('(?:%s)$' % pattern)))
+            return
+
+        node = self.root
+        for i, segment in enumerate(segments):
+            if is_literal(segment):
+                node = node.literals.setdefault(segment, RouterNode())
+            elif is_segment_safe(segment):
+                regexp = re.compile('(?:%s)$' % segment)
+                for r, child in node.params:
+                    if r.pattern == regexp.pattern:
+                        node = child
+                        break
+                else:
+                    child = RouterNode()
+                    node.params.append((regexp, child))
+                    node = child
+            else:
+                tail = '/'.join(segments[i:])
+                node.tails.append((index, re.compile('(?:%s)$' % tail)))
+                return
+
+        node.routes.append(index)
+
+    def match(self, path):
+        """
+        Return a tuple (value, groups) for the first route matching the path
+        or None if no route matches.
+        """
+        best = [len(self.values), None]
+
+        self._match(self.root, path.split('/'), 0, (), best)
+
+        if best[1] is None:
+            return None
+
+        return self.values[best[0]], best[1]
+
+    def _match(self, node, segments, i, groups, best):
+        if i == len(segments):
+            for index in node.routes:
+                if index < best[0]:
+                    best[0], best[1] = index, groups
+            return
+
+        child = node.literals.get(segments[i])
+        if child is not None:
+            self._match(child, segments, i + 1, groups, best)
+
+        for regexp, child in node.params:
+            m = regexp.match(segments[i])
+            if m is not None:
+                self._match(child, segments, i + 1, groups + m.groups(), best)
+
+        # the tails are evaluated last and only if they could
+        # precede the best route found in the subtree
+        remaining = None
+        for index, regexp in node.tails:
+            if index >= best[0]:
+                continue
+
+            if remaining is None:
+                remaining = '/'.join(segments[i:])
+
+            m = regexp.match(remaining)
+            if m is not None:
+                best[0], best[1] = index, groups + m.groups()
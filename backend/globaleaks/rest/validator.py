@@ -0,0 +1,236 @@
+# -*- coding: UTF-8
+#   validator
+#   *********
+#
+#   Implementation of the validation of the JSON messages against the
+#   message templates defined in globaleaks.rest.requests.
+#
+#   Every template is compiled only once into a tree of closures where the
+#   kind of each node (python type, regexp, dict, list) is resolved at
+#   compile time and the regular expressions are precompiled; the validation
+#   of a message then only consists in the execution of the closures.
+import collections
+import re
+
+from globaleaks.rest import errors, requests
+from globaleaks.utils.utility import log
+
+# cache of the compiled templates indexed by the id of the template;
+# the template itself is kept in the cache in order to grant that its id
+# could not be reused by another object.
+_compiled = {}
+
+
+def validate_python_type(value, python_type):
+    """
+    Return True if the python class instantiates the specified python_type.
+    """
+    if value is None:
+        return True
+
+    return compile_python_type(python_type)(value)
+
+
+def validate_regexp(value, type):
+    """
+    Return True if the python class matches the given regexp.
+    """
+    return compile_regexp(type)(value)
+
+
+def compile_python_type(python_type):
+    if python_type == requests.SkipSpecificValidation:
+        return lambda value: True
+
+    if python_type == int:
+        def check_int(value):
+            try:
+                int(value)
+                return True
+            except Exception:
+                return False
+
+        return check_int
+
+    if python_type == bool:
+        return lambda value: value == u'true' or value == u'false' or isinstance(value, bool)
+
+    return lambda value: isinstance(value, python_type)
+
+
+def compile_regexp(type):
+    match = re.compile(type).match
+
+    def check_regexp(value):
+        try:
+            value = unicode(value)
+        except Exception:
+            return False
+
+        return match(value) is not None
+
+    return check_regexp
+
+
+def compile_type(type):
+    """
+    Compile a type descriptor into a function returning True if a value
+    is valid for the descriptor and False otherwise.
+
+    The descriptors of kind dict raise InvalidInputFormat instead of
+    returning False.
+    """
+    # if it's callable, than assumes is a primitive class
+    if callable(type):
+        check = compile_python_type(type)
+        error = "-- Invalid python_type, in [%s] expected %s"
+    # value as "{foo:bar}"
+    elif isinstance(type, collections.Mapping):
+        check = get_validator(type)
+        error = "-- Invalid JSON/dict [%s] expected %s"
+    # regexp
+    elif isinstance(type, str):
+        check = compile_regexp(type)
+        error = "-- Failed Match in regexp [%s] against %s"
+    # value as "[ type ]"
+    elif isinstance(type, collections.Iterable):
+        check = compile_list(type)
+        error = "-- List validation failed [%s] of %s"
+    else:
+        def check(value):
+            raise AssertionError
+
+        error = None
+
+    def validate_type(value):
+        if value is None:
+            log.err("-- Invalid python_type, in [%s] expected %s" % (value, type))
+            return False
+
+        if check(value):
+            return True
+
+        log.err(error % (value, type))
+        return False
+
+    return validate_type
+
+
+def compile_list(type):
+    # the type of the elements is compiled only if the template
+    # declares it; an empty template accepts only empty lists
+    check = get_type_validator(type[0]) if len(type) else None
+
+    def validate_list(value):
+        # empty list is ok
+        if len(value) == 0:
+            return True
+
+        if check is None:
+            raise IndexError("list index out of range")
+
+        return all(check(x) for x in value)
+
+    return validate_list
+
+
+def compile_dict(message_template):
+    # the keys are converted to unicode as the ones of the parsed JSON messages
+    # in order to avoid their decoding at every lookup
+    keys = dict((unicode(key) if isinstance(key, str) else key, key) for key in message_template)
+    checks = [(key, get_type_validator(message_template[k])) for key, k in keys.iteritems()]
+
+    def validate_dict(jmessage):
+        if not isinstance(jmessage, dict):
+            raise errors.InvalidInputFormat("invalid json massage: expected dict or list")
+
+        # strip whatever is not validated
+        #
+        # reminder: it's not possible to raise an exception for the
+        # in case more values are present because it's normal that the
+        # client will send automatically more data.
+        #
+        # e.g. the client will always send 'creation_date' attributes of
+        #      objects and attributes like this are present generally only
+        #      from the second request on.
+        #
+        for key in [key for key in jmessage if key not in keys]:
+            del jmessage[key]
+
+        for key, check in checks:
+            if key not in jmessage:
+                log.debug("Key %s expected but missing!" % key)
+                log.debug("Received schema %s - Expected %s" %
+                          (jmessage.keys(), message_template.keys()))
+                raise errors.InvalidInputFormat("Missing key %s" % key)
+
+            if not check(jmessage[key]):
+                log.err("Received key %s: type validation fail " % key)
+                raise errors.InvalidInputFormat("Key (%s) type validation failure" % key)
+
+        return True
+
+    return validate_dict
+
+
+def compile_message_list(message_template):
+    check = get_type_validator(message_template[0])
+
+    def validate_message_list(jmessage):
+        if not all(check(x) for x in jmessage):
+            raise errors.InvalidInputFormat("Not every element in %s is %s" %
+                                            (jmessage, message_template[0]))
+        return True
+
+    return validate_message_list
+
+
+def _lookup(template, compiler):
+    key = (id(template), compiler)
+    entry = _compiled.get(key)
+    if entry is None or entry[0] is not template:
+        entry = (template, compiler(template))
+        _compiled[key] = entry
+
+    return entry[1]
+
+
+def get_type_validator(type):
+    """
+    Return the compiled validator of a type descriptor.
+    """
+    return _lookup(type, compile_type)
+
+
+def get_validator(message_template):
+    """
+    Return the compiled validator of a message template.
+
+    The validator strips from the message the keys not present in the
+    template, returns True if the message is valid and raises
+    InvalidInputFormat otherwise.
+    """
+    if isinstance(message_template, dict):
+        return _lookup(message_template, compile_dict)
+
+    if isinstance(message_template, list):
+        return _lookup(message_template, compile_message_list)
+
+    raise errors.InvalidInputFormat("invalid json massage: expected dict or list")
+
+
+def validate_jmessage(jmessage, message_template):
+    return get_validator(message_template)(jmessage)
+
+
+def compile_requests():
+    """
+    Compile all the message templates defined in globaleaks.rest.requests
+    """
+    for name in dir(requests):
+        template = getattr(requests, name)
+        if name.endswith(('Desc', 'DescRaw')) and isinstance(template, (dict, list)):
+            get_validator(template)
+
+
+compile_requests()
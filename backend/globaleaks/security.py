@@ -7,14 +7,21 @@
 
 import base64
 import binascii
+import collections
 import json
 import os
 import random
 import shutil
 import string
+import subprocess
+import threading
 import time
+from contextlib import contextmanager
 from tempfile import _TemporaryFileWrapper
 
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThreadPool
+
 import scrypt
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import constant_time, hashes
@@ -68,51 +75,82 @@ def generateRandomPassword():
     return generateRandomKey(10)
 
 
-def _overwrite(absolutefpath, pattern):
-    filesize = os.path.getsize(absolutefpath)
-    bytecnt = 0
-    with open(absolutefpath, 'w+') as f:
-        f.seek(0)
-        while bytecnt < filesize:
-            f.write(pattern)
-            bytecnt += len(pattern)
+class IORateLimiter(object):
+    """
+    Token bucket shared by threads in order to limit the rate of the
+    writes in bytes per second; a rate of 0 disables the limit.
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_write = 0
 
+    def consume(self, size):
+        if not self.rate:
+            return
 
-def overwrite_and_remove(absolutefpath, iterations_number=1):
-    """
-    Overwrite the file with all_zeros, all_ones, random patterns
+        with self.lock:
+            now = time.time()
+            start = max(self.next_write, now)
+            self.next_write = start + float(size) / self.rate
 
-    Note: At each iteration the original size of the file is altered.
-    """
+        if start > now:
+            time.sleep(start - now)
 
-    if random.randint(1, 5) == 3:
-        iterations_number += 1
 
-    log.debug("Starting secure deletion of file %s" % absolutefpath)
+def get_overwrite_pattern(kind, size):
+    if kind == 'zeros':
+        return b'\x00' * size
+    elif kind == 'ones':
+        return b'\xff' * size
+    elif kind == 'random':
+        return os.urandom(size)
 
-    try:
-        # in the following loop, the file is open and closed on purpose, to trigger flush operations
-        all_zeros = "\0\0\0\0" * 1024               # 4kb of zeros
-        all_ones = "FFFFFFFF".decode("hex") * 1024  # 4kb of ones
+    raise ValueError("Invalid overwrite pattern: %s" % kind)
 
-        for iteration in xrange(iterations_number):
-            OPTIMIZATION_RANDOM_BLOCK = 4096 + random.randint(1, 4096)
 
-            random_pattern = ""
-            for _ in xrange(OPTIMIZATION_RANDOM_BLOCK):
-                random_pattern += str(random.randrange(256))
+def _overwrite(fd, filesize, pattern, rate_limiter):
+    os.lseek(fd, 0, os.SEEK_SET)
 
-            log.debug("Excecuting rewrite iteration (%d out of %d)" %
-                      (iteration, iterations_number))
+    bytecnt = 0
+    while bytecnt < filesize:
+        block = pattern[:filesize - bytecnt]
+        rate_limiter.consume(len(block))
+        bytecnt += os.write(fd, block)
+
+    os.fsync(fd)
+
+
+def overwrite_and_remove(absolutefpath, passes=None, rate_limiter=None):
+    """
+    Overwrite the file in place with the patterns of the passes configured
+    (all_zeros, all_ones, random) and remove it.
+
+    The file is written with buffers of GLSettings.secure_delete_buffer_size
+    bytes and synced to disk at the end of every pass.
 
-            _overwrite(absolutefpath, all_zeros)
-            log.debug("Overwritten file %s with all zeros pattern" % absolutefpath)
+    @param passes: the list of the patterns, GLSettings.secure_delete_passes if None
+    @param rate_limiter: the IORateLimiter limiting the writes
+    """
+    if passes is None:
+        passes = GLSettings.secure_delete_passes
 
-            _overwrite(absolutefpath, all_ones)
-            log.debug("Overwritten file %s with all ones pattern" % absolutefpath)
+    if rate_limiter is None:
+        rate_limiter = IORateLimiter(GLSettings.secure_delete_rate * 1024 * 1024)
 
-            _overwrite(absolutefpath, random_pattern)
-            log.debug("Overwritten file %s with random pattern" % absolutefpath)
+    log.debug("Starting secure deletion of file %s" % absolutefpath)
+
+    try:
+        fd = os.open(absolutefpath, os.O_WRONLY)
+        try:
+            filesize = os.fstat(fd).st_size
+            buffer_size = min(filesize, GLSettings.secure_delete_buffer_size)
+
+            for kind in passes:
+                _overwrite(fd, filesize, get_overwrite_pattern(kind, buffer_size), rate_limiter)
+                log.debug("Overwritten file %s with %s pattern" % (absolutefpath, kind))
+        finally:
+            os.close(fd)
 
     except Exception as e:
         log.err("Unable to perform secure overwrite for file %s: %s" %
@@ -128,6 +166,43 @@ def overwrite_and_remove(absolutefpath, iterations_number=1):
     log.debug("Performed deletion of file: %s" % absolutefpath)
 
 
+def overwrite_and_remove_files(paths, callback=None):
+    """
+    Securely delete the files on GLSettings.secure_delete_concurrency
+    threads sharing the rate budget of GLSettings.secure_delete_rate MB/s
+
+    @param paths: the paths of the files to be deleted
+    @param callback: function called with the path of every file deleted
+    """
+    rate_limiter = IORateLimiter(GLSettings.secure_delete_rate * 1024 * 1024)
+
+    queue = collections.deque(paths)
+
+    def worker():
+        while True:
+            try:
+                path = queue.popleft()
+            except IndexError:
+                return
+
+            overwrite_and_remove(path, rate_limiter=rate_limiter)
+
+            if callback is not None:
+                try:
+                    callback(path)
+                except Exception as excep:
+                    log.err("Unable to complete the secure deletion of file %s: %s" % (path, excep))
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(min(GLSettings.secure_delete_concurrency, len(queue)))]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+
 class GLSecureTemporaryFile(_TemporaryFileWrapper):
     """
     WARNING!
@@ -135,6 +210,7 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
     check .read and .write!
     """
     last_action = 'init'
+    size = 0
 
     def __init__(self, filedir):
         """
@@ -210,10 +286,41 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
                 data = data.encode('utf-8')
 
             self.file.write(self.encryptor.update(data))
+            self.size += len(data)
         except Exception as wer:
             log.err("Unable to write() in GLSecureTemporaryFile: %s" % wer.message)
             raise wer
 
+    def write_file_at(self, offset, other):
+        """
+        Write the content of another GLSecureTemporaryFile at the given
+        offset and close it.
+
+        AES-CTR allows to encrypt starting from any offset of the key
+        stream and so to write the chunks of a file in any order.
+        """
+        self.last_action = 'write'
+
+        block, skip = divmod(offset, 16)
+        counter = (int(binascii.hexlify(self.key_counter_nonce), 16) + block) % (1 << 128)
+        counter = binascii.unhexlify('%032x' % counter)
+
+        encryptor = Cipher(algorithms.AES(self.key), modes.CTR(counter), backend=crypto_backend).encryptor()
+        encryptor.update(b'\x00' * skip)
+
+        self.file.seek(offset)
+
+        try:
+            data = other.read(GLSettings.file_chunk_size)
+            while data:
+                self.file.write(encryptor.update(data))
+                offset += len(data)
+                data = other.read(GLSettings.file_chunk_size)
+        finally:
+            other.close()
+
+        self.size = max(self.size, offset)
+
     def close(self):
         if not self.close_called:
             try:
@@ -344,6 +451,86 @@ def change_password(old_password_hash, old_password, new_password, salt):
     return hash_password(new_password, salt)
 
 
+class GLBKDFPool(object):
+    """
+    Executes the key derivations on the dedicated thread pool
+    GLSettings.kdf_tp so that they never run inside a transaction.
+
+    The scrypt library releases the GIL and the derivations are executed in
+    parallel; the number of concurrent derivations is halved at every level
+    of the activity stress computed by the Alarm and the exceeding ones are
+    queued in order of arrival.
+
+    The derivations of the submissions are queued apart and executed before
+    the ones of the logins so that a flood of logins does not delay them.
+    """
+    def __init__(self):
+        self.running = 0
+        self.queues = {
+            'submission': collections.deque(),
+            'login': collections.deque()
+        }
+        self.stats = {
+            'completed': 0,
+            'queued': 0
+        }
+
+    def get_limit(self):
+        from globaleaks.anomaly import Alarm
+
+        return max(1, GLSettings.kdf_tp_size >> Alarm.stress_levels['activity'])
+
+    def run(self, queue, function, *args):
+        """
+        @param queue: the queue of the derivation, 'submission' or 'login'
+        """
+        d = defer.Deferred()
+
+        self.queues[queue].append((d, function, args))
+        if self.running >= self.get_limit():
+            self.stats['queued'] += 1
+
+        self.process()
+
+        return d
+
+    def process(self):
+        while self.running < self.get_limit():
+            queue = self.queues['submission'] or self.queues['login']
+            if not queue:
+                break
+
+            d, function, args = queue.popleft()
+            self.running += 1
+            deferToThreadPool(reactor, GLSettings.kdf_tp, function, *args).addBoth(self.done).chainDeferred(d)
+
+    def done(self, result):
+        self.running -= 1
+        self.stats['completed'] += 1
+        self.process()
+        return result
+
+    def hash_password(self, password, salt, queue='login'):
+        return self.run(queue, hash_password, password, salt)
+
+    def check_password(self, guessed_password, salt, password_hash):
+        return self.run('login', check_password, guessed_password, salt, password_hash)
+
+    def change_password(self, old_password_hash, old_password, new_password, salt):
+        return self.run('login', change_password, old_password_hash, old_password, new_password, salt)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['limit'] = self.get_limit()
+        stats['running'] = self.running
+        stats['waiting'] = sum(len(queue) for queue in self.queues.values())
+
+        return stats
+
+
+GLKDFPool = GLBKDFPool()
+
+
 class GLBPGP(object):
     """
     PGP does not have a dedicated class, because one of the function is called inside a transact.
@@ -412,6 +599,25 @@ class GLBPGP(object):
 
         return encrypted_obj,  os.stat(output_path).st_size
 
+    def start_encrypt_file(self, key_fingerprint, output_path):
+        """
+        Start the encryption with the specified PGP key of a file that should
+        be written to the stdin of the returned gpg process.
+
+        The output is the same of encrypt_file and is written to output_path.
+        """
+        args = [self.gnupg.gpgbinary,
+                '--homedir', self.gnupg.gnupghome,
+                '--no-tty', '--batch', '--yes',
+                '--trust-model', 'always',
+                '--armor',
+                '--recipient', str(key_fingerprint),
+                '--output', output_path,
+                '--encrypt']
+
+        with open(os.devnull, 'wb') as devnull:
+            return subprocess.Popen(args, stdin=subprocess.PIPE, stdout=devnull, stderr=devnull, close_fds=True)
+
     def encrypt_message(self, key_fingerprint, plaintext):
         """
         Encrypt a text message with the specified key
@@ -430,19 +636,140 @@ class GLBPGP(object):
             log.err("Unable to clean temporary PGP environment: %s: %s" % (self.gnupg.gnupghome, excep))
 
 
-def encrypt_pgp_message(pgp_key_public, pgp_key_fingerprint, msg):
-    gpob = GLBPGP()
+class GLBPGPKeyring(object):
+    """
+    LRU cache of the GnuPG environments each one loaded with a single key.
 
-    try:
-        gpob.load_key(pgp_key_public)
-        body = gpob.encrypt_message(pgp_key_fingerprint, msg)
-    except:
-        raise
-    finally:
-        # The finally statement is always called also if except contains a
-        # return or a raise
-        gpob.destroy_environment()
-    return body
+    The environments are kept across the operations so that the GnuPG home
+    is created and the key is imported only the first time a key is used.
+    The environments are indexed by the sha256 of the armored key so that
+    any change of the key of a user implies the creation of a new one.
+
+    The environments in use are never destroyed; if evicted or invalidated
+    they are destroyed when released.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+    def acquire(self, key):
+        """
+        @param key: an armored PGP public key
+        @return: the environment entry with keys 'gpob', 'fingerprint' and 'expiration'
+        """
+        key_id = sha256(key.encode('utf-8') if isinstance(key, unicode) else key)
+
+        with self.lock:
+            entry = self.entries.pop(key_id, None)
+            if entry is not None and os.path.isdir(entry['gpob'].gnupg.gnupghome):
+                self.stats['hits'] += 1
+                entry['users'] += 1
+                self.entries[key_id] = entry
+                return entry
+
+            if entry is not None:
+                # the environment has been removed from the filesystem
+                self.destroy(entry)
+
+            self.stats['misses'] += 1
+
+        gpob = GLBPGP()
+        try:
+            k = gpob.load_key(key)
+        except:
+            gpob.destroy_environment()
+            raise
+
+        entry = {
+            'gpob': gpob,
+            'fingerprint': k['fingerprint'],
+            'expiration': k['expiration'],
+            'users': 1,
+            'evicted': False
+        }
+
+        with self.lock:
+            previous = self.entries.pop(key_id, None)
+            if previous is not None:
+                self.destroy(previous)
+
+            self.entries[key_id] = entry
+
+            self.evict()
+
+        return entry
+
+    def release(self, entry):
+        with self.lock:
+            entry['users'] -= 1
+            if entry['evicted']:
+                self.destroy(entry)
+
+    @contextmanager
+    def use(self, key):
+        """
+        Context manager returning the GLBPGP instance loaded with the key
+        """
+        entry = self.acquire(key)
+        try:
+            yield entry['gpob']
+        finally:
+            self.release(entry)
+
+    def evict(self):
+        for key_id in list(self.entries.keys()):
+            if len(self.entries) <= self.size:
+                break
+
+            entry = self.entries[key_id]
+            if entry['users'] == 0:
+                del self.entries[key_id]
+                self.stats['evictions'] += 1
+                self.destroy(entry)
+
+    def destroy(self, entry):
+        entry['evicted'] = True
+        if entry['users'] == 0:
+            entry['gpob'].destroy_environment()
+
+    def invalidate(self, fingerprint):
+        """
+        Destroy the environments of the key with the specified fingerprint
+        """
+        with self.lock:
+            for key_id, entry in self.entries.items():
+                if entry['fingerprint'] == fingerprint:
+                    del self.entries[key_id]
+                    self.destroy(entry)
+
+    def clear(self):
+        with self.lock:
+            for entry in self.entries.values():
+                self.destroy(entry)
+
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['size'] = self.size
+            stats['entries'] = len(self.entries)
+
+        return stats
+
+
+GLPGPKeyring = GLBPGPKeyring(GLSettings.pgp_keyring_size)
+
+
+def encrypt_pgp_message(pgp_key_public, pgp_key_fingerprint, msg):
+    with GLPGPKeyring.use(pgp_key_public) as gpob:
+        return gpob.encrypt_message(pgp_key_fingerprint, msg)
 
 
 def parse_pgp_key(key):
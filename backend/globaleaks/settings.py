@@ -71,6 +71,48 @@ class GLSettingsClass(object):
         # thread pool size of 1
         self.orm_tp = ThreadPool(1, 1)
 
+        # number of persistent connections used by the writer;
+        # the writes are serialized by the transact_lock
+        self.orm_pool_size = 1
+
+        # thread pool dedicated to read-only transactions;
+        # with the WAL journal the readers do not block the single writer
+        self.orm_ro_tp_size = 4
+        self.orm_ro_tp = ThreadPool(1, self.orm_ro_tp_size)
+
+        # maximum number of concurrent requests and of queued requests of
+        # each class of endpoints; both are halved at every activity stress
+        # level and the requests exceeding them are rejected with a 503
+        self.admission_limits = {
+            'token': {'concurrency': 32, 'queue': 128},
+            'upload': {'concurrency': 8, 'queue': 32},
+            'login': {'concurrency': 8, 'queue': 32},
+            'export': {'concurrency': 2, 'queue': 8}
+        }
+
+        # seconds suggested to the clients of the rejected requests, doubled
+        # at every activity stress level
+        self.admission_retry_after = 5
+
+        # number of trailing zero hex digits of the hash of the proof of work
+        # of the tokens, increased by one at every activity stress level
+        self.proof_of_work_difficulty = 2
+
+        # thread pool dedicated to the key derivations (scrypt) of the
+        # passwords and of the receipts, executed outside the transactions
+        self.kdf_tp_size = 4
+        self.kdf_tp = ThreadPool(1, self.kdf_tp_size)
+
+        # maximum number of PGP encryptions of the files (one gpg process
+        # for each receiver) performed concurrently by the delivery job
+        self.delivery_concurrency = 4
+
+        # number of GnuPG environments kept loaded with the keys of the users
+        self.pgp_keyring_size = 100
+
+        # number of localized questionnaire schemas kept in memory
+        self.schema_cache_size = 500
+
         self.bind_address = '0.0.0.0'
         self.bind_remote_ports = [80, 443]
         self.bind_local_ports = [8082, 8083]
@@ -100,11 +142,16 @@ class GLSettingsClass(object):
 
         self.authentication_lifetime = 3600
 
+        # backend where the sessions are written: 'memory' or 'sqlite';
+        # the sqlite table is kept in the ramdisk and survives a restart
+        self.sessions_store = 'memory'
+
         self.jobs = []
         self.jobs_monitor = None
 
-        self.RecentEventQ = []
+        self.RecentEvents = {}
         self.RecentAnomaliesQ = {}
+        self.RecentLatencies = {}
         self.stats_collection_start_time = datetime_now()
 
         self.accept_submissions = True
@@ -182,6 +229,48 @@ class GLSettingsClass(object):
         # size used while streaming files
         self.file_chunk_size = 65535 # 64kb
 
+        # secure deletion of the files: patterns of the passes overwriting
+        # the files, size of the buffers written (multiple of the 4kb blocks),
+        # number of files deleted concurrently and limit of the rate of the
+        # writes in MB/s shared by the deletions (0 means no limit)
+        self.secure_delete_passes = ['zeros', 'ones', 'random']
+        self.secure_delete_buffer_size = 1024 * 1024 # 1MB
+        self.secure_delete_concurrency = 4
+        self.secure_delete_rate = 0
+
+        # the secure deletion job is woken up after the delay (seconds) from
+        # the marking of new files and deletes them in batches, pausing after
+        # every batch for its execution time multiplied by the backoff factor
+        self.secure_delete_wakeup_delay = 1
+        self.secure_delete_batch_size = 100
+        self.secure_delete_backoff = 1
+
+        # maximum number of tips returned by a request of the receiver tips list
+        self.receiver_tips_page_size = 1000
+
+        # maximum number of rows returned by a request of the admin overviews
+        # of the tips and of the files and number of rows read from the
+        # database for every chunk of the response streamed to the client
+        self.admin_overview_page_size = 10000
+        self.admin_overview_batch_size = 500
+
+        # upper bounds in seconds of the buckets of the histograms of the
+        # latencies of the requests recorded by the statistics
+        self.stats_latency_buckets = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+        # number of days the statistics aggregated by hour, by day and by
+        # week are kept
+        self.stats_retention = {
+            'hour': 90,
+            'day': 2 * 365,
+            'week': 10 * 365
+        }
+
+        # time after which the files uploaded in chunks and not completed
+        # are discarded and maximum number of chunks of a file
+        self.upload_timeout = 3600 # seconds
+        self.upload_max_chunks = 10000
+
         self.AES_key_size = 32
         self.AES_key_id_regexp = u'[A-Za-z0-9]{16}'
         self.AES_counter_nonce = 128 / 8
@@ -205,6 +294,19 @@ class GLSettingsClass(object):
         self.mail_timeout = 15 # seconds
         self.mail_attempts_limit = 3 # per mail limit
 
+        # concurrent SMTP sessions, mails delivered over the same session
+        # and time the sessions are kept open while idle
+        self.mail_sessions = 2
+        self.mail_session_max_mails = 100
+        self.mail_session_idle_timeout = 60 # seconds
+
+        # mails spooled at every run of the notification job and delays
+        # of the delivery retries, doubled at every failed attempt
+        self.mail_spool_size = 200
+        self.mail_retry_delay = 60 # seconds
+        self.mail_retry_max_delay = 3600 # seconds
+        self.mail_retry_limit = 10
+
         self.https_socks = []
         self.http_socks = []
 
@@ -217,8 +319,9 @@ class GLSettingsClass(object):
         self.acme_directory_url = 'https://acme-v01.api.letsencrypt.org/directory'
 
     def reset_hourly(self):
-        self.RecentEventQ[:] = []
+        self.RecentEvents.clear()
         self.RecentAnomaliesQ.clear()
+        self.RecentLatencies.clear()
         self.exceptions.clear()
         self.exceptions_email_count = 0
         self.mail_counters.clear()
@@ -247,6 +350,7 @@ class GLSettingsClass(object):
         self.db_file_name = 'glbackend-%d.db' % DATABASE_VERSION
         self.db_file_path = os.path.join(os.path.abspath(os.path.join(self.db_path, self.db_file_name)))
         self.db_uri = self.make_db_uri(self.db_file_path)
+        self.db_ro_uri = self.make_db_uri(self.db_file_path, readonly=True)
 
         self.logfile = os.path.abspath(os.path.join(self.log_path, 'globaleaks.log'))
         self.httplogfile = os.path.abspath(os.path.join(self.log_path, "http.log"))
@@ -325,6 +429,8 @@ class GLSettingsClass(object):
         if self.cmdline_options.ramdisk:
             self.ramdisk_path = self.cmdline_options.ramdisk
 
+        self.sessions_store = self.cmdline_options.sessions_store
+
         if self.cmdline_options.user and self.cmdline_options.group:
             self.user = self.cmdline_options.user
             self.group = self.cmdline_options.group
@@ -515,8 +621,13 @@ class GLSettingsClass(object):
                 self.print_msg("Error while evaluating removal for %s: %s" % (path, excep))
 
     @staticmethod
-    def make_db_uri(db_file_path):
-        return 'sqlite:' + db_file_path + '?foreign_keys=ON'
+    def make_db_uri(db_file_path, readonly=False):
+        uri = 'sqlite:' + db_file_path + '?foreign_keys=ON&auto_vacuum=FULL&journal_mode=WAL'
+
+        if readonly:
+            uri += '&query_only=ON'
+
+        return uri
 
     def start_jobs(self):
         from globaleaks.jobs import jobs_list
@@ -1,16 +1,21 @@
 # -*- coding: utf-8 -*-
 import json
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import fail, inlineCallbacks, maybeDeferred, returnValue, succeed
+from twisted.python.failure import Failure
+from twisted.web.test.requesthelper import DummyChannel
 
+from globaleaks import models
 from globaleaks.handlers.admin import overview
 from globaleaks.jobs.delivery_sched import DeliverySchedule
-from globaleaks.rest import requests
+from globaleaks.orm import transact
+from globaleaks.rest import errors, requests
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
 
-class TestTipsOverviewDesc(helpers.TestHandlerWithPopulatedDB):
-    _handler = overview.Tips
+class TestOverview(helpers.TestHandlerWithPopulatedDB):
+    response_desc = None
 
     @inlineCallbacks
     def setUp(self):
@@ -19,26 +24,184 @@ class TestTipsOverviewDesc(helpers.TestHandlerWithPopulatedDB):
         yield DeliverySchedule().run()
 
     @inlineCallbacks
-    def test_get(self):
+    def get(self, **args):
+        """
+        Return the rows of the page and the cursor of the next one
+        """
         handler = self.request({}, role='admin')
-        response = yield handler.get()
+        handler.request.args = dict((k, [v]) for k, v in args.items())
 
-        self.assertEqual(len(response), self.population_of_submissions)
-        self._handler.validate_message(json.dumps(response), requests.TipsOverviewDesc)
+        yield handler.get()
 
+        self.assertTrue(handler.request.finished)
 
-class TestFilesOverviewDesc(helpers.TestHandlerWithPopulatedDB):
-    _handler = overview.Files
+        response = handler.request.getResponseBody()
+        self._handler.validate_message(response, self.response_desc)
+
+        returnValue((json.loads(response),
+                     handler.request.responseHeaders.getRawHeaders(b'X-Next-Cursor', [None])[0]))
 
     @inlineCallbacks
-    def setUp(self):
-        yield helpers.TestHandlerWithPopulatedDB.setUp(self)
-        yield self.perform_full_submission_actions()
-        yield DeliverySchedule().run()
+    def get_all_pages(self, **args):
+        ret = []
+
+        while True:
+            page, cursor = yield self.get(**args)
+            ret.extend(page)
+
+            if cursor is None:
+                returnValue(ret)
+
+            args['cursor'] = cursor
+
+
+class TestTipsOverviewDesc(TestOverview):
+    _handler = overview.Tips
+    response_desc = requests.TipsOverviewDesc
 
     @inlineCallbacks
     def test_get(self):
+        tips, next_cursor = yield self.get()
+
+        self.assertEqual(len(tips), self.population_of_submissions)
+        self.assertIsNone(next_cursor)
+
+    @inlineCallbacks
+    def test_get_pages(self):
+        for order in ['asc', 'desc']:
+            tips, _ = yield self.get(order=order)
+
+            for limit in ['1', '2']:
+                pages = yield self.get_all_pages(limit=limit, order=order)
+                self.assertEqual(pages, tips)
+
+    @inlineCallbacks
+    def test_get_pages_while_tips_are_created(self):
+        page, cursor = yield self.get(order='asc', limit='1')
+
+        yield self.perform_full_submission_actions()
+
+        # the tips created meanwhile follow the ones already listed
+        tips, _ = yield self.get(order='asc')
+
+        pages = page + (yield self.get_all_pages(order='asc', limit='1', cursor=cursor))
+        self.assertEqual(pages, tips)
+
+    @inlineCallbacks
+    def test_get_page_while_tips_are_created(self):
+        get_overview_rows = overview.get_overview_rows
+        created = []
+
+        @inlineCallbacks
+        def get_overview_rows_creating_tips(*args):
+            if not created:
+                created.append(True)
+                yield self.perform_full_submission_actions()
+
+            ret = yield get_overview_rows(*args)
+            returnValue(ret)
+
+        self.patch(overview, 'get_overview_rows', get_overview_rows_creating_tips)
+        page, cursor = yield self.get(order='desc', limit='1')
+        self.patch(overview, 'get_overview_rows', get_overview_rows)
+
+        # the tips created while the page is streamed precede its last row,
+        # the one of the cursor of the next page
+        tips, _ = yield self.get(order='desc')
+        self.assertTrue(len(page) > 1)
+
+        pages = page + (yield self.get_all_pages(order='desc', limit='1', cursor=cursor))
+        self.assertEqual(pages, tips)
+
+    def test_get_failure(self):
+        self.patch(overview, 'get_overview_next_cursor', lambda *args: succeed(None))
+        self.patch(overview, 'get_overview_rows', lambda *args: fail(Exception()))
+
         handler = self.request({}, role='admin')
-        response = yield handler.get()
+        handler.request.transport = DummyChannel.TCP()
+
+        completed = []
+        maybeDeferred(handler.get).addCallback(completed.append)
+
+        # the connection is closed without finishing the response and
+        # the handler completes when the connection is lost
+        self.assertTrue(handler.request.transport.disconnected)
+        self.assertEqual(completed, [])
+
+        handler.request.processingFailed(Failure(Exception()))
+
+        self.assertEqual(completed, [None])
+        self.assertFalse(handler.request.finished)
+
+    @inlineCallbacks
+    def test_get_streamed_in_batches(self):
+        tips, _ = yield self.get()
+
+        self.patch(GLSettings, 'admin_overview_batch_size', 1)
+
+        response, _ = yield self.get()
+        self.assertEqual(response, tips)
+
+    @inlineCallbacks
+    def test_get_filtered(self):
+        tips, _ = yield self.get(context_id=self.dummyContext['id'])
+        self.assertEqual(len(tips), self.population_of_submissions)
+
+        tips, _ = yield self.get(context_id='unexistent')
+        self.assertEqual(tips, [])
+
+        tips, _ = yield self.get(end_date='2000-01-01T00:00:00Z')
+        self.assertEqual(tips, [])
+
+    @inlineCallbacks
+    def test_get_invalid_arguments(self):
+        for args in [{'sort': 'size'}, {'order': 'random'}, {'start_date': 'yesterday'}, {'cursor': 'antani'}]:
+            handler = self.request({}, role='admin')
+            handler.request.args = dict((k, [v]) for k, v in args.items())
+
+            yield self.assertFailure(handler.get(), errors.InvalidInputFormat)
+
+
+class TestFilesOverviewDesc(TestOverview):
+    _handler = overview.Files
+    response_desc = requests.FilesOverviewDesc
+
+    @transact
+    def count_files(self, store):
+        return store.find(models.InternalFile).count() + store.find(models.ReceiverFile).count()
+
+    @inlineCallbacks
+    def test_get(self):
+        files, next_cursor = yield self.get()
+
+        self.assertEqual(len(files), (yield self.count_files()))
+        self.assertIsNone(next_cursor)
+
+    @inlineCallbacks
+    def test_get_pages(self):
+        for sort in ['creation_date', 'size']:
+            for order in ['asc', 'desc']:
+                files, _ = yield self.get(sort=sort, order=order)
+
+                pages = yield self.get_all_pages(limit='3', sort=sort, order=order)
+                self.assertEqual(pages, files)
+
+                self.patch(GLSettings, 'admin_overview_batch_size', 2)
+                response, _ = yield self.get(sort=sort, order=order)
+                self.assertEqual(response, files)
+
+    @inlineCallbacks
+    def test_get_filtered(self):
+        files, _ = yield self.get()
+
+        min_size = sorted(f['size'] for f in files)[len(files) // 2]
+
+        response, _ = yield self.get(min_size=str(min_size))
+        self.assertEqual(sorted(f['path'] for f in response),
+                         sorted(f['path'] for f in files if f['size'] >= min_size))
+
+        response, _ = yield self.get(context_id=self.dummyContext['id'])
+        self.assertEqual(len(response), len(files))
 
-        self._handler.validate_message(json.dumps(response), requests.FilesOverviewDesc)
+        response, _ = yield self.get(context_id='unexistent')
+        self.assertEqual(response, [])
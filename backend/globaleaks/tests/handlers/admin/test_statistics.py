@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
+from datetime import timedelta
+
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks import anomaly
+from globaleaks import anomaly, event
 from globaleaks.handlers.admin import statistics
 from globaleaks.jobs.statistics_sched import AnomaliesSchedule, StatisticsSchedule
 from globaleaks.models import Stats
 from globaleaks.orm import transact
+from globaleaks.rest import errors
 from globaleaks.tests import helpers
 
 
@@ -36,6 +39,42 @@ class TestStatsCollection(helpers.TestHandler):
             self.assertEqual(len(response['heatmap']), 7 * 24)
 
 
+class TestStatsRollupsCollection(helpers.TestHandler):
+    _handler = statistics.StatsRollupsCollection
+
+    @inlineCallbacks
+    def test_get(self):
+        for seconds in [0.05, 0.2, 0.3]:
+            event.EventTrack(event.events_monitored[0], timedelta(seconds=seconds))
+
+        yield StatisticsSchedule().run()
+
+        for granularity in ['hour', 'day', 'week']:
+            handler = self.request({}, role='admin')
+            handler.request.args = {'granularity': [granularity]}
+            response = yield handler.get()
+
+            self.assertEqual(len(response), 1)
+            self.assertEqual(response[0]['summary'], {'failed_logins': 3})
+
+            latency = response[0]['latency']['failed_logins']
+            self.assertEqual(latency['count'], 3)
+            self.assertEqual(latency['p50'], 0.175)
+            self.assertEqual(latency['p90'], 0.425)
+
+        handler = self.request({}, role='admin')
+        handler.request.args = {'granularity': ['hour'], 'end': ['2000-01-01T00:00:00Z']}
+        response = yield handler.get()
+        self.assertEqual(response, [])
+
+    def test_get_invalid_arguments(self):
+        for args in [{'granularity': 'month'}, {'start': 'yesterday'}]:
+            handler = self.request({}, role='admin')
+            handler.request.args = dict((k, [v]) for k, v in args.items())
+
+            self.assertRaises(errors.InvalidInputFormat, handler.get)
+
+
 class TestAnomalyCollection(helpers.TestHandler):
     _handler = statistics.AnomalyCollection
 
@@ -78,6 +117,22 @@ class TestRecentEventsCollection(helpers.TestHandler):
         for k in anomaly.ANOMALY_MAP.keys():
             self.assertTrue(k in response)
 
+    @inlineCallbacks
+    def test_get_current_hour(self):
+        self.pollute_events_and_perform_synthesis(3)
+
+        yield StatisticsSchedule().run()
+
+        self.pollute_events_and_perform_synthesis(2)
+
+        handler = self.request({}, role='admin')
+
+        # the details and the summary cover the events since the hourly dump
+        details = yield handler.get('details')
+        summary = yield handler.get('summary')
+
+        self.assertEqual(len(details), sum(summary.values()))
+
 
 class TestJobsTiming(helpers.TestHandler):
     _handler = statistics.JobsTiming
@@ -89,3 +144,43 @@ class TestJobsTiming(helpers.TestHandler):
         handler = self.request({}, role='admin')
 
         yield handler.get()
+
+
+class TestResourcesStatistics(helpers.TestHandler):
+    _handler = statistics.ResourcesStatistics
+
+    @inlineCallbacks
+    def test_get(self):
+        handler = self.request({}, role='admin')
+        response = yield handler.get()
+
+        for pool in ['rw', 'ro']:
+            for k in ['hits', 'waits', 'opens', 'discards', 'size', 'opened', 'idle']:
+                self.assertTrue(k in response['orm'][pool])
+
+        self.assertTrue(response['orm']['rw']['opens'] > 0)
+
+        for k in ['hits', 'misses', 'coalesced', 'rebuilds', 'rebuild_time', 'resources', 'pending']:
+            self.assertTrue(k in response['cache'])
+
+        for k in ['hits', 'misses', 'evictions', 'size', 'entries']:
+            self.assertTrue(k in response['pgp_keyring'])
+
+        for k in ['completed', 'queued', 'limit', 'running', 'waiting']:
+            self.assertTrue(k in response['kdf'])
+
+        for admission_class in ['token', 'upload', 'login', 'export']:
+            for k in ['admitted', 'queued', 'rejected', 'concurrency', 'queue', 'running', 'waiting']:
+                self.assertTrue(k in response['admission'][admission_class])
+
+        for k in ['connections', 'sent', 'failed', 'sessions', 'idle', 'queued']:
+            self.assertTrue(k in response['smtp'])
+
+        for k in ['active', 'completed', 'expired', 'bytes_in_flight']:
+            self.assertTrue(k in response['uploads'])
+
+        self.assertEqual(response['sessions']['active'], 1)
+        self.assertEqual(response['sessions']['roles'], {'admin': 1})
+
+        for k in ['hits', 'misses', 'evictions', 'size', 'entries', 'memory', 'hit_ratio']:
+            self.assertTrue(k in response['schemas'])
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 import json
+import os
 
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks.handlers.base import GLSession, GLSessions, BaseHandler, StaticFileHandler
+from globaleaks.handlers.base import GLSession, GLSessions, GLUploadsFactory, BaseHandler, StaticFileHandler
+from globaleaks.rest import requests, validator
+from globaleaks.security import GLSecureTemporaryFile
 from globaleaks.rest.errors import InvalidInputFormat, ResourceNotFound
 from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
+from globaleaks.utils.sessionstore import MemorySessionStore, SQLiteSessionStore
 
 FUTURE = 100
 
@@ -72,6 +76,34 @@ class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
         self.assertTrue(BaseHandler.validate_regexp('Foca', '\w+'))
         self.assertFalse(BaseHandler.validate_regexp('Foca', '\d+'))
 
+    def test_validate_jmessage_strips_nested_keys(self):
+        dummy_message = {'spam': u'ham', 'extra': 1, 'nest': [{'foca': u'fessa', 'extra': 2}]}
+        dummy_message_template = {'spam': unicode, 'nest': [{'foca': unicode}]}
+
+        self.assertTrue(BaseHandler.validate_jmessage(dummy_message, dummy_message_template))
+        self.assertEqual(dummy_message, {'spam': u'ham', 'nest': [{'foca': u'fessa'}]})
+
+    def test_validate_jmessage_invalid_nested(self):
+        dummy_message = {'nest': [{'foca': 1}]}
+        dummy_message_template = {'nest': [{'foca': unicode}]}
+
+        self.assertRaises(InvalidInputFormat,
+                          BaseHandler.validate_jmessage, dummy_message, dummy_message_template)
+
+    def test_validate_jmessage_none_value(self):
+        self.assertRaises(InvalidInputFormat,
+                          BaseHandler.validate_jmessage, {'spam': None}, {'spam': unicode})
+
+    def test_validator_compiled_once(self):
+        dummy_message_template = {'spam': unicode}
+
+        self.assertIs(validator.get_validator(dummy_message_template),
+                      validator.get_validator(dummy_message_template))
+
+    def test_request_templates_are_compiled(self):
+        for template in [requests.SubmissionDesc, requests.AdminFieldDesc, requests.AdminNodeDesc]:
+            self.assertIn((id(template), validator.compile_dict), validator._compiled)
+
 
 class TestStaticFileHandler(helpers.TestHandler):
     _handler = StaticFileHandler
@@ -92,3 +124,126 @@ class TestStaticFileHandler(helpers.TestHandler):
             return
 
         self.fail('should throw resource not found error')
+
+
+class TestGLUploads(helpers.TestGL):
+    content = ''.join(chr(x % 256) for x in range(100000))
+    chunk_size = 30000
+
+    def setUp(self):
+        self.uploads = GLUploadsFactory(timeout=FUTURE)
+
+        return helpers.TestGL.setUp(self)
+
+    def chunk(self, n):
+        start = (n - 1) * self.chunk_size
+        end = start + self.chunk_size if n < 3 else len(self.content)
+
+        f = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+        f.write(self.content[start:end])
+
+        return f
+
+    def add_chunk(self, n, key='key'):
+        return self.uploads.add_chunk(key, self.chunk(n), n, 3, self.chunk_size, len(self.content))
+
+    def test_chunks_out_of_order_and_duplicated(self):
+        for n in [3, 1, 3]:
+            self.assertEqual(self.add_chunk(n), None)
+
+        self.assertEqual(self.uploads.get_chunks('key'), [1, 3])
+
+        f = self.add_chunk(2)
+        self.assertEqual(f.read(), self.content)
+        f.close()
+
+        self.assertEqual(self.uploads.get_chunks('key'), [])
+
+        stats = self.uploads.get_stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['bytes_in_flight'], 0)
+
+    def test_concurrent_uploads(self):
+        self.add_chunk(1, 'a')
+        self.add_chunk(2, 'b')
+        self.add_chunk(3, 'a')
+
+        self.assertEqual(self.uploads.get_chunks('a'), [1, 3])
+        self.assertEqual(self.uploads.get_chunks('b'), [2])
+        self.assertEqual(self.uploads.get_stats()['active'], 2)
+
+    def test_invalid_chunk(self):
+        chunk = self.chunk(3)
+
+        self.assertRaises(InvalidInputFormat, self.uploads.add_chunk,
+                          'key', chunk, 2, 3, self.chunk_size, len(self.content))
+
+        self.assertTrue(chunk.close_called)
+
+    def test_upload_expiration(self):
+        self.add_chunk(1)
+
+        self.test_reactor.advance(FUTURE)
+
+        self.assertEqual(self.uploads.get_chunks('key'), [])
+
+        stats = self.uploads.get_stats()
+        self.assertEqual(stats['expired'], 1)
+        self.assertEqual(stats['bytes_in_flight'], 0)
+
+
+class TestGLSessions(helpers.TestGL):
+    def tearDown(self):
+        GLSessions.set_store(MemorySessionStore())
+
+        return helpers.TestGL.tearDown(self)
+
+    def test_sessions_are_indexed(self):
+        GLSessions.clear()
+
+        a = GLSession('a', 'receiver', 'enabled')
+        GLSession('a', 'receiver', 'enabled')
+        b = GLSession('b', 'admin', 'enabled')
+
+        self.assertEqual(len(GLSessions.users['a']), 2)
+        self.assertEqual(GLSessions.get_stats(), {'active': 3, 'roles': {'receiver': 2, 'admin': 1}})
+
+        GLSessions.revoke_all_sessions('a')
+
+        self.assertEqual(GLSessions.keys(), [b.id])
+        self.assertFalse('a' in GLSessions.users)
+        self.assertEqual(GLSessions.get_stats(), {'active': 1, 'roles': {'admin': 1}})
+
+        self.test_reactor.advance(GLSessions.timeout + 1)
+
+        self.assertEqual(GLSessions.get(a.id), None)
+        self.assertEqual(GLSessions.users, {})
+        self.assertEqual(GLSessions.get_stats(), {'active': 0, 'roles': {}})
+
+    def test_sessions_are_restored_from_the_store(self):
+        path = os.path.join(GLSettings.ramdisk_path, 'sessions.db')
+        GLSessions.set_store(SQLiteSessionStore(path))
+        GLSessions.clear()
+
+        a = GLSession('a', 'receiver', 'enabled')
+        b = GLSession('b', 'admin', 'enabled')
+        GLSessions.delete(b.id)
+
+        self.test_reactor.advance(GLSessions.timeout / 2)
+
+        # simulates a restart of the backend
+        GLSessions.store.close()
+        GLSessions.store = MemorySessionStore()
+        GLSessions.clear()
+
+        GLSessions.set_store(SQLiteSessionStore(path))
+
+        self.assertEqual(GLSessions.keys(), [a.id])
+        self.assertEqual(GLSessions[a.id].user_role, 'receiver')
+        self.assertEqual(GLSessions[a.id].getTime(), self.test_reactor.seconds() + GLSessions.timeout / 2)
+
+        self.test_reactor.advance(GLSessions.timeout / 2 + 1)
+
+        self.assertEqual(GLSessions.keys(), [])
+        self.assertEqual(GLSessions.store.load(), [])
@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import json
+import zlib
+
+from twisted.internet import defer
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import handlers
@@ -29,6 +33,53 @@ class TestGLApiCache(helpers.TestGL):
         GLApiCache.invalidate()
         self.assertEqual(GLApiCache.memory_cache_dict, {})
 
+    def test_invalidate_tags(self):
+        GLApiCache.set("/public", "en", 'public', {'node', 'contexts'})
+        GLApiCache.set("/l10n/en", "en", 'l10n', {'l10n'})
+
+        GLApiCache.invalidate({'receivers'})
+        self.assertEqual(GLApiCache.get("/public", "en"), 'public')
+
+        GLApiCache.invalidate({'contexts'})
+        self.assertIsNone(GLApiCache.get("/public", "en"))
+        self.assertEqual(GLApiCache.get("/l10n/en", "en"), 'l10n')
+
+    def test_single_flight_rebuild(self):
+        builds = []
+
+        def build():
+            d = defer.Deferred()
+            builds.append(d)
+            return d
+
+        stats = dict(GLApiCache.stats)
+
+        results = []
+        for _ in range(3):
+            d = GLApiCache.get_or_build("/public", "en", {'node'}, build)
+            d.addCallback(results.append)
+
+        self.assertEqual(len(builds), 1)
+
+        builds[0].callback('public')
+
+        self.assertEqual(results, ['public'] * 3)
+        self.assertEqual(GLApiCache.get("/public", "en"), 'public')
+        self.assertEqual(GLApiCache.get_or_build("/public", "en", {'node'}, build), 'public')
+        self.assertEqual(GLApiCache.stats['misses'] - stats['misses'], 1)
+        self.assertEqual(GLApiCache.stats['coalesced'] - stats['coalesced'], 2)
+        self.assertEqual(GLApiCache.stats['hits'] - stats['hits'], 1)
+        self.assertEqual(GLApiCache.stats['rebuilds'] - stats['rebuilds'], 1)
+
+    def test_invalidate_during_rebuild(self):
+        d = defer.Deferred()
+        GLApiCache.get_or_build("/public", "en", {'node'}, lambda: d)
+
+        GLApiCache.invalidate({'node'})
+        d.callback('stale')
+
+        self.assertIsNone(GLApiCache.get("/public", "en"))
+
 
 class TestCacheWithHandlers(helpers.TestHandler):
     _handler = public.PublicResource
@@ -61,6 +112,32 @@ class TestCacheWithHandlers(helpers.TestHandler):
         self.assertEqual(s, 2)
         self.assertNotEqual(resp_fr, cached_resp)
 
+    @inlineCallbacks
+    def test_handler_cached_response(self):
+        handler = self.request(path='/public')
+        resp = yield handler.get()
+        handler.write(resp)
+
+        body = handler.request.getResponseBody()
+        self.assertEqual(json.loads(body), resp)
+
+        etag = handler.request.responseHeaders.getRawHeaders('etag')[0]
+        self.assertEqual(etag, GLApiCache.get_entry('/public', 'en').etag)
+
+        handler = self.request(path='/public', headers={'accept-encoding': 'gzip, deflate'})
+        resp = yield handler.get()
+        handler.write(resp)
+
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders('content-encoding'), ['gzip'])
+        self.assertEqual(zlib.decompress(handler.request.getResponseBody(), 16 + zlib.MAX_WBITS), body)
+
+        handler = self.request(path='/public', headers={'if-none-match': etag})
+        resp = yield handler.get()
+        handler.write(resp)
+
+        self.assertEqual(handler.request.responseCode, 304)
+        self.assertEqual(handler.request.getResponseBody(), '')
+
     def test_handler_sync_cache_miss(self):
         # Asserts that the cases where the result of f returns immediately,
         # the caching implementation does not fall over and die.
@@ -4,6 +4,7 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.handlers import receiver, admin
 from globaleaks.orm import transact
+from globaleaks.rest import errors
 from globaleaks.tests import helpers
 from globaleaks.utils.utility import datetime_never
 
@@ -45,7 +46,62 @@ class TestTipsCollection(helpers.TestHandlerWithPopulatedDB):
     @inlineCallbacks
     def test_get(self):
         handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
-        yield handler.get()
+        rtips = yield handler.get()
+
+        self.assertEqual(len(rtips), self.population_of_submissions)
+        for rtip in rtips:
+            self.assertEqual(rtip['file_counter'], self.population_of_attachments)
+            self.assertEqual(rtip['comment_counter'], self.population_of_recipients + 1)
+            self.assertEqual(rtip['message_counter'], 2)
+
+    @inlineCallbacks
+    def test_get_paginated(self):
+        for _ in range(3):
+            yield self.perform_full_submission_actions()
+
+        all_rtips, next_cursor = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        self.assertEqual(next_cursor, None)
+
+        for sort in ['creation_date', 'progressive']:
+            for order in ['asc', 'desc']:
+                ids = []
+                cursor = None
+                while True:
+                    handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+                    handler.request.args = {'sort': [sort], 'order': [order], 'limit': ['2']}
+                    if cursor is not None:
+                        handler.request.args['cursor'] = [cursor]
+
+                    rtips = yield handler.get()
+                    self.assertTrue(len(rtips) <= 2)
+                    ids.extend(rtip['id'] for rtip in rtips)
+
+                    cursor = handler.request.responseHeaders.getRawHeaders(b'X-Next-Cursor', [None])[0]
+                    if cursor is None:
+                        break
+
+                self.assertEqual(sorted(ids), sorted(rtip['id'] for rtip in all_rtips))
+
+                progressives = [rtip['progressive'] for rtip in sorted(all_rtips, key=lambda x: ids.index(x['id']))]
+                self.assertEqual(progressives, sorted(progressives, reverse=order == 'desc'))
+
+    @inlineCallbacks
+    def test_get_filtered(self):
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en', new=True)
+        self.assertEqual(len(rtips), self.population_of_submissions)
+
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en', new=False)
+        self.assertEqual(len(rtips), 0)
+
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en', context_id=u'unexistent')
+        self.assertEqual(len(rtips), 0)
+
+    @inlineCallbacks
+    def test_get_invalid_parameters(self):
+        for args in [{'sort': ['invalid']}, {'limit': ['invalid']}, {'cursor': ['invalid']}]:
+            handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+            handler.request.args = args
+            yield self.assertFailure(handler.get(), errors.InvalidInputFormat)
 
 
 class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
@@ -63,7 +119,7 @@ class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
 
         yield set_expiration_of_all_rtips_to_unlimited()
 
-        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
         rtips_ids = [rtip['id'] for rtip in rtips]
 
         postpone_map = {}
@@ -78,7 +134,7 @@ class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
         handler = self.request(data_request, user_id = self.dummyReceiver_1['id'], role='receiver')
         yield handler.put()
 
-        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
 
         for rtip in rtips:
             self.assertNotEqual(postpone_map[rtip['id']], rtip['expiration_date'])
@@ -88,7 +144,7 @@ class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
         for _ in xrange(3):
             yield self.perform_full_submission_actions()
 
-        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
         rtips_ids = [rtip['id'] for rtip in rtips]
 
         data_request = {
@@ -99,6 +155,6 @@ class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
         handler = self.request(data_request, user_id = self.dummyReceiver_1['id'], role='receiver')
         yield handler.put()
 
-        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
 
         self.assertEqual(len(rtips), 0)
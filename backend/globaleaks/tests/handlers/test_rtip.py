@@ -6,6 +6,7 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.handlers import rtip
 from globaleaks.jobs.delivery_sched import DeliverySchedule
+from globaleaks.orm import transact
 from globaleaks.rest import errors
 from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
@@ -264,3 +265,29 @@ class TestIdentityAccessRequestsCollection(helpers.TestHandlerWithPopulatedDB):
             handler = self.request(role='receiver', user_id = rtip_desc['receiver_id'], body=json.dumps(body))
 
             yield handler.post(rtip_desc['id'])
+
+
+class TestRTipSerialization(helpers.TestGLWithPopulatedDB):
+    @transact
+    def count_serialization_queries(self, store, rtip_id):
+        tip = store.find(models.ReceiverTip, models.ReceiverTip.id == rtip_id).one()
+
+        return helpers.count_queries(rtip.serialize_rtip, store, tip, 'en')
+
+    @inlineCallbacks
+    def test_serialization_queries_do_not_depend_on_the_size_of_the_tip(self):
+        yield self.perform_full_submission_actions()
+
+        rtip_desc = (yield self.get_rtips())[0]
+
+        count = yield self.count_serialization_queries(rtip_desc['id'])
+
+        yield self.perform_post_submission_actions()
+        yield self.add_tip_files_and_answers(rtip_desc['internaltip_id'], 5)
+
+        new_rtip_desc = [x for x in (yield self.get_rtips()) if x['id'] == rtip_desc['id']][0]
+        for key in ['comments', 'messages', 'iars', 'rfiles']:
+            self.assertTrue(len(new_rtip_desc[key]) > len(rtip_desc[key]))
+
+        new_count = yield self.count_serialization_queries(rtip_desc['id'])
+        self.assertEqual(count, new_count)
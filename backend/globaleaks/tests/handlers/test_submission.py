@@ -1,9 +1,14 @@
 # -*- encoding: utf-8 -*-
+import copy
+
 from twisted.internet.defer import inlineCallbacks, returnValue
 
+from globaleaks import models
 from globaleaks.handlers import authentication, wbtip
-from globaleaks.handlers.submission import SubmissionInstance
+from globaleaks.handlers.submission import SubmissionInstance, GLSchemaCache, \
+    db_get_archived_questionnaire_schema, db_get_archived_preview_schema
 from globaleaks.jobs import delivery_sched
+from globaleaks.orm import transact
 from globaleaks.rest import errors
 from globaleaks.tests import helpers
 from globaleaks.utils.token import Token
@@ -156,3 +161,41 @@ class TestSubmissionPlaintextScenario(TestSubmissionEncryptedScenario):
         'encrypted': 0,
         'reference': 6
     }
+
+
+class TestSchemaCache(helpers.TestGLWithPopulatedDB):
+    @transact
+    def get_schemas(self, store, language):
+        questionnaire_hash = store.find(models.InternalTip).any().questionnaire_hash
+
+        return (db_get_archived_questionnaire_schema(store, questionnaire_hash, language),
+                db_get_archived_preview_schema(store, questionnaire_hash, language))
+
+    @inlineCallbacks
+    def test_schema_cache(self):
+        yield self.perform_full_submission_actions()
+
+        GLSchemaCache.clear()
+
+        questionnaire, preview = yield self.get_schemas('en')
+        self.assertTrue(len(questionnaire) > 0)
+
+        stats = GLSchemaCache.get_stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertTrue(stats['memory'] > 0)
+
+        # the schemas are returned from the cache
+        questionnaire_2, preview_2 = yield self.get_schemas('en')
+        self.assertTrue(questionnaire_2 is questionnaire)
+        self.assertTrue(preview_2 is preview)
+        self.assertTrue(GLSchemaCache.get_stats()['hits'] >= 2)
+
+        # each language is cached separately
+        questionnaire_3, _ = yield self.get_schemas('it')
+        self.assertFalse(questionnaire_3 is questionnaire)
+        self.assertEqual(GLSchemaCache.get_stats()['entries'], 4)
+
+        # the cached schemas are read-only and shared by the copies
+        self.assertRaises(TypeError, questionnaire.append, {})
+        self.assertRaises(TypeError, questionnaire[0].__setitem__, 'label', u'')
+        self.assertTrue(copy.deepcopy(questionnaire) is questionnaire)
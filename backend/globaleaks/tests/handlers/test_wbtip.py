@@ -3,7 +3,9 @@ import json
 
 from twisted.internet.defer import inlineCallbacks
 
+from globaleaks import models
 from globaleaks.handlers import wbtip
+from globaleaks.orm import transact
 from globaleaks.tests import helpers
 
 
@@ -23,6 +25,33 @@ class TestWBTipInstance(helpers.TestHandlerWithPopulatedDB):
 
             yield handler.get()
 
+
+class TestWBTipSerialization(helpers.TestGLWithPopulatedDB):
+    @transact
+    def count_serialization_queries(self, store, wbtip_id):
+        tip = store.find(models.WhistleblowerTip, models.WhistleblowerTip.id == wbtip_id).one()
+
+        return helpers.count_queries(wbtip.serialize_wbtip, store, tip, 'en')
+
+    @inlineCallbacks
+    def test_serialization_queries_do_not_depend_on_the_size_of_the_tip(self):
+        yield self.perform_full_submission_actions()
+
+        wbtip_desc = (yield self.get_wbtips())[0]
+
+        count = yield self.count_serialization_queries(wbtip_desc['id'])
+
+        yield self.perform_post_submission_actions()
+        yield self.add_tip_files_and_answers(wbtip_desc['id'], 5)
+
+        new_wbtip_desc = [x for x in (yield self.get_wbtips()) if x['id'] == wbtip_desc['id']][0]
+        for key in ['comments', 'rfiles']:
+            self.assertTrue(len(new_wbtip_desc[key]) > len(wbtip_desc[key]))
+
+        new_count = yield self.count_serialization_queries(wbtip_desc['id'])
+        self.assertEqual(count, new_count)
+
+
 class TestWBTipCommentCollection(helpers.TestHandlerWithPopulatedDB):
     _handler = wbtip.WBTipCommentCollection
 
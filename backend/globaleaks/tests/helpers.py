@@ -8,7 +8,7 @@ import sys
 reload(sys)
 sys.setdefaultencoding('utf8')
 
-from globaleaks import db, models, security, event, jobs
+from globaleaks import db, models, orm, security, event, jobs
 from globaleaks.anomaly import Alarm
 from globaleaks.db.appdata import load_appdata
 from globaleaks.orm import transact
@@ -23,6 +23,7 @@ from globaleaks.handlers.admin.step import create_step
 from globaleaks.handlers.admin.questionnaire import get_questionnaire
 from globaleaks.handlers.admin.user import create_admin_user, create_custodian_user
 from globaleaks.handlers.submission import create_submission
+from globaleaks.rest.admission import AdmissionControl
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
 from globaleaks.security import GLSecureTemporaryFile
@@ -52,6 +53,7 @@ from twisted.test.proto_helpers import StringTransport
 from twisted.trial import unittest
 from twisted.internet.protocol import ProcessProtocol
 from twisted.web import server
+from storm import tracer
 from storm.twisted.testing import FakeThreadPool
 
 
@@ -104,10 +106,15 @@ def init_glsettings_for_unit_tests():
 
     GLSettings.set_ramdisk_path()
 
+    orm.close_store_pools()
+    security.GLPGPKeyring.clear()
+
     GLSettings.remove_directories()
     GLSettings.create_directories()
 
     GLSettings.orm_tp = FakeThreadPool()
+    GLSettings.orm_ro_tp = FakeThreadPool()
+    GLSettings.kdf_tp = FakeThreadPool()
 
     GLSettings.memory_copy.hostname = 'localhost'
 
@@ -133,6 +140,32 @@ def update_node_setting(store, var_name, value):
     models.config.NodeFactory(store).set_val(var_name, value)
 
 
+class QueryCounter(object):
+    """
+    Storm tracer counting the statements executed on the database
+    """
+    def __init__(self):
+        self.count = 0
+
+    def connection_raw_execute(self, connection, raw_cursor, statement, params):
+        self.count += 1
+
+
+def count_queries(function, *args, **kwargs):
+    """
+    Return the number of statements executed by the given function
+    """
+    counter = QueryCounter()
+    tracer.install_tracer(counter)
+
+    try:
+        function(*args, **kwargs)
+    finally:
+        tracer.remove_tracer_type(QueryCounter)
+
+    return counter.count
+
+
 def get_dummy_step():
     return {
         'id': '',
@@ -216,6 +249,7 @@ class TestGL(unittest.TestCase):
         tempdict.test_reactor = self.test_reactor
         token.TokenList.reactor = self.test_reactor
         GLSessions.reactor = self.test_reactor
+        event.EventTrackQueue.reactor = self.test_reactor
 
         init_glsettings_for_unit_tests()
 
@@ -239,6 +273,7 @@ class TestGL(unittest.TestCase):
         GLSettings.state.process_supervisor = sup
 
         Alarm.reset()
+        AdmissionControl.clear()
         event.EventTrackQueue.clear()
         GLSettings.reset_hourly()
 
@@ -628,6 +663,49 @@ class TestGLWithPopulatedDB(TestGL):
             for receiver_id in wbtip_desc['receivers_ids']:
                 yield wbtip.create_message(wbtip_desc['id'], receiver_id, messageCreation)
 
+    @transact
+    def add_tip_files_and_answers(self, store, itip_id, n):
+        """
+        Add to the tip n files delivered to each receiver and n answer
+        groups to each of the answers composed of groups
+        """
+        rtips = store.find(models.ReceiverTip, models.ReceiverTip.internaltip_id == itip_id)
+
+        for i in range(n):
+            ifile = models.InternalFile()
+            ifile.internaltip_id = itip_id
+            ifile.name = u'file%d.txt' % i
+            ifile.file_path = u'file%d.txt' % i
+            ifile.content_type = u'text/plain'
+            ifile.size = 1
+            store.add(ifile)
+
+            for rtip in rtips:
+                rfile = models.ReceiverFile()
+                rfile.internalfile_id = ifile.id
+                rfile.receivertip_id = rtip.id
+                rfile.file_path = ifile.file_path
+                rfile.size = 1
+                rfile.status = u'reference'
+                store.add(rfile)
+
+        answers = store.find(models.FieldAnswer, models.FieldAnswer.internaltip_id == itip_id,
+                                                 models.FieldAnswer.is_leaf == False)
+
+        for answer in list(answers):
+            for i in range(n):
+                group = models.FieldAnswerGroup()
+                group.fieldanswer_id = answer.id
+                group.number = answer.groups.count()
+                store.add(group)
+
+                child = models.FieldAnswer()
+                child.internaltip_id = itip_id
+                child.fieldanswergroup_id = group.id
+                child.key = u'child%d' % i
+                child.value = u'value'
+                store.add(child)
+
     @inlineCallbacks
     def perform_full_submission_actions(self):
         """Populates the DB with tips, comments, messages and files"""
@@ -729,6 +807,14 @@ class TestHandler(TestGLWithPopulatedDB):
 
         request.getResponseBody = getResponseBody
 
+        def registerProducer(producer, streaming):
+            # the DummyRequest pulls synchronously the data of the producers
+            # while the streaming ones write it by themselves
+            if not streaming:
+                DummyRequest.registerProducer(request, producer, streaming)
+
+        request.registerProducer = registerProducer
+
         request.client = IPv4Address('TCP', '1.2.3.4', 12345)
 
         request.args = {}
@@ -1,14 +1,15 @@
 # -*- encoding: utf-8 -*-
 import os
+from datetime import timedelta
 
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
-from globaleaks.jobs import cleaning_sched
+from globaleaks.jobs import cleaning_sched, secure_delete_sched
 from globaleaks.orm import transact
 from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
-from globaleaks.utils.utility import datetime_null
+from globaleaks.utils.utility import datetime_null, datetime_now
 
 
 class TestCleaningSched(helpers.TestGLWithPopulatedDB):
@@ -24,6 +25,15 @@ class TestCleaningSched(helpers.TestGLWithPopulatedDB):
         for itip in store.find(models.InternalTip):
             itip.expiration_date = datetime_null()
 
+    @transact
+    def force_itip_expiring(self, store, n):
+        for itip in store.find(models.InternalTip)[:n]:
+            itip.expiration_date = datetime_now() + timedelta(hours=1)
+
+    @transact
+    def get_mails(self, store):
+        return [(mail.address, mail.subject, mail.body) for mail in store.find(models.Mail)]
+
     @transact
     def check0(self, store):
         self.assertTrue(os.listdir(GLSettings.submission_path) == [])
@@ -89,5 +99,40 @@ class TestCleaningSched(helpers.TestGLWithPopulatedDB):
 
         yield cleaning_sched.CleaningSchedule().run()
 
+        yield secure_delete_sched.SecureDeleteSchedule().run()
+
         # verify cascade deletion when tips expire
         yield self.check0()
+
+    @inlineCallbacks
+    def test_check_for_expiring_submissions(self):
+        yield self.perform_full_submission_actions()
+
+        yield cleaning_sched.CleaningSchedule().check_for_expiring_submissions()
+        yield self.test_model_count(models.Mail, 0)
+
+        # every receiver is notified of its expiring tip
+        yield self.force_itip_expiring(1)
+        yield cleaning_sched.CleaningSchedule().check_for_expiring_submissions()
+
+        mails = yield self.get_mails()
+        self.assertEqual(len(mails), self.population_of_recipients)
+        for _, subject, body in mails:
+            self.assertTrue('is going to expire' in subject)
+            self.assertTrue('%' not in body)
+
+        yield self.test_model_count(models.Mail, self.population_of_recipients)
+
+    @inlineCallbacks
+    def test_check_for_expiring_submissions_summary(self):
+        yield self.perform_full_submission_actions()
+        yield self.perform_full_submission_actions()
+
+        yield self.force_itip_expiring(2)
+        yield cleaning_sched.CleaningSchedule().check_for_expiring_submissions()
+
+        mails = yield self.get_mails()
+        self.assertEqual(len(mails), self.population_of_recipients)
+        for _, subject, body in mails:
+            self.assertTrue('Some submissions will expire soon' in subject)
+            self.assertTrue('2 submissions are expiring' in body)
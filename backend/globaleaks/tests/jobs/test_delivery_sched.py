@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.jobs.delivery_sched import DeliverySchedule
+from globaleaks.orm import transact
+from globaleaks.security import GLBPGP
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+
+
+@transact
+def get_receiverfiles(store):
+    return [{
+        'status': rfile.status,
+        'file_path': rfile.file_path,
+        'pgp_key_public': rfile.receivertip.receiver.user.pgp_key_public
+    } for rfile in store.find(models.ReceiverFile)]
+
+
+class TestDeliverySchedule(helpers.TestGLWithPopulatedDB):
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGLWithPopulatedDB.setUp(self)
+        yield self.perform_full_submission_actions()
+
+    @inlineCallbacks
+    def test_delivery_encrypted_files(self):
+        yield DeliverySchedule().run()
+
+        yield self.test_model_count(models.InternalFile, 4)
+
+        rfiles = yield get_receiverfiles()
+        self.assertEqual(len(rfiles), 8)
+
+        content = ''.join(unichr(x) for x in range(0x400, 0x40A)).encode('utf-8')
+
+        decrypted = 0
+
+        for rfile in rfiles:
+            self.assertEqual(rfile['status'], u'encrypted')
+
+            if rfile['pgp_key_public'] != helpers.PGPKEYS['VALID_PGP_KEY1_PUB']:
+                continue
+
+            gpoj = GLBPGP()
+            try:
+                gpoj.gnupg.import_keys(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'])
+                with open(rfile['file_path'], 'rb') as f:
+                    self.assertEqual(gpoj.gnupg.decrypt_file(f).data, content)
+                decrypted += 1
+            finally:
+                gpoj.destroy_environment()
+
+        self.assertEqual(decrypted, 4)
+
+    @inlineCallbacks
+    def test_delivery_in_batches(self):
+        GLSettings.delivery_concurrency = 1
+
+        try:
+            yield DeliverySchedule().run()
+        finally:
+            GLSettings.delivery_concurrency = 4
+
+        rfiles = yield get_receiverfiles()
+        self.assertEqual(len(rfiles), 8)
+
+        for rfile in rfiles:
+            self.assertEqual(rfile['status'], u'encrypted')
+            self.assertTrue(os.path.exists(rfile['file_path']))
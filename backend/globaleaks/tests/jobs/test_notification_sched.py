@@ -1,7 +1,10 @@
-from twisted.internet.defer import inlineCallbacks, fail
+from twisted.internet.defer import inlineCallbacks, succeed
+from twisted.mail.smtp import SMTPDeliveryError
+from twisted.python.failure import Failure
 
 from globaleaks.jobs.delivery_sched import DeliverySchedule
 from globaleaks.jobs.notification_sched import NotificationSchedule
+from globaleaks.settings import GLSettings
 
 from globaleaks.tests import helpers
 from globaleaks.tests.jobs.test_base import get_scheduled_email_count
@@ -37,16 +40,62 @@ class TestNotificationSchedule(helpers.TestGLWithPopulatedDB):
         notification_schedule = NotificationSchedule()
         notification_schedule.skip_sleep = True
 
-        def sendmail(x, y, z):
-            return fail(True)
+        def send_mails(mails):
+            return succeed([(mail, Failure(Exception())) for mail in mails])
 
-        notification_schedule.sendmail = sendmail
+        notification_schedule.send_mails = send_mails
+
+        GLSettings.mail_retry_delay = 0
+
+        try:
+            for i in range(0, 9):
+                yield notification_schedule.run()
+
+                count = yield get_scheduled_email_count()
+                self.assertEqual(count, 28)
 
-        for i in range(0, 10):
             yield notification_schedule.run()
+        finally:
+            GLSettings.mail_retry_delay = 60
+
+        count = yield get_scheduled_email_count()
+        self.assertEqual(count, 0)
+
+    @inlineCallbacks
+    def test_notification_schedule_retry_backoff(self):
+        yield DeliverySchedule().run()
+
+        notification_schedule = NotificationSchedule()
+        notification_schedule.skip_sleep = True
+
+        attempts = []
+
+        def send_mails(mails):
+            attempts.append(len(mails))
+            return succeed([(mail, Failure(Exception())) for mail in mails])
+
+        notification_schedule.send_mails = send_mails
+
+        yield notification_schedule.run()
+        yield notification_schedule.run()
+
+        # the failed mails are not retried before the backoff delay
+        self.assertEqual(attempts, [28])
+
+        count = yield get_scheduled_email_count()
+        self.assertEqual(count, 28)
+
+    @inlineCallbacks
+    def test_notification_schedule_permanent_failure(self):
+        yield DeliverySchedule().run()
+
+        notification_schedule = NotificationSchedule()
+        notification_schedule.skip_sleep = True
+
+        def send_mails(mails):
+            return succeed([(mail, Failure(SMTPDeliveryError(550, 'No such user'))) for mail in mails])
 
-            count = yield get_scheduled_email_count()
-            self.assertEqual(count, 28)
+        notification_schedule.send_mails = send_mails
 
         yield notification_schedule.run()
 
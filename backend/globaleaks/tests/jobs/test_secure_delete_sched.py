@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import os
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import deferLater
+
+from globaleaks import models
+from globaleaks.handlers.rtip import db_mark_file_for_secure_deletion
+from globaleaks.jobs import secure_delete_sched
+from globaleaks.orm import transact
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+
+
+class TestSecureDeleteSchedule(helpers.TestGL):
+    @transact
+    def mark_files_for_secure_deletion(self, store, n):
+        paths = []
+        for i in range(n):
+            paths.append(os.path.join(GLSettings.submission_path, 'file-%d' % i))
+            with open(paths[-1], 'wb') as f:
+                f.write(os.urandom(1000))
+
+            secure_file_delete = models.SecureFileDelete()
+            secure_file_delete.filepath = paths[-1]
+            store.add(secure_file_delete)
+
+        return paths
+
+    @inlineCallbacks
+    def test_secure_delete_schedule(self):
+        self.patch(GLSettings, 'secure_delete_batch_size', 3)
+
+        paths = yield self.mark_files_for_secure_deletion(10)
+
+        job = secure_delete_sched.SecureDeleteSchedule()
+
+        yield job.run()
+
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+
+        yield self.test_model_count(models.SecureFileDelete, 0)
+
+        stats = job.get_stats()
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['deleted'], 10)
+        self.assertEqual(stats['bytes'], 10000)
+
+    def test_wakeup(self):
+        job = secure_delete_sched.SecureDeleteSchedule()
+
+        runs = []
+        job.run = lambda: runs.append(None)
+
+        # the wakeups are coalesced
+        job.wakeup()
+        job.wakeup()
+
+        self.test_reactor.advance(GLSettings.secure_delete_wakeup_delay)
+        self.assertEqual(len(runs), 1)
+
+        job.wakeup()
+        self.test_reactor.advance(GLSettings.secure_delete_wakeup_delay)
+        self.assertEqual(len(runs), 2)
+
+    @inlineCallbacks
+    def test_wakeup_on_commit(self):
+        job = secure_delete_sched.SecureDeleteSchedule()
+        self.patch(GLSettings, 'jobs', [job])
+
+        with open(os.path.join(GLSettings.submission_path, 'file'), 'wb') as f:
+            f.write(os.urandom(1000))
+
+        @transact
+        def mark_file_for_secure_deletion(store, fail):
+            db_mark_file_for_secure_deletion(store, 'file')
+            if fail:
+                raise Exception
+
+        # the job is woken up only by the committed transactions
+        yield self.assertFailure(mark_file_for_secure_deletion(True), Exception)
+        yield deferLater(reactor, 0, lambda: None)
+        self.assertIsNone(job.wakeup_call)
+
+        yield mark_file_for_secure_deletion(False)
+        yield deferLater(reactor, 0, lambda: None)
+        self.assertTrue(job.wakeup_call.active())
+        job.wakeup_call.cancel()
+
+    @inlineCallbacks
+    def test_wakeup_while_active(self):
+        job = secure_delete_sched.SecureDeleteSchedule()
+
+        job.operation = lambda: None
+        job.job_begin()
+
+        # the execution requested while the job is active is postponed
+        yield job.run()
+        self.assertTrue(job.pending)
+
+        job.job_end()
+
+        yield job.run()
+        self.assertFalse(job.pending)
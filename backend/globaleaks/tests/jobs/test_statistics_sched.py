@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks import anomaly
+from globaleaks import anomaly, event
 from globaleaks.jobs import statistics_sched
+from globaleaks.models import Stats
+from globaleaks.orm import transact
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
 # E non è la distanza ad abitare l'assenza.
@@ -59,3 +64,50 @@ class TestStaticsSchedule(helpers.TestGL):
     @inlineCallbacks
     def test_statistics_schedule(self):
         yield statistics_sched.StatisticsSchedule().run()
+
+    @transact
+    def get_stats(self, store, granularity):
+        return [(s.start, s.summary, s.latency) for s in store.find(Stats, Stats.granularity == granularity).order_by(Stats.start)]
+
+    @inlineCallbacks
+    def test_statistics_rollups(self):
+        # two hours of monday, 2017-03-06, and one of the following day
+        for start in [datetime(2017, 3, 6, 10), datetime(2017, 3, 6, 11), datetime(2017, 3, 7, 0)]:
+            GLSettings.stats_collection_start_time = start
+
+            for seconds in [0.005, 0.3, 100]:
+                event.EventTrack(event.events_monitored[0], timedelta(seconds=seconds))
+
+            yield statistics_sched.StatisticsSchedule().run()
+
+        hours = yield self.get_stats(u'hour')
+        days = yield self.get_stats(u'day')
+        weeks = yield self.get_stats(u'week')
+
+        self.assertEqual(len(hours), 3)
+        self.assertEqual(hours[0][1], {'failed_logins': 3})
+        self.assertEqual(hours[0][2], {'failed_logins': {'0.01': 1, '0.5': 1, 'inf': 1}})
+
+        self.assertEqual([d[0] for d in days], [datetime(2017, 3, 6), datetime(2017, 3, 7)])
+        self.assertEqual(days[0][1], {'failed_logins': 6})
+        self.assertEqual(days[0][2], {'failed_logins': {'0.01': 2, '0.5': 2, 'inf': 2}})
+
+        self.assertEqual(weeks, [(datetime(2017, 3, 6), {'failed_logins': 9},
+                                  {'failed_logins': {'0.01': 3, '0.5': 3, 'inf': 3}})])
+
+
+class TestLatencyHistograms(helpers.TestGL):
+    def test_get_latency_bucket(self):
+        self.assertEqual(event.get_latency_bucket(0), '0.01')
+        self.assertEqual(event.get_latency_bucket(0.1), '0.1')
+        self.assertEqual(event.get_latency_bucket(0.11), '0.25')
+        self.assertEqual(event.get_latency_bucket(3600), 'inf')
+
+    def test_get_latency_percentile(self):
+        histogram = {'0.1': 50, '0.25': 40, '1': 9, 'inf': 1}
+
+        self.assertEqual(event.get_latency_percentile({}, 50), 0)
+        self.assertEqual(event.get_latency_percentile(histogram, 50), 0.1)
+        self.assertEqual(event.get_latency_percentile(histogram, 70), 0.175)
+        self.assertEqual(event.get_latency_percentile(histogram, 99), 1)
+        self.assertEqual(event.get_latency_percentile(histogram, 100), 60)
@@ -4,6 +4,7 @@ from twisted.internet import defer
 
 from globaleaks import event
 from globaleaks.anomaly import Alarm
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
 
@@ -42,6 +43,36 @@ class TestAlarm(helpers.TestGL):
         self.assertEqual(activity_level, 0)
 
 
+class TestEventTrackQueue(helpers.TestGL):
+    def test_sliding_window(self):
+        queue = event.EventTrackQueue
+
+        for x in range(3):
+            event.EventTrack(event.events_monitored[0], timedelta(seconds=x))
+            self.test_reactor.advance(20)
+
+        # the first event is now out of the window
+        self.assertEqual(queue.get_counters(), {'failed_logins': 2})
+        self.assertEqual(queue.get_latencies(), {'failed_logins': [1.0, 2.0]})
+
+        self.test_reactor.advance(queue.window)
+        self.assertEqual(queue.get_counters(), {})
+        self.assertEqual(queue.get_latencies(), {'failed_logins': []})
+
+        # the counters of the hour are kept
+        self.assertEqual(GLSettings.RecentEvents, {'failed_logins': 3})
+
+    def test_bounded_memory(self):
+        queue = event.EventTrackQueue
+
+        for x in range(queue.events_limit + 1):
+            event.EventTrack(event.events_monitored[0], timedelta(seconds=1))
+
+        self.assertEqual(queue.get_counters(), {'failed_logins': queue.events_limit + 1})
+        self.assertEqual(len(queue.take_current_snapshot()), queue.events_limit)
+        self.assertEqual(len(queue.get_latencies()['failed_logins']), queue.latencies_limit)
+
+
 class TestAnomalyNotification(helpers.TestGL):
     @defer.inlineCallbacks
     def test_generate_admin_alert_mail(self):
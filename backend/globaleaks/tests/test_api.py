@@ -5,6 +5,10 @@ from twisted.internet.address import IPv4Address
 from twisted.internet.defer import inlineCallbacks, Deferred
 from twisted.web.test.requesthelper import DummyRequest
 
+from globaleaks.anomaly import Alarm
+from globaleaks.rest import errors
+from globaleaks.rest.admission import AdmissionControl, AdmissionQueue
+from globaleaks.rest.router import Router
 from globaleaks.settings import GLSettings
 from globaleaks.tests.helpers import TestGL
 
@@ -81,6 +85,56 @@ class TestAPI(TestGL):
                                               'custodian'], check_roles)
             self.assertTrue(len(rest) == 0)
 
+    def test_router_matches_linear_scan(self):
+        uuid = '12345678-1234-1234-1234-123456789012'
+        token = 'a' * 42
+
+        paths = ['', '/', '//', '/index.html', '/js/scripts.min.js',
+                 '/public', '/token', '/token/' + token,
+                 '/s/abc', '/s/abc/def', '/s/ABC',
+                 '/submission/' + token, '/submission/' + token + '/file',
+                 '/rtip/' + uuid, '/rtip/' + uuid + '/comments',
+                 '/rtip/rfile/' + uuid, '/rtip/operations',
+                 '/admin/stats/3', '/admin/stats/resources',
+                 '/admin/staticfiles', '/admin/staticfiles/', '/admin/staticfiles/a/b',
+                 '/admin/users/' + uuid + '/img', '/admin/contexts/' + uuid + '/img',
+                 '/l10n/en', '/l10n/xx', '/robots.txt', '/robotsXtxt',
+                 '/.well-known/acme-challenge/' + 'a' * 43, '/a b']
+
+        for path in paths:
+            expected = None
+            for regexp, handler, args in self.api._registry:
+                match = regexp.match(path)
+                if match:
+                    expected = ((handler, args), match.groups())
+                    break
+
+            self.assertEqual(self.api._router.match(path), expected)
+
+    def test_router_order(self):
+        router = Router()
+        router.add(r'/a/([a-z]+)', 1)
+        router.add(r'/a/b', 2)
+        router.add(r'/(.*)', 3)
+
+        self.assertEqual(router.match('/a/b'), (1, ('b',)))
+        self.assertEqual(router.match('/a/1'), (3, ('a/1',)))
+        self.assertEqual(router.match('/a'), (3, ('a',)))
+        self.assertEqual(router.match('a'), None)
+
+    def test_router_tails(self):
+        router = Router()
+        router.add(r'/x/(.*)', 1)
+        router.add(r'/y/?', 2)
+        router.add(r'/z|/w', 3)
+
+        self.assertEqual(router.match('/x'), None)
+        self.assertEqual(router.match('/x/'), (1, ('',)))
+        self.assertEqual(router.match('/x/a/b'), (1, ('a/b',)))
+        self.assertEqual(router.match('/y'), (2, ()))
+        self.assertEqual(router.match('/y/'), (2, ()))
+        self.assertEqual(router.match('/w'), (3, ()))
+
     def test_get_with_no_language_header(self):
         request = forge_request()
         self.assertEqual(self.api.detect_language(request), 'en')
@@ -192,3 +246,59 @@ class TestAPI(TestGL):
         self.assertEqual(request.responseCode, 301)
         location = request.responseHeaders.getRawHeaders(b'location')[0]
         self.assertEqual('https://www.globaleaks.org/public', location)
+
+    def test_admission_control(self):
+        login = AdmissionControl.get_queue('login')
+        concurrency, queue = login.get_limits()
+
+        tickets = [AdmissionControl.acquire('login') for _ in range(concurrency + queue)]
+
+        request = forge_request(uri="https://www.globaleaks.org/authentication", method=b'POST')
+        self.api.render(request)
+        self.assertEqual(request.responseCode, 503)
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'retry-after')[0],
+                         str(GLSettings.admission_retry_after))
+
+        # the other classes of endpoints are not affected
+        request = forge_request(uri="https://www.globaleaks.org/")
+        self.api.render(request)
+        self.assertEqual(request.responseCode, 200)
+
+        for ticket in tickets:
+            AdmissionControl.release('login', ticket)
+
+        self.assertEqual(login.get_stats()['running'], 0)
+
+
+class TestAdmissionQueue(TestGL):
+    def test_queue(self):
+        q = AdmissionQueue(2, 2)
+
+        a, b, c, d = [q.acquire() for _ in range(4)]
+
+        self.assertTrue(a.called and b.called)
+        self.assertFalse(c.called or d.called)
+        self.assertRaises(errors.ServiceOverloaded, q.acquire)
+
+        # a queued request whose connection is lost leaves the queue
+        q.release(c)
+        self.assertEqual(q.get_stats()['waiting'], 1)
+
+        q.release(a)
+        self.assertTrue(d.called)
+
+        self.assertEqual(q.get_stats()['running'], 2)
+        self.assertEqual(q.get_stats()['rejected'], 1)
+
+    def test_limits_follow_the_stress_level(self):
+        q = AdmissionQueue(8, 32)
+
+        self.assertEqual(q.get_limits(), (8, 32))
+
+        Alarm.stress_levels['activity'] = 2
+        self.assertEqual(q.get_limits(), (2, 8))
+
+        for _ in range(2 + 8):
+            q.acquire()
+
+        self.assertRaises(errors.ServiceOverloaded, q.acquire)
@@ -1,7 +1,12 @@
+from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import deferLater
 
+from storm.exceptions import OperationalError
+
+from globaleaks import orm
 from globaleaks.models import *
-from globaleaks.orm import get_store
+from globaleaks.orm import db_notify_on_commit, get_store, transact_ro, StorePool
 from globaleaks.tests import helpers
 from globaleaks.utils.utility import datetime_null
 
@@ -20,6 +25,11 @@ class TestORM(helpers.TestGL):
         self.assertEqual(store.execute("PRAGMA secure_delete").get_one()[0], 1) # ON
         self.assertEqual(store.execute("PRAGMA auto_vacuum").get_one()[0], 1)   # FULL
 
+    @transact_ro
+    def _transaction_ro_pragmas(self, store):
+        self.assertEqual(store.execute("PRAGMA journal_mode").get_one()[0], u'wal')
+        self.assertEqual(store.execute("PRAGMA query_only").get_one()[0], 1)    # ON
+
     def db_add_receiver(self, store):
         r = self.localization_set(self.dummyReceiver_1, Receiver, 'en')
         receiver_user = User(self.dummyReceiverUser_1)
@@ -53,9 +63,21 @@ class TestORM(helpers.TestGL):
         self.db_add_receiver(store)
         raise Exception("antani")
 
+    @transact_ro
+    def _transact_ro_with_write(self, store):
+        self.db_add_receiver(store)
+        store.flush()
+
+    @transact_ro
+    def _transact_ro_count_receivers(self, store):
+        return store.find(Receiver).count()
+
     def test_transaction_pragmas(self):
         return self._transaction_pragmas()
 
+    def test_transaction_ro_pragmas(self):
+        return self._transaction_ro_pragmas()
+
     @inlineCallbacks
     def test_transact_with_stuff(self):
         yield self._transact_with_success()
@@ -76,6 +98,26 @@ class TestORM(helpers.TestGL):
 
         self.assertEqual(count1, count2)
 
+    @inlineCallbacks
+    def test_transact_ro_sees_committed_data(self):
+        count1 = yield self._transact_ro_count_receivers()
+
+        yield self._transact_with_success()
+
+        count2 = yield self._transact_ro_count_receivers()
+
+        self.assertEqual(count1 + 1, count2)
+
+    @inlineCallbacks
+    def test_transact_ro_rejects_writes(self):
+        count1 = yield self._transact_ro_count_receivers()
+
+        yield self.assertFailure(self._transact_ro_with_write(), OperationalError)
+
+        count2 = yield self._transact_ro_count_receivers()
+
+        self.assertEqual(count1, count2)
+
     @inlineCallbacks
     def test_transact_decorate_function(self):
         @transact
@@ -83,3 +125,59 @@ class TestORM(helpers.TestGL):
             self.assertTrue(getattr(store, 'find'))
 
         yield transaction()
+
+    @inlineCallbacks
+    def test_commit_listeners(self):
+        notifications = []
+        self.patch(orm, 'commit_listeners', {'test': [lambda: notifications.append(None)]})
+
+        @transact
+        def transaction(store, fail):
+            db_notify_on_commit(store, 'test')
+            if fail:
+                raise Exception
+
+        # the listeners are not notified of the transactions rolled back
+        yield self.assertFailure(transaction(True), Exception)
+        yield deferLater(reactor, 0, lambda: None)
+        self.assertEqual(len(notifications), 0)
+
+        yield transaction(False)
+        yield deferLater(reactor, 0, lambda: None)
+        self.assertEqual(len(notifications), 1)
+
+
+class TestStorePool(helpers.TestGL):
+    initialize_test_database_using_archived_db = False
+
+    def test_store_reuse(self):
+        pool = StorePool('db_uri', 'orm_pool_size')
+
+        store = pool.get()
+        pool.put(store)
+
+        self.assertIs(pool.get(), store)
+        self.assertEqual(pool.get_stats()['opens'], 1)
+        self.assertEqual(pool.get_stats()['hits'], 1)
+
+    def test_close(self):
+        pool = StorePool('db_uri', 'orm_pool_size')
+
+        store = pool.get()
+        pool.put(store)
+        pool.close()
+
+        self.assertIsNot(pool.get(), store)
+        self.assertEqual(pool.get_stats()['opens'], 2)
+        self.assertEqual(pool.get_stats()['discards'], 1)
+
+    def test_broken_store_is_discarded(self):
+        pool = StorePool('db_uri', 'orm_pool_size')
+
+        store = pool.get()
+        store.close()
+        pool.put(store)
+
+        self.assertIsNot(pool.get(), store)
+        self.assertEqual(pool.get_stats()['discards'], 1)
+        self.assertEqual(pool.get_stats()['opened'], 1)
@@ -2,13 +2,20 @@ import binascii
 import os
 
 import scrypt
+import time
 from datetime import datetime
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList, inlineCallbacks
+from twisted.internet.task import deferLater
 from twisted.trial import unittest
 
+from globaleaks.anomaly import Alarm
+
 from globaleaks.rest import errors
 from globaleaks.security import generateRandomSalt, hash_password, check_password, change_password, \
     directory_traversal_check, GLSecureTemporaryFile, GLSecureFile, \
-    GLBPGP
+    IORateLimiter, _overwrite, get_overwrite_pattern, overwrite_and_remove, overwrite_and_remove_files, \
+    GLBPGP, GLBPGPKeyring, GLKDFPool
 from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
@@ -65,6 +72,87 @@ class TestPasswordManagement(unittest.TestCase):
                           dummy_salt_input)
 
 
+class PendingThreadPool(object):
+    """
+    Thread pool executing the calls only when requested
+    """
+    def __init__(self):
+        self.calls = []
+
+    def callInThreadWithCallback(self, onResult, f, *args, **kwargs):
+        self.calls.append((onResult, f, args, kwargs))
+
+    def run_calls(self):
+        calls, self.calls = self.calls, []
+        for onResult, f, args, kwargs in calls:
+            onResult(True, f(*args, **kwargs))
+
+
+class TestKDFPool(helpers.TestGL):
+    @inlineCallbacks
+    def test_concurrency_limit_follows_the_stress_level(self):
+        pool = GLSettings.kdf_tp = PendingThreadPool()
+        salt = generateRandomSalt()
+
+        self.assertEqual(GLKDFPool.get_limit(), GLSettings.kdf_tp_size)
+
+        Alarm.stress_levels['activity'] = 1
+        self.assertEqual(GLKDFPool.get_limit(), GLSettings.kdf_tp_size / 2)
+
+        dl = [GLKDFPool.hash_password(helpers.VALID_PASSWORD1, salt) for _ in range(GLSettings.kdf_tp_size)]
+
+        self.assertEqual(len(pool.calls), GLSettings.kdf_tp_size / 2)
+        self.assertEqual(GLKDFPool.get_stats()['waiting'], GLSettings.kdf_tp_size / 2)
+
+        Alarm.stress_levels['activity'] = 2
+
+        while GLKDFPool.get_stats()['waiting'] or pool.calls:
+            pool.run_calls()
+
+            # the results are delivered to the reactor thread
+            yield deferLater(reactor, 0.01, lambda: None)
+
+            self.assertTrue(len(pool.calls) <= 1)
+
+        results = yield DeferredList(dl)
+
+        for success, result in results:
+            self.assertTrue(success)
+            self.assertEqual(result, hash_password(helpers.VALID_PASSWORD1, salt))
+
+        self.assertEqual(GLKDFPool.get_stats()['running'], 0)
+
+    @inlineCallbacks
+    def test_submissions_are_executed_before_the_logins(self):
+        pool = GLSettings.kdf_tp = PendingThreadPool()
+        salt = generateRandomSalt()
+
+        completed = []
+
+        for i in range(GLSettings.kdf_tp_size + 2):
+            GLKDFPool.hash_password(helpers.VALID_PASSWORD1, salt).addCallback(lambda _: completed.append('login'))
+
+        GLKDFPool.hash_password(helpers.VALID_PASSWORD1, salt, 'submission').addCallback(lambda _: completed.append('submission'))
+
+        self.assertEqual(GLKDFPool.get_stats()['waiting'], 3)
+
+        while GLKDFPool.get_stats()['waiting'] or pool.calls:
+            pool.run_calls()
+            yield deferLater(reactor, 0.01, lambda: None)
+
+        self.assertEqual(completed.index('submission'), GLSettings.kdf_tp_size)
+
+    @inlineCallbacks
+    def test_change_password(self):
+        salt = generateRandomSalt()
+
+        password_hash = yield GLKDFPool.hash_password(helpers.VALID_PASSWORD1, salt)
+        self.assertTrue((yield GLKDFPool.check_password(helpers.VALID_PASSWORD1, salt, password_hash)))
+
+        yield self.assertFailure(GLKDFPool.change_password(password_hash, 'invalid_old_pass', 'new', salt),
+                                 errors.InvalidOldPassword)
+
+
 class TestFilesystemAccess(helpers.TestGL):
     def test_directory_traversal_failure_on_relative_trusted_path_must_fail(self):
         self.assertRaises(Exception, directory_traversal_check, 'invalid/relative/trusted/path', "valid.txt")
@@ -78,6 +166,55 @@ class TestFilesystemAccess(helpers.TestGL):
         directory_traversal_check(GLSettings.static_path, valid_access)
 
 
+class TestSecureDelete(helpers.TestGL):
+    def create_file(self, size):
+        path = os.path.join(GLSettings.tmp_upload_path, os.urandom(8).encode('hex'))
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+
+        return path
+
+    def test_overwrite_in_place(self):
+        path = self.create_file(100000)
+
+        for kind, expected in [('zeros', b'\x00'), ('ones', b'\xff')]:
+            fd = os.open(path, os.O_WRONLY)
+            _overwrite(fd, 100000, get_overwrite_pattern(kind, 4096), IORateLimiter(0))
+            os.close(fd)
+
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), expected * 100000)
+
+        self.assertRaises(ValueError, get_overwrite_pattern, 'invalid', 4096)
+
+    def test_overwrite_and_remove(self):
+        for size in [0, 1, 4096, GLSettings.secure_delete_buffer_size + 1]:
+            path = self.create_file(size)
+            overwrite_and_remove(path)
+            self.assertFalse(os.path.exists(path))
+
+        overwrite_and_remove(os.path.join(GLSettings.tmp_upload_path, 'unexistent'))
+
+    def test_overwrite_and_remove_files(self):
+        paths = [self.create_file(10000) for _ in range(10)]
+
+        deleted = []
+        overwrite_and_remove_files(paths, deleted.append)
+
+        self.assertEqual(sorted(deleted), sorted(paths))
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+
+    def test_rate_limiter(self):
+        rate_limiter = IORateLimiter(1024 * 1024)
+
+        start = time.time()
+        for _ in range(3):
+            rate_limiter.consume(100 * 1024)
+
+        self.assertTrue(time.time() - start >= 0.19)
+
+
 class TestGLSecureFiles(helpers.TestGL):
     def test_temporary_file(self):
         a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
@@ -95,6 +232,21 @@ class TestGLSecureFiles(helpers.TestGL):
         self.assertRaises(Exception, a.write, antani)
         a.close()
 
+    def test_temporary_file_write_file_at(self):
+        antani = "0123456789" * 10000
+        chunks = [antani[i:i + 30001] for i in range(0, len(antani), 30001)]
+
+        a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+        for i in reversed(range(len(chunks))):
+            b = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+            b.write(chunks[i])
+            a.write_file_at(i * 30001, b)
+            self.assertFalse(os.path.exists(b.filepath))
+
+        self.assertEqual(a.size, len(antani))
+        self.assertTrue(antani == a.read())
+        a.close()
+
     def test_temporary_file_avoid_delete(self):
         a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
         a.avoid_delete()
@@ -173,3 +325,56 @@ class TestPGP(helpers.TestGL):
                          datetime.utcfromtimestamp(1391012793))
 
         pgpobj.destroy_environment()
+
+
+class TestPGPKeyring(helpers.TestGL):
+    def test_keyring_reuse(self):
+        keyring = GLBPGPKeyring(2)
+
+        with keyring.use(helpers.PGPKEYS['VALID_PGP_KEY1_PUB']) as gpob1:
+            pass
+
+        with keyring.use(helpers.PGPKEYS['VALID_PGP_KEY1_PUB']) as gpob2:
+            body = gpob2.encrypt_message(u'ECAF2235E78E71CD95365843C7B190543CAA7585', 'antani')
+
+        self.assertIs(gpob1, gpob2)
+        self.assertTrue(body.startswith('-----BEGIN PGP MESSAGE-----'))
+        self.assertEqual(keyring.stats['hits'], 1)
+        self.assertEqual(keyring.stats['misses'], 1)
+
+        keyring.clear()
+        self.assertFalse(os.path.exists(gpob1.gnupg.gnupghome))
+
+    def test_keyring_eviction(self):
+        keyring = GLBPGPKeyring(1)
+
+        entry1 = keyring.acquire(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+        entry2 = keyring.acquire(helpers.PGPKEYS['VALID_PGP_KEY2_PUB'])
+
+        # the entries in use are never destroyed
+        self.assertEqual(len(keyring.entries), 2)
+
+        keyring.release(entry1)
+        keyring.release(entry2)
+
+        keyring.acquire(helpers.PGPKEYS['EXPIRED_PGP_KEY_PUB'])
+
+        self.assertEqual(len(keyring.entries), 1)
+        self.assertEqual(keyring.stats['evictions'], 2)
+        self.assertFalse(os.path.exists(entry1['gpob'].gnupg.gnupghome))
+        self.assertFalse(os.path.exists(entry2['gpob'].gnupg.gnupghome))
+
+        keyring.clear()
+
+    def test_keyring_invalidate(self):
+        keyring = GLBPGPKeyring(2)
+
+        entry = keyring.acquire(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+        keyring.invalidate(entry['fingerprint'])
+
+        self.assertEqual(len(keyring.entries), 0)
+
+        # the environment is destroyed only when released
+        self.assertTrue(os.path.exists(entry['gpob'].gnupg.gnupghome))
+        keyring.release(entry)
+        self.assertFalse(os.path.exists(entry['gpob'].gnupg.gnupghome))
@@ -0,0 +1,176 @@
+from twisted.internet import defer, task
+from twisted.mail.smtp import SMTPConnectError, SMTPDeliveryError
+from twisted.test.proto_helpers import StringTransport
+
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+from globaleaks.utils.mailutils import SMTPPool, sendmail
+
+
+def mails(n):
+    return [{
+        'address': u'receiver%d@example.net' % i,
+        'subject': u'subject',
+        'body': u'body'
+    } for i in range(n)]
+
+
+class TestSMTPPool(helpers.TestGL):
+    @defer.inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGL.setUp(self)
+
+        self.clock = task.Clock()
+        self.transports = []
+        self.protocols = []
+
+        SMTPPool.connect = self.connect
+        GLSettings.testing = False
+
+    def tearDown(self):
+        GLSettings.testing = True
+        GLSettings.mail_sessions = 2
+
+        del SMTPPool.connect
+        SMTPPool.queue.clear()
+        SMTPPool.sessions.clear()
+        del SMTPPool.idle[:]
+        SMTPPool.connecting = 0
+
+        return helpers.TestGL.tearDown(self)
+
+    def connect(self, factory, server, port):
+        # the test server does not require the authentication and STARTTLS
+        factory._requireAuthentication = False
+        factory._requireTransportSecurity = False
+
+        protocol = factory.buildProtocol(None)
+        protocol.callLater = self.clock.callLater
+
+        transport = StringTransport()
+        protocol.makeConnection(transport)
+
+        self.transports.append(transport)
+        self.protocols.append(protocol)
+
+        self.reply(-1, '220 localhost ESMTP')
+        self.reply(-1, '250 localhost')
+
+        return defer.succeed(protocol)
+
+    def connect_failure(self, factory, server, port):
+        return defer.fail(SMTPConnectError(-1, "Unable to connect to server."))
+
+    def reply(self, i, line):
+        self.protocols[i].dataReceived(line + '\r\n')
+
+    def deliver(self, i, code='250'):
+        """
+        Reply to the commands of the delivery of a mail
+        """
+        self.reply(i, '250 sender ok')
+        self.reply(i, code + ' recipient')
+
+        if code == '250':
+            self.reply(i, '354 go ahead')
+
+            transport = self.transports[i]
+            while transport.producer is not None:
+                transport.producer.resumeProducing()
+
+            self.reply(i, '250 queued')
+
+        # RSET
+        self.reply(i, '250 reset')
+
+    def test_mails_delivered_over_the_same_session(self):
+        GLSettings.mail_sessions = 1
+
+        results = []
+
+        ds = SMTPPool.send(mails(3))
+        for d in ds:
+            d.addBoth(results.append)
+
+        self.assertEqual(len(self.protocols), 1)
+
+        self.deliver(0)
+        self.deliver(0, '550')
+        self.deliver(0)
+
+        self.assertEqual(results[0], None)
+        self.assertTrue(results[1].check(SMTPDeliveryError))
+        self.assertEqual(results[1].value.code, 550)
+        self.assertEqual(results[2], None)
+
+        # the session is kept open and reused for the new mails
+        self.assertEqual(SMTPPool.idle, self.protocols)
+
+        d = sendmail(u'receiver@example.net', u'subject', u'body')
+        self.deliver(0)
+        self.assertEqual(d.result, None)
+
+        self.assertEqual(len(self.protocols), 1)
+
+        value = self.transports[0].value()
+        self.assertEqual(value.count('EHLO'), 1)
+        self.assertEqual(value.count('MAIL FROM'), 4)
+        self.assertEqual(value.count('RSET'), 4)
+
+        # the idle session is closed after mail_session_idle_timeout
+        self.clock.advance(GLSettings.mail_session_idle_timeout)
+        self.assertTrue(self.transports[0].value().endswith('QUIT\r\n'))
+        self.assertEqual(SMTPPool.idle, [])
+
+        self.reply(0, '221 bye')
+        self.assertTrue(self.transports[0].disconnecting)
+
+    def test_concurrent_sessions(self):
+        GLSettings.mail_sessions = 2
+
+        ds = SMTPPool.send(mails(4))
+
+        self.assertEqual(len(self.protocols), 2)
+        self.assertEqual(len(SMTPPool.sessions), 2)
+
+        for _ in range(2):
+            self.deliver(0)
+            self.deliver(1)
+
+        for d in ds:
+            self.assertEqual(d.result, None)
+
+        for protocol in self.protocols:
+            protocol.quit()
+
+    def test_connection_lost(self):
+        GLSettings.mail_sessions = 1
+
+        ds = SMTPPool.send(mails(2))
+
+        self.protocols[0].connectionLost(None)
+
+        # the mail being delivered fails and the remaining ones are
+        # delivered over a new session
+        self.assertFailure(ds[0], SMTPConnectError)
+        self.assertEqual(len(self.protocols), 2)
+
+        self.deliver(1)
+        self.assertEqual(ds[1].result, None)
+
+        self.protocols[1].quit()
+
+        return ds[0]
+
+    def test_connection_failure(self):
+        SMTPPool.connect = self.connect_failure
+
+        ds = SMTPPool.send(mails(3))
+
+        for d in ds:
+            self.assertFailure(d, SMTPConnectError)
+
+        self.assertEqual(len(SMTPPool.queue), 0)
+        self.assertEqual(len(SMTPPool.sessions), 0)
+
+        return defer.gatherResults(ds)
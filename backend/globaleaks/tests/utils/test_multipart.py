@@ -0,0 +1,135 @@
+from io import BytesIO
+
+from twisted.trial import unittest
+from twisted.web import server
+from twisted.web.test.requesthelper import DummyChannel
+
+# this import seems unused but it is required in order to load the mocks
+import globaleaks.mocks.twisted_mocks
+from globaleaks.security import GLSecureTemporaryFile
+from globaleaks.tests import helpers
+from globaleaks.utils.multipart import MultipartStream
+
+BOUNDARY = b'----WebKitFormBoundaryx8eWhKGFo3VOGYe2'
+
+CONTENT = b''.join(chr(x % 256) for x in range(100000)) + b'\r\n--' + BOUNDARY[:-1]
+
+
+def build_body(fields, files):
+    body = b''
+    for name, value in fields:
+        body += b'--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (BOUNDARY, name, value)
+
+    for name, value in files:
+        body += b'--%s\r\nContent-Disposition: form-data; name="%s"; filename="blob"\r\n' \
+                b'Content-Type: application/octet-stream\r\n\r\n%s\r\n' % (BOUNDARY, name, value)
+
+    return body + b'--%s--\r\n' % BOUNDARY
+
+
+FIELDS = [(b'flowChunkNumber', b'1'), (b'flowTotalChunks', b'1'), (b'flowFilename', b'antani.txt')]
+
+BODY = build_body(FIELDS, [(b'file', CONTENT)])
+
+
+class TestMultipartStream(unittest.TestCase):
+    def parse(self, body, chunk_size, **kwargs):
+        files = []
+
+        def open_file():
+            files.append(BytesIO())
+            return files[-1]
+
+        stream = MultipartStream(BOUNDARY, open_file, **kwargs)
+        for i in range(0, len(body), chunk_size):
+            stream.write(body[i:i + chunk_size])
+
+        stream.finish()
+
+        return stream, files
+
+    def test_parse(self):
+        for chunk_size in [1, 7, 1000, 65536, len(BODY)]:
+            stream, files = self.parse(BODY, chunk_size)
+
+            self.assertTrue(stream.complete)
+            self.assertEqual(stream.args, dict((k, [v]) for k, v in FIELDS))
+            self.assertEqual(len(files), 1)
+            self.assertEqual(files[0].getvalue(), CONTENT)
+            self.assertEqual(stream.pop_file(b'file'), files[0])
+
+    def test_memory_is_bounded(self):
+        stream = MultipartStream(BOUNDARY, BytesIO)
+        for i in range(0, len(BODY), 4096):
+            stream.write(BODY[i:i + 4096])
+            self.assertTrue(len(stream.buffer) < 4096 + len(stream.delimiter))
+
+    def test_file_too_big(self):
+        stream, files = self.parse(BODY, 1000, max_file_size=len(CONTENT) - 1)
+
+        self.assertFalse(stream.complete)
+        self.assertTrue(stream.too_big)
+        self.assertEqual(stream.files, {})
+
+    def test_field_too_big(self):
+        body = build_body([(b'description', b'x' * 100)], [])
+
+        stream, _ = self.parse(body, 10, max_field_size=99)
+
+        self.assertFalse(stream.complete)
+        self.assertFalse(stream.too_big)
+
+    def test_truncated_body(self):
+        stream, _ = self.parse(BODY[:-10], 1000)
+
+        self.assertFalse(stream.complete)
+        self.assertEqual(stream.files, {})
+
+    def test_invalid_body(self):
+        stream, _ = self.parse(b'--%s\r\nContent-Type: text/plain\r\n\r\nantani\r\n--%s--\r\n' % (BOUNDARY, BOUNDARY), 1000)
+
+        self.assertFalse(stream.complete)
+
+
+class TestUploadStreaming(helpers.TestGL):
+    def test_upload_is_encrypted_while_received(self):
+        request = server.Request(DummyChannel(), False)
+        request.requestHeaders.setRawHeaders(b'content-type', [b'multipart/form-data; boundary=' + BOUNDARY])
+
+        request.gotLength(len(BODY))
+
+        self.assertTrue(isinstance(request.content, MultipartStream))
+
+        for i in range(0, len(BODY), 4096):
+            request.handleContentChunk(BODY[i:i + 4096])
+
+        f = request.content.pop_file(b'file')
+        self.assertTrue(isinstance(f, GLSecureTemporaryFile))
+        self.assertEqual(f.size, len(CONTENT))
+
+        with open(f.filepath, 'rb') as encrypted:
+            self.assertNotEqual(encrypted.read(), CONTENT)
+
+        self.assertEqual(f.read(), CONTENT)
+        f.close()
+
+    def test_files_not_used_are_removed(self):
+        request = server.Request(DummyChannel(), False)
+        request.requestHeaders.setRawHeaders(b'content-type', [b'multipart/form-data; boundary=' + BOUNDARY])
+
+        request.gotLength(None)
+        request.handleContentChunk(BODY[:len(BODY) // 2])
+
+        f = request.content.files[b'file']
+
+        request.connectionLost(None)
+
+        self.assertTrue(f.close_called)
+
+    def test_other_requests_are_buffered(self):
+        request = server.Request(DummyChannel(), False)
+        request.requestHeaders.setRawHeaders(b'content-type', [b'application/json'])
+
+        request.gotLength(10)
+
+        self.assertEqual(request.content.__class__, BytesIO)
@@ -53,3 +53,56 @@ class TestTempDict(helpers.TestGL):
                 self.assertEqual(len(xxx), size_limit)
                 self.assertEqual(xxx.get(x - size_limit + 1).id, x - size_limit + 1)
                 self.assertEqual(xxx.get(x - size_limit), None)
+
+    def test_get_postpones_expiration(self):
+        timeout = 10
+
+        xxx = TempDict(timeout=timeout)
+        xxx.set(1, TestObject(1))
+
+        for _ in range(3):
+            self.test_reactor.advance(timeout - 1)
+            self.assertEqual(xxx.get(1).id, 1)
+
+        self.test_reactor.advance(timeout)
+        self.assertEqual(xxx.get(1), None)
+
+    def test_single_delayed_call(self):
+        xxx = TempDict(timeout=10)
+
+        for x in range(1000):
+            xxx.set(x, TestObject(x))
+            xxx.get(x)
+
+        self.assertEqual(len(self.test_reactor.getDelayedCalls()), 1)
+
+        self.test_reactor.advance(10)
+        self.assertEqual(len(xxx), 0)
+        self.assertEqual(len(self.test_reactor.getDelayedCalls()), 0)
+
+    def test_set_replaces_expiration(self):
+        xxx = TempDict(timeout=10)
+        xxx.set(1, TestObject(1))
+
+        self.test_reactor.advance(5)
+        xxx.set(1, TestObject(2))
+
+        self.test_reactor.advance(5)
+        self.assertEqual(xxx.get(1).id, 2)
+
+        self.test_reactor.advance(10)
+        self.assertEqual(xxx.get(1), None)
+
+    def test_get_time(self):
+        # the deadlines are kept by the TempDict so that any item could be stored
+        xxx = TempDict(timeout=10)
+        xxx.set(1, 'item')
+
+        self.assertEqual(xxx.get_time(1), self.test_reactor.seconds() + 10)
+
+        self.test_reactor.advance(5)
+        self.assertEqual(xxx.get(1), 'item')
+        self.assertEqual(xxx.get_time(1), self.test_reactor.seconds() + 10)
+
+        xxx.delete(1)
+        self.assertEqual(xxx.expire_calls, {})
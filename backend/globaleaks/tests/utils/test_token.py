@@ -6,6 +6,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.anomaly import Alarm
 from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 from globaleaks.utils.token import Token, TokenList
 
@@ -108,7 +109,7 @@ class TestToken(helpers.TestGL):
 
         # Note, this solution works with two '00' at the end, if the
         # difficulty changes, also this dummy value has to.
-        token.proof_of_work = {'question': "7GJ4Sl37AEnP10Zk9p7q", 'solved': False}
+        token.proof_of_work = {'question': "7GJ4Sl37AEnP10Zk9p7q", 'difficulty': 2, 'solved': False}
 
         self.assertFalse(token.update({'proof_of_work_answer': 0}))
         # validate with right value: OK
@@ -120,12 +121,32 @@ class TestToken(helpers.TestGL):
 
         # Note, this solution works with two '00' at the end, if the
         # difficulty changes, also this dummy value has to.
-        token.proof_of_work = {'question': "7GJ4Sl37AEnP10Zk9p7q", 'solved': False}
+        token.proof_of_work = {'question': "7GJ4Sl37AEnP10Zk9p7q", 'difficulty': 2, 'solved': False}
 
         # validate with right value: OK
         self.assertTrue(token.update({'proof_of_work_answer': 26}))
         token.use()
 
+    def test_proof_of_work_difficulty_follows_the_stress_level(self):
+        GLSettings.memory_copy.enable_proof_of_work = True
+
+        Alarm.stress_levels['activity'] = 0
+        self.assertEqual(Token('submission').serialize()['proof_of_work_difficulty'], 2)
+
+        Alarm.stress_levels['activity'] = 1
+        token = Token('submission')
+        self.assertEqual(token.serialize()['proof_of_work_difficulty'], 3)
+
+        token.human_captcha = {'solved': True}
+        token.proof_of_work['question'] = "7GJ4Sl37AEnP10Zk9p7q"
+
+        # the hash of the answer valid with a difficulty of 2 ends with 'a600'
+        self.assertFalse(token.update({'proof_of_work_answer': 26}))
+
+        token.human_captcha = {'solved': True}
+        token.proof_of_work['question'] = "7GJ4Sl37AEnP10Zk9p7q"
+        self.assertTrue(token.update({'proof_of_work_answer': 8324}))
+
     def test_tokens_garbage_collected(self):
         self.assertTrue(len(TokenList) == 0)
 
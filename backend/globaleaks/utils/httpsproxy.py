@@ -136,6 +136,11 @@ class HTTPStreamProxyRequest(http.Request):
         return NOT_DONE_YET
 
     def proxySuccess(self, response):
+        # the responses already encoded by the backend (e.g. the cached
+        # resources) and the ones without a body are forwarded as they are
+        if response.headers.hasHeader(b'content-encoding') or response.code == 304:
+            self.gzip = False
+
         self.responseHeaders = response.headers
         if self.gzip:
             self.responseHeaders.setRawHeaders(b'content-encoding', [b'gzip'])
@@ -10,6 +10,7 @@ import re
 import sys
 import traceback
 from calendar import timegm
+from collections import deque
 from email import Charset # pylint: disable=no-name-in-module
 from email import utils as mailutils
 from email.header import Header
@@ -18,16 +19,17 @@ from email.mime.text import MIMEText
 
 from OpenSSL import SSL
 from datetime import datetime
-from twisted.internet import reactor, defer
+from twisted.internet import reactor, defer, protocol
 from twisted.internet.endpoints import TCP4ClientEndpoint
 from twisted.internet.ssl import ClientContextFactory
-from twisted.mail.smtp import ESMTPSenderFactory, SMTPError
+from twisted.mail.smtp import ESMTPSender, ESMTPSenderFactory, SMTPClient, SMTPConnectError, \
+    SMTPDeliveryError, SMTPError, SUCCESS
 from twisted.protocols import tls
 from twisted.python.failure import Failure
 from txsocksx.client import SOCKS5ClientEndpoint
 
 from globaleaks import __version__
-from globaleaks.security import GLBPGP, sha256
+from globaleaks.security import GLPGPKeyring, sha256
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import log
 
@@ -65,88 +67,337 @@ class GLClientContextFactory(ClientContextFactory):
         return ctx
 
 
-def sendmail(to_address, subject, body):
+def get_session_key():
     """
-    Sends an email using SMTPS/SMTP+TLS and torify the connection
+    Return the SMTP configuration the sessions are opened with
+    """
+    notif = GLSettings.memory_copy.notif
 
-    @param to_address: the to address field of the email
-    @param subject: the mail subject
-    @param body: the mail body
-    @param event: the event description, needed to keep track of failure/success
+    return (notif.server, notif.port, notif.security, notif.username,
+            GLSettings.memory_copy.private.smtp_password, notif.source_email,
+            GLSettings.memory_copy.anonymize_outgoing_connections)
+
+
+def build_mail(mail):
+    return MIME_mail_build(GLSettings.memory_copy.notif.source_name,
+                           GLSettings.memory_copy.notif.source_email,
+                           mail['address'],
+                           mail['address'],
+                           mail['subject'],
+                           mail['body'])
+
+
+class SMTPSession(ESMTPSender):
     """
-    try:
-        if to_address == "":
+    ESMTP client delivering over the same connection the mails queued in
+    the SMTPPool.
+
+    Every mail is followed by a RSET and by the next mail of the queue;
+    when the queue is empty the session is kept open and idle until new
+    mails are queued or GLSettings.mail_session_idle_timeout expires.
+    """
+    mail = None
+    idle_call = None
+    closing = False
+
+    def smtpState_from(self, code, resp):
+        if not self.closing:
+            self.mail = SMTPPool.next_mail(self.factory)
+
+            if self.mail is None and self.factory.count < GLSettings.mail_session_max_mails:
+                self.set_idle()
+                return
+
+        ESMTPSender.smtpState_from(self, code, resp)
+
+    def set_idle(self):
+        self.setTimeout(None)
+        self.idle_call = self.callLater(GLSettings.mail_session_idle_timeout, self.quit)
+        SMTPPool.idle.append(self)
+
+    def resume(self):
+        """
+        Resume the idle session in order to deliver the mails queued
+        """
+        self.idle_call.cancel()
+        self.idle_call = None
+        self.setTimeout(self.timeout)
+        self.smtpState_from(250, '')
+
+    def quit(self):
+        """
+        Close the idle session
+        """
+        if self in SMTPPool.idle:
+            SMTPPool.idle.remove(self)
+
+        if self.idle_call is not None and self.idle_call.active():
+            self.idle_call.cancel()
+
+        self.idle_call = None
+        self.closing = True
+        self.smtpState_from(250, '')
+
+    def getMailFrom(self):
+        if self.mail is None:
+            self.factory.finish()
+            return None
+
+        return str(self.factory.fromEmail)
+
+    def getMailTo(self):
+        return [self.mail[0]['address'].encode('utf-8')]
+
+    def getMailData(self):
+        return build_mail(self.mail[0])
+
+    def sentMail(self, code, resp, numOk, addresses, log):
+        mail, self.mail = self.mail, None
+
+        if code in SUCCESS:
+            SMTPPool.mail_sent(mail)
+        else:
+            SMTPPool.mail_failed(mail, SMTPDeliveryError(code, resp, log.str(), addresses))
+
+    def sendError(self, exc):
+        # Call the base class to close the connection with the SMTP server
+        SMTPClient.sendError(self, exc)
+
+        self.fail(exc)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        ESMTPSender.connectionLost(self, reason)
+
+        if self in SMTPPool.idle:
+            SMTPPool.idle.remove(self)
+
+        if self.idle_call is not None and self.idle_call.active():
+            self.idle_call.cancel()
+
+        self.fail(SMTPConnectError(-1, "Connection lost"))
+
+    def fail(self, exc):
+        if self.mail is not None:
+            mail, self.mail = self.mail, None
+            SMTPPool.mail_failed(mail, exc)
+
+        self.factory.finish(exc)
+
+
+class SMTPSessionFactory(ESMTPSenderFactory):
+    protocol = SMTPSession
+
+    def __init__(self, key, deferred):
+        server, port, security, username, password, source_email, _ = key
+
+        ESMTPSenderFactory.__init__(self,
+                                    username.encode('utf-8'),
+                                    password.encode('utf-8'),
+                                    source_email,
+                                    [],
+                                    None,
+                                    deferred,
+                                    contextFactory=GLClientContextFactory(),
+                                    requireAuthentication=True,
+                                    requireTransportSecurity=(security != 'SSL'),
+                                    retries=0,
+                                    timeout=GLSettings.mail_timeout)
+
+        self.key = key
+
+        # the number of mails delivered over the session
+        self.count = 0
+
+        # True until the session has taken its first mail
+        self.connecting = True
+
+    def finish(self, reason=None):
+        """
+        Fire the result of the session
+        """
+        if self.sendFinished:
             return
 
-        result_deferred = defer.Deferred()
-
-        def errback(reason, *args, **kwargs):
-            # TODO: here it should be written a complete debugging of the possible
-            #       errors by writing clear log lines in relation to all the stack:
-            #       e.g. it should debugged all errors related to: TCP/SOCKS/TLS/SSL/SMTP/SFIGA
-            if isinstance(reason, Failure):
-                log.err("SMTP connection failed (Exception: %s)" % reason.value)
-                log.debug(reason)
-
-            return result_deferred.errback(reason)
-
-        authentication_username=GLSettings.memory_copy.notif.username
-        authentication_password=GLSettings.memory_copy.private.smtp_password
-        from_address=GLSettings.memory_copy.notif.source_email
-        smtp_host=GLSettings.memory_copy.notif.server
-        smtp_port=GLSettings.memory_copy.notif.port
-        security=GLSettings.memory_copy.notif.security
-
-        message = MIME_mail_build(GLSettings.memory_copy.notif.source_name,
-                                  GLSettings.memory_copy.notif.source_email,
-                                  to_address,
-                                  to_address,
-                                  subject,
-                                  body)
-
-        log.debug('Sending email to %s using SMTP server [%s:%d] [%s]' %
-                  (to_address, smtp_host, smtp_port, security))
-
-        context_factory = GLClientContextFactory()
-
-        esmtp_deferred = defer.Deferred()
-        esmtp_deferred.addCallbacks(result_deferred.callback, errback)
-
-        factory = ESMTPSenderFactory(
-            authentication_username.encode('utf-8'),
-            authentication_password.encode('utf-8'),
-            from_address,
-            to_address,
-            message,
-            esmtp_deferred,
-            contextFactory=context_factory,
-            requireAuthentication=True,
-            requireTransportSecurity=(security != 'SSL'),
-            retries=0,
-            timeout=GLSettings.mail_timeout)
+        self.sendFinished = True
+        if reason is None:
+            self.result.callback(None)
+        else:
+            self.result.errback(reason)
+
 
-        if security == "SSL":
-            factory = tls.TLSMemoryBIOFactory(context_factory, True, factory)
+class SMTPPool(object):
+    """
+    Pool of the ESMTP sessions delivering the mails.
+
+    The mails are queued and delivered by at most GLSettings.mail_sessions
+    concurrent sessions; every session delivers many mails over the same
+    connection, paying the TCP/TLS handshake and the authentication only
+    once, and is kept open between the batches of mails.
+    """
+    queue = deque()
+    sessions = set()
+    idle = []
+    connecting = 0
+    stats = {
+        'connections': 0,
+        'sent': 0,
+        'failed': 0
+    }
+
+    @classmethod
+    def send(cls, mails):
+        """
+        Queue the mails for the delivery
+
+        @param mails: a list of dicts with keys address, subject and body
+        @return: the list of the Deferreds of the delivery of every mail
+        """
+        ret = []
+        for mail in mails:
+            d = defer.Deferred()
+            cls.queue.append((mail, d))
+            ret.append(d)
+
+        cls.dispatch()
+
+        return ret
+
+    @classmethod
+    def dispatch(cls):
+        """
+        Assign the queued mails to the idle sessions and open new sessions
+        if the queued mails exceed the sessions already connecting
+        """
+        key = get_session_key()
+
+        # the idle sessions opened with an outdated configuration are closed
+        for session in [s for s in cls.idle if s.factory.key != key]:
+            session.quit()
+
+        while cls.queue and cls.idle:
+            cls.idle.pop().resume()
+
+        while len(cls.queue) > cls.connecting and \
+              len(cls.sessions) < GLSettings.mail_sessions:
+            cls.open_session(key)
+
+    @classmethod
+    def open_session(cls, key):
+        server, port, security = key[0], key[1], key[2]
 
         if GLSettings.testing:
             #  Hooking the test down to here is a trick to be able to test all the above code :)
-            return defer.succeed(None)
+            while cls.queue:
+                mail = cls.queue.popleft()
+                build_mail(mail[0])
+                cls.mail_sent(mail)
+
+            return
+
+        log.debug('Opening SMTP session with server [%s:%d] [%s]' % (server, port, security))
+
+        result = defer.Deferred()
+        session = SMTPSessionFactory(key, result)
+        result.addBoth(cls.session_finished, session)
+
+        cls.sessions.add(session)
+        cls.connecting += 1
+        cls.stats['connections'] += 1
+
+        factory = session
+        if security == "SSL":
+            factory = tls.TLSMemoryBIOFactory(session._contextFactory, True, session)
+
+        cls.connect(factory, server, port).addErrback(session.finish)
 
+    @classmethod
+    def connect(cls, factory, server, port):
         if GLSettings.memory_copy.anonymize_outgoing_connections:
             socksProxy = TCP4ClientEndpoint(reactor, GLSettings.socks_host, GLSettings.socks_port, timeout=GLSettings.mail_timeout)
-            endpoint = SOCKS5ClientEndpoint(smtp_host.encode('utf-8'), smtp_port, socksProxy)
+            endpoint = SOCKS5ClientEndpoint(server.encode('utf-8'), port, socksProxy)
         else:
-            endpoint = TCP4ClientEndpoint(reactor, smtp_host.encode('utf-8'), smtp_port, timeout=GLSettings.mail_timeout)
+            endpoint = TCP4ClientEndpoint(reactor, server.encode('utf-8'), port, timeout=GLSettings.mail_timeout)
 
-        d = endpoint.connect(factory)
-        d.addErrback(errback)
+        return endpoint.connect(factory)
 
-        return result_deferred
+    @classmethod
+    def next_mail(cls, factory):
+        """
+        Return the next mail to be delivered by the session or None
+        """
+        if factory.connecting:
+            factory.connecting = False
+            cls.connecting -= 1
 
-    except Exception as excep:
-        # we strongly need to avoid raising exception inside email logic to avoid chained errors
-        log.err("Unexpected exception in sendmail: %s" % str(excep))
-        return defer.fail()
+        if not cls.queue or factory.count >= GLSettings.mail_session_max_mails:
+            return None
+
+        factory.count += 1
+
+        return cls.queue.popleft()
+
+    @classmethod
+    def session_finished(cls, result, factory):
+        cls.sessions.discard(factory)
+
+        if factory.connecting:
+            factory.connecting = False
+            cls.connecting -= 1
+
+        if isinstance(result, Failure):
+            log.err("SMTP connection failed (Exception: %s)" % result.value)
+            log.debug(result)
+
+            if factory.count == 0:
+                # the sessions failing before delivering any mail (e.g. the
+                # server is not reachable) are not replaced; when no other
+                # session is open the queued mails fail with the same error
+                if not cls.sessions:
+                    while cls.queue:
+                        cls.mail_failed(cls.queue.popleft(), result.value)
+
+                return
+
+        cls.dispatch()
+
+    @classmethod
+    def mail_sent(cls, mail):
+        cls.stats['sent'] += 1
+        mail[1].callback(None)
+
+    @classmethod
+    def mail_failed(cls, mail, exc):
+        cls.stats['failed'] += 1
+        mail[1].errback(exc)
+
+    @classmethod
+    def get_stats(cls):
+        stats = dict(cls.stats)
+        stats['sessions'] = len(cls.sessions)
+        stats['idle'] = len(cls.idle)
+        stats['queued'] = len(cls.queue)
+
+        return stats
+
+
+def sendmail(to_address, subject, body):
+    """
+    Sends an email using SMTPS/SMTP+TLS and torify the connection
+
+    @param to_address: the to address field of the email
+    @param subject: the mail subject
+    @param body: the mail body
+    """
+    if to_address == "":
+        return
+
+    log.debug('Sending email to %s' % to_address)
+
+    return SMTPPool.send([{
+        'address': to_address,
+        'subject': subject,
+        'body': body
+    }])[0]
 
 
 def MIME_mail_build(src_name, src_mail, dest_name, dest_mail, title, mail_body):
@@ -261,16 +512,16 @@ def send_exception_email(exception_text):
             # Opportunisticly encrypt the mail body. NOTE that mails will go out
             # unencrypted if one address in the list does not have a public key set.
             if len(pub_key):
-                gpob = GLBPGP()
                 try:
-                    r = gpob.load_key(pub_key)
-                    mail_body = gpob.encrypt_message(r['fingerprint'], mail_body)
-                    gpob.destroy_environment()
+                    entry = GLPGPKeyring.acquire(pub_key)
+                    try:
+                        mail_body = entry['gpob'].encrypt_message(entry['fingerprint'], mail_body)
+                    finally:
+                        GLPGPKeyring.release(entry)
                 except Exception as excep:
                     # If this exception email is configured to be subject to encryption
                     # and the encryption step throws, log the error and move on.
                     log.err("Error while encrypting exception email: %s" % str(excep))
-                    gpob.destroy_environment()
                     continue
 
             # avoid waiting for the notification to send and instead rely on threads to handle it
@@ -0,0 +1,214 @@
+# -*- coding: UTF-8
+#   multipart
+#   *********
+#
+# Incremental parser of the multipart/form-data request bodies (RFC 7578)
+# used to stream the uploaded files to disk while they are received.
+import cgi
+
+# states of the parser
+PREAMBLE, DELIMITER, HEADERS, BODY, EPILOGUE = range(5)
+
+MAX_HEADERS_SIZE = 8192
+
+
+class MultipartError(Exception):
+    pass
+
+
+class MultipartStream(object):
+    """
+    Parser of a multipart/form-data body fed while the body is received,
+    usable in place of the buffer of the content of a twisted.web Request.
+
+    The parts carrying a file are written into the files returned by
+    open_file as soon as their data is received, while the values of the
+    other parts are collected in args in the same format of the values
+    parsed by cgi.parse_multipart.
+
+    The memory used is bounded by the size of the data received at once,
+    regardless of the size of the files.
+    """
+    def __init__(self, boundary, open_file, max_file_size=None, max_field_size=65536):
+        self.delimiter = b'\r\n--' + boundary
+        self.open_file = open_file
+        self.max_file_size = max_file_size
+        self.max_field_size = max_field_size
+
+        self.args = {}
+        self.files = {}
+        self.too_big = False
+        self.error = None
+
+        self.state = PREAMBLE
+
+        # the delimiter of the first boundary is not preceded by a CRLF
+        self.buffer = b'\r\n'
+
+        self.name = None
+        self.file = None
+        self.value = []
+        self.size = 0
+
+    @property
+    def complete(self):
+        return self.state == EPILOGUE and self.error is None
+
+    def write(self, data):
+        if self.error is not None or self.state == EPILOGUE:
+            return
+
+        self.buffer += data
+
+        try:
+            self.parse()
+        except MultipartError as e:
+            self.fail(e)
+
+    def parse(self):
+        while True:
+            if self.state in (PREAMBLE, BODY):
+                i = self.buffer.find(self.delimiter)
+                if i == -1:
+                    # the data is consumed leaving in the buffer only what
+                    # could be the beginning of the delimiter
+                    keep = len(self.delimiter) - 1
+                    if len(self.buffer) > keep:
+                        if self.state == BODY:
+                            self.consume(self.buffer[:-keep])
+
+                        self.buffer = self.buffer[-keep:]
+
+                    return
+
+                if self.state == BODY:
+                    self.consume(self.buffer[:i])
+                    self.end_part()
+
+                self.buffer = self.buffer[i + len(self.delimiter):]
+                self.state = DELIMITER
+
+            elif self.state == DELIMITER:
+                if len(self.buffer) < 2:
+                    return
+
+                if self.buffer.startswith(b'--'):
+                    self.buffer = b''
+                    self.state = EPILOGUE
+                    return
+
+                i = self.buffer.find(b'\r\n')
+                if i == -1:
+                    if len(self.buffer) > MAX_HEADERS_SIZE:
+                        raise MultipartError("Invalid boundary")
+
+                    return
+
+                if self.buffer[:i].strip(b' \t'):
+                    raise MultipartError("Invalid boundary")
+
+                self.buffer = self.buffer[i + 2:]
+                self.state = HEADERS
+
+            elif self.state == HEADERS:
+                if self.buffer.startswith(b'\r\n'):
+                    i, headers = 0, b''
+                else:
+                    i = self.buffer.find(b'\r\n\r\n')
+                    if i == -1:
+                        if len(self.buffer) > MAX_HEADERS_SIZE:
+                            raise MultipartError("Headers too long")
+
+                        return
+
+                    headers = self.buffer[:i]
+                    i += 2
+
+                self.begin_part(headers)
+                self.buffer = self.buffer[i + 2:]
+                self.state = BODY
+
+            else:
+                return
+
+    def begin_part(self, headers):
+        params = {}
+        for line in headers.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-disposition':
+                _, params = cgi.parse_header(value.strip())
+
+        if 'name' not in params:
+            raise MultipartError("Missing the name of the part")
+
+        self.name = params['name']
+        self.size = 0
+        self.value = []
+        self.file = None
+
+        if 'filename' in params:
+            if self.name in self.files:
+                self.files.pop(self.name).close()
+
+            self.file = self.files[self.name] = self.open_file()
+
+    def consume(self, data):
+        if not data:
+            return
+
+        self.size += len(data)
+
+        if self.file is not None:
+            if self.max_file_size is not None and self.size > self.max_file_size:
+                self.too_big = True
+                raise MultipartError("File too big")
+
+            self.file.write(data)
+        else:
+            if self.size > self.max_field_size:
+                raise MultipartError("Field too big")
+
+            self.value.append(data)
+
+    def end_part(self):
+        if self.file is None:
+            self.args.setdefault(self.name, []).append(b''.join(self.value))
+
+        self.name = None
+        self.file = None
+        self.value = []
+
+    def finish(self):
+        """
+        Check that the whole body has been received
+        """
+        if self.error is None and self.state != EPILOGUE:
+            self.fail(MultipartError("Truncated body"))
+
+    def fail(self, error):
+        self.error = error
+        self.buffer = b''
+        self.close()
+
+    def pop_file(self, name):
+        """
+        Return the file uploaded with the given name and remove it from the
+        files closed with the stream
+        """
+        return self.files.pop(name, None)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+        self.files.clear()
+
+    # The body is consumed while it is received
+    def read(self, size=-1):
+        return b''
+
+    def readline(self, size=-1):
+        return b''
+
+    def seek(self, offset, whence=0):
+        pass
@@ -0,0 +1,68 @@
+# -*- coding: UTF-8
+# sessionstore
+# ************
+#
+# Backends where the authenticated sessions are written in order to be
+# restored after a restart of the backend.
+import os
+import sqlite3
+
+
+class MemorySessionStore(object):
+    """
+    The sessions are kept only in the memory of the process
+    """
+    def load(self):
+        return []
+
+    def save(self, session):
+        pass
+
+    def remove(self, session_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionStore(object):
+    """
+    The sessions are written to a SQLite table.
+
+    The table contains the identifiers of the sessions and should be kept,
+    like the other secrets of the process, in the ramdisk.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, isolation_level=None)
+        os.chmod(path, 0600)
+
+        self.db.execute("CREATE TABLE IF NOT EXISTS session ("
+                        "id TEXT PRIMARY KEY, "
+                        "user_id TEXT NOT NULL, "
+                        "user_role TEXT NOT NULL, "
+                        "user_status TEXT NOT NULL, "
+                        "expiration REAL NOT NULL)")
+
+    def load(self):
+        """
+        Return the tuples (id, user_id, user_role, user_status, expiration)
+        of the sessions
+        """
+        return list(self.db.execute("SELECT id, user_id, user_role, user_status, expiration FROM session"))
+
+    def save(self, session):
+        self.db.execute("INSERT OR REPLACE INTO session VALUES (?, ?, ?, ?, ?)",
+                        (session.id, session.user_id, session.user_role, session.user_status, session.getTime()))
+
+    def remove(self, session_id):
+        self.db.execute("DELETE FROM session WHERE id = ?", (session_id,))
+
+    def clear(self):
+        self.db.execute("DELETE FROM session")
+
+    def close(self):
+        self.db.close()
@@ -96,3 +96,46 @@ def get_raw_request_format(request, localized_strings):
         ret[ls] = dict
 
     return ret
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("%s is read-only" % type(self).__name__)
+
+
+class ReadOnlyDict(dict):
+    """
+    dict that could not be modified; being immutable it is shared by the copies
+    """
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class ReadOnlyList(list):
+    """
+    list that could not be modified; being immutable it is shared by the copies
+    """
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = \
+        append = extend = insert = pop = remove = reverse = sort = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(obj):
+    """
+    Return a read-only copy of a structure of dicts and lists
+    """
+    if isinstance(obj, dict):
+        return ReadOnlyDict((k, freeze(v)) for k, v in obj.iteritems())
+    elif isinstance(obj, list):
+        return ReadOnlyList(freeze(x) for x in obj)
+
+    return obj
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
-
+import heapq
+import math
 from collections import OrderedDict
 
 from twisted.internet import reactor
@@ -9,15 +10,66 @@ from twisted.internet import reactor
 test_reactor = None
 
 
+class ExpireCall(object):
+    """
+    Deadline of an item of a TempDict; reset() only updates the deadline.
+    """
+    __slots__ = ['key', 'clock', 'deadline', 'cancelled']
+
+    def __init__(self, key, clock, deadline):
+        self.key = key
+        self.clock = clock
+        self.deadline = deadline
+        self.cancelled = False
+
+    def getTime(self):
+        return self.deadline
+
+    def reset(self, seconds):
+        self.deadline = self.clock.seconds() + seconds
+
+    def cancel(self):
+        self.cancelled = True
+
+    def active(self):
+        return not self.cancelled
+
+    def __repr__(self):
+        return "<ExpireCall %s at %s>" % (self.key, self.deadline)
+
+
 class TempDict(OrderedDict):
+    """
+    Dictionary of items expiring after a timeout since their insertion or
+    their latest access.
+
+    The deadlines of the items are kept by key in expire_calls and grouped
+    in slots of `resolution` seconds, indexed by their tick; the ticks of
+    the slots are kept in a heap and a single DelayedCall per dictionary is
+    scheduled for the earliest one. An access only moves the deadline of
+    the item that, when its slot is processed, is moved to the slot of its
+    new deadline, so that the reactor is not involved in the accesses.
+
+    When the size limit is reached the oldest items are removed.
+    """
     reactor = None
     expireCallback = None
 
+    # seconds of a tick, the granularity of the expirations
+    resolution = 1
+
     def __init__(self, timeout=None, size_limit=None):
         self.timeout = timeout
         self.size_limit = size_limit
         OrderedDict.__init__(self)
 
+        self.expire_calls = {}
+        self.slots = {}
+        self.ticks = []
+        self.timer = None
+        self.timer_clock = None
+        self.timer_tick = None
+
         self._check_size_limit()
 
     def get_timeout(self):
@@ -28,33 +80,65 @@ class TempDict(OrderedDict):
         """The override of this method allows dynamic limits imlementations"""
         return self.size_limit
 
-    def set(self, key, item):
+    def get_clock(self):
+        return reactor if test_reactor is None else test_reactor
+
+    def set(self, key, item, timeout=None):
         self._check_size_limit()
-        timeout = self.get_timeout()
-        if test_reactor is None:
-            item.expireCall = reactor.callLater(timeout, self._expire, key)
-        else:
-            item.expireCall = test_reactor.callLater(timeout, self._expire, key)
+
+        if timeout is None:
+            timeout = self.get_timeout()
+
+        # an item replaced is not expired anymore
+        if key in self:
+            del self[key]
+
+        clock = self.get_clock()
+        expire_call = self.expire_calls[key] = ExpireCall(key, clock, clock.seconds() + timeout)
 
         self[key] = item
 
+        self._schedule(expire_call)
+        self._schedule_timer()
+
     def get(self, key):
         if key in self:
-            if self[key].expireCall is not None:
-                self[key].expireCall.reset(self.get_timeout())
+            self.expire_calls[key].reset(self.get_timeout())
 
             return self[key]
 
         return None
 
+    def get_time(self, key):
+        """
+        Return the time at which the item of the key expires
+        """
+        return self.expire_calls[key].getTime()
+
     def delete(self, key):
         if key in self:
-            item = self.pop(key)
-            item.expireCall.cancel() # pylint: disable=no-member
-            self._expire(key)
+            del self[key]
         else:
             raise Exception("Failed to delete %s from %s" % (key, self.__class__))
 
+    def __delitem__(self, key, *args):
+        OrderedDict.__delitem__(self, key, *args)
+
+        expire_call = self.expire_calls.pop(key, None)
+        if expire_call is not None:
+            expire_call.cancel()
+
+    def clear(self):
+        OrderedDict.clear(self)
+
+        self.expire_calls = {}
+        self.slots = {}
+        self.ticks = []
+
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+
+        self.timer = None
 
     def _check_size_limit(self):
         size_limit = self.get_size_limit()
@@ -64,6 +148,50 @@ class TempDict(OrderedDict):
                 k = next(self.iterkeys())
                 self.delete(k)
 
+    def _schedule(self, expire_call):
+        tick = int(math.ceil(expire_call.deadline / self.resolution))
+
+        if tick not in self.slots:
+            self.slots[tick] = []
+            heapq.heappush(self.ticks, tick)
+
+        self.slots[tick].append(expire_call)
+
+    def _schedule_timer(self):
+        if not self.ticks:
+            return
+
+        clock = self.get_clock()
+        tick = self.ticks[0]
+
+        if self.timer is not None and self.timer.active():
+            if self.timer_tick <= tick and self.timer_clock is clock:
+                return
+
+            self.timer.cancel()
+
+        self.timer = clock.callLater(max(0, tick * self.resolution - clock.seconds()), self._tick)
+        self.timer_clock = clock
+        self.timer_tick = tick
+
+    def _tick(self):
+        self.timer = None
+        now = self.get_clock().seconds()
+
+        while self.ticks and self.ticks[0] * self.resolution <= now:
+            for expire_call in self.slots.pop(heapq.heappop(self.ticks)):
+                key = expire_call.key
+                if expire_call.cancelled or self.expire_calls.get(key) is not expire_call:
+                    continue
+
+                if expire_call.deadline > now:
+                    # the item has been accessed after its insertion in the slot
+                    self._schedule(expire_call)
+                else:
+                    self._expire(key)
+
+        self._schedule_timer()
+
     def _expire(self, key):
         if key in self:
             if self.expireCallback is not None:
@@ -88,13 +88,15 @@ class Token(object):
             'human_captcha': False,
             'proof_of_work': False,
             'human_captcha_answer': 0,
-            'proof_of_work_answer': 0
+            'proof_of_work_answer': 0,
+            'proof_of_work_difficulty': 0
         }
 
         if not self.human_captcha['solved']:
             r['human_captcha'] = self.human_captcha['question']
         if not self.proof_of_work['solved']:
             r['proof_of_work'] = self.proof_of_work['question']
+            r['proof_of_work_difficulty'] = self.proof_of_work['difficulty']
 
         return r
 
@@ -110,8 +112,10 @@ class Token(object):
             }
 
         if GLSettings.memory_copy.enable_proof_of_work:
+            # the difficulty grows with the activity stress level
             self.proof_of_work = {
                 'question': generateRandomKey(20),
+                'difficulty': GLSettings.proof_of_work_difficulty + Alarm.stress_levels['activity'],
                 'solved': False
             }
 
@@ -150,7 +154,7 @@ class Token(object):
         :param resolved_proof_of_work: a string, that has to be an integer
         :return:
         """
-        HASH_ENDS_WITH = '00'
+        HASH_ENDS_WITH = '0' * self.proof_of_work['difficulty']
 
         resolved = "%s%d" % (self.proof_of_work['question'], request_answer)
         x = sha256(bytes(resolved))
@@ -423,6 +423,12 @@ var GLClient = angular.module('GLClient', [
         forceChunkSize: true,
         testChunks: false,
         simultaneousUploads: 1,
+        // the chunks rejected by the admission control of an overloaded
+        // node (503) are retried for about a minute; the other errors
+        // returned by the backend are permanent
+        maxChunkRetries: 12,
+        chunkRetryInterval: 5000,
+        permanentErrors: [400, 401, 403, 404, 405, 406, 412, 413, 415, 500, 501],
         generateUniqueIdentifier: function () {
           return Math.random() * 1000000 + 1000000;
         },
@@ -685,6 +691,21 @@ var GLClient = angular.module('GLClient', [
           $rootScope.showLoadingPanel = false;
        }
 
+       /* 54: Service overloaded; the request has been rejected before being
+          processed and is retried after the delay suggested by the node */
+       var retries = response.config.overloadRetries || 0;
+       if (response.status === 503 && response.data !== null &&
+           response.data.error_code === 54 && retries < 5) {
+         var $timeout = $injector.get('$timeout');
+         var delay = parseInt(response.headers('Retry-After'), 10) || 5;
+
+         response.config.overloadRetries = retries + 1;
+
+         return $timeout(function() {
+           return $http(response.config);
+         }, delay * 1000);
+       }
+
        if (response.status === 405) {
          var errorData = angular.toJson({
              errorUrl: $window.location.href,
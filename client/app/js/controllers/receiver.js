@@ -1,6 +1,19 @@
 GLClient.controller('ReceiverTipsCtrl', ['$scope',  '$http', '$route', '$location', '$uibModal', 'RTipExport', 'ReceiverTips',
   function($scope, $http, $route, $location, $uibModal, RTipExport, ReceiverTips) {
-  $scope.tips = ReceiverTips.query();
+  $scope.tips = [];
+
+  // the tips are returned in pages; the cursor of the next page is in the X-Next-Cursor header
+  var loadTips = function(cursor) {
+    ReceiverTips.query(cursor ? {cursor: cursor} : {}, function(tips, headers) {
+      Array.prototype.push.apply($scope.tips, tips);
+
+      if (headers('X-Next-Cursor')) {
+        loadTips(headers('X-Next-Cursor'));
+      }
+    });
+  };
+
+  loadTips();
   $scope.exportTip = RTipExport;
 
   $scope.selected_tips = [];
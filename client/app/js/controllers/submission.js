@@ -313,7 +313,8 @@ GLClient.controller('SubmissionCtrl',
       $scope.problemToBeSolved = $scope.submission._token.human_captcha !== false;
 
       if ($scope.node.enable_proof_of_work) {
-        glbcProofOfWork.proofOfWork($scope.submission._token.proof_of_work).then(function(result) {
+        glbcProofOfWork.proofOfWork($scope.submission._token.proof_of_work,
+                                    $scope.submission._token.proof_of_work_difficulty).then(function(result) {
           $scope.submission._token.proof_of_work_answer = result;
           $scope.submission._token.$update(function(token) {
             $scope.submission._token = token;
@@ -17,7 +17,8 @@ angular.module('GLBrowserCrypto', [])
 }])
 .factory('glbcProofOfWork', ['$q', 'glbcUtil', function($q, glbcUtil) {
   // proofOfWork return the answer to the proof of work
-  // { [challenge string] -> [ answer index] }
+  // { [challenge string, difficulty] -> [ answer index] }
+  // where the difficulty is the number of trailing zero hex digits of the hash
   var getWebCrypto = function() {
     if (typeof window !== 'undefined') {
       if (window.crypto) {
@@ -29,15 +30,26 @@ angular.module('GLBrowserCrypto', [])
     }
   };
 
+  var endsWithZeros = function(hash, difficulty) {
+    for (var j = 0; j < difficulty; j++) {
+      var b = hash[31 - Math.floor(j / 2)];
+      if ((j % 2 === 0 ? b & 0x0f : b >> 4) !== 0) {
+        return false;
+      }
+    }
+
+    return true;
+  };
+
   return {
-    proofOfWork: function(str) {
+    proofOfWork: function(str, difficulty) {
       var deferred = $q.defer();
 
       var i = 0;
 
       var xxx = function (hash) {
         hash = new Uint8Array(hash);
-        if (hash[31] === 0) {
+        if (endsWithZeros(hash, difficulty)) {
           deferred.resolve(i);
         } else {
           i += 1;
@@ -729,6 +729,29 @@ factory('AdminUtils', ['AdminContextResource', 'AdminQuestionnaireResource', 'Ad
 }]).
   factory('Admin', ['GLResource', '$q', 'AdminContextResource', 'AdminQuestionnaireResource', 'AdminStepResource', 'AdminFieldResource', 'AdminFieldTemplateResource', 'AdminUserResource', 'AdminReceiverResource', 'AdminNodeResource', 'AdminNotificationResource', 'AdminShorturlResource', 'FieldAttrs', 'ActivitiesCollection', 'AnomaliesCollection', 'TipOverview', 'FileOverview', 'JobsOverview',
     function(GLResource, $q, AdminContextResource, AdminQuestionnaireResource, AdminStepResource, AdminFieldResource, AdminFieldTemplateResource, AdminUserResource, AdminReceiverResource, AdminNodeResource, AdminNotificationResource, AdminShorturlResource, FieldAttrs, ActivitiesCollection, AnomaliesCollection, TipOverview, FileOverview, JobsOverview) {
+  // the overviews are returned in pages; the cursor of the next page is in the X-Next-Cursor header
+  var queryAllPages = function(resource) {
+    var rows = [];
+    var deferred = $q.defer();
+
+    var loadPage = function(cursor) {
+      resource.query(cursor ? {cursor: cursor} : {}, function(page, headers) {
+        Array.prototype.push.apply(rows, page);
+
+        if (headers('X-Next-Cursor')) {
+          loadPage(headers('X-Next-Cursor'));
+        } else {
+          deferred.resolve(rows);
+        }
+      }, deferred.reject);
+    };
+
+    loadPage();
+
+    rows.$promise = deferred.promise;
+    return rows;
+  };
+
   return function(fn) {
       var self = this;
 
@@ -742,8 +765,8 @@ factory('AdminUtils', ['AdminContextResource', 'AdminQuestionnaireResource', 'Ad
       self.shorturls = AdminShorturlResource.query();
       self.activities = ActivitiesCollection.query();
       self.anomalies = AnomaliesCollection.query();
-      self.tip_overview = TipOverview.query();
-      self.file_overview = FileOverview.query();
+      self.tip_overview = queryAllPages(TipOverview);
+      self.file_overview = queryAllPages(FileOverview);
       self.jobs_overview = JobsOverview.query();
 
       self.field_attrs = FieldAttrs.get().$promise.then(function(field_attrs) {